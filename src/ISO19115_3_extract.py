@@ -1,65 +1,18 @@
 #!/usr/bin/env python3
 
 import os
-import requests
 from lxml import etree
 import lxml
 
 from extractor import Extractor
+from fetch import fetch
 
-from add_model_keyw import add_models_keyword
+from enrich import enrich, keyword_stage, write_xml, get_transform, transform_records
 from local_types import Coords
 
-class ISO19115_3Extractor(Extractor):
-    """
-    Retrieves ISO 19115-3 XML from a geonetwork server or similar
-    Uses an XSLT to insert extra fields
-    Outputs ISO 19115-3 XML to file
-    Returns True upon success
-    """
-
-    def write_record(self, name: str, bbox: Coords, model_endpath: str, metadata_url: str, output_file: str) -> bool:
-        """
-        Writes out ISO 19115-3 XML from an ISO 19115-3 source
-
-        :param name: name of model
-        :param bbox: 2D bounding box. This parameter is not used, we retain the record's coords instead
-        :param model_endpath: model path
-        :param metadara_url: URL of metadata record
-        :param output_file: name of output file e.g. 'blah.xml'
-        :returns: boolean
-        """
-        print(f"Converting: {model_endpath}")
-        # Read XML from URL
-        try:
-            metadata = requests.get(metadata_url)
-        except Exception as e:
-            print(f"Cannot retrieve URL {metadata_url}\n", e)
-            return False
-        if metadata.encoding is not None:
-            encoding = metadata.encoding
-        else:
-            encoding = 'utf-8'
-
-        # XML snippet to be inserted into XML record
-        model_online = f"""<mrd:onLine>
-            <cit:CI_OnlineResource>
-              <cit:linkage>
-                <gco:CharacterString>https://geomodels.auscope.org.au/model/{model_endpath}</gco:CharacterString>
-              </cit:linkage>
-              <cit:protocol>
-                <gco:CharacterString>WWW:LINK-1.0-http--link</gco:CharacterString>
-              </cit:protocol>
-              <cit:name>
-                <gco:CharacterString>3D Geological Model</gco:CharacterString>
-              </cit:name>
-            </cit:CI_OnlineResource>
-          </mrd:onLine>
-        """
-
-        # Stylesheet to do the insertion
-        # Path is '/mdb:MD_Metadata/mdb:distributionInfo/mrd:MD_Distribution/mrd:transferOptions/mrd:MD_DigitalTransferOptions'
-        xslt = f"""<?xml version="1.0" encoding="UTF-8"?>
+# Stylesheet to insert a link to the model, the model's URL is passed in as the 'model_url' parameter
+# Path is '/mdb:MD_Metadata/mdb:distributionInfo/mrd:MD_Distribution/mrd:transferOptions/mrd:MD_DigitalTransferOptions'
+XSLT = b"""<?xml version="1.0" encoding="UTF-8"?>
 <xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform"
                  xmlns:mdb="http://standards.iso.org/iso/19115/-3/mdb/1.0"
                  xmlns:cat="http://standards.iso.org/iso/19115/-3/cat/1.0"
@@ -94,6 +47,26 @@ class ISO19115_3Extractor(Extractor):
 
 <xsl:output method="xml" indent="yes"/>
 
+<!-- URL of model in geomodels website -->
+<xsl:param name="model_url"/>
+
+<!-- XML snippet to be inserted into XML record -->
+<xsl:template name="model-online">
+  <mrd:onLine>
+    <cit:CI_OnlineResource>
+      <cit:linkage>
+        <gco:CharacterString><xsl:value-of select="$model_url"/></gco:CharacterString>
+      </cit:linkage>
+      <cit:protocol>
+        <gco:CharacterString>WWW:LINK-1.0-http--link</gco:CharacterString>
+      </cit:protocol>
+      <cit:name>
+        <gco:CharacterString>3D Geological Model</gco:CharacterString>
+      </cit:name>
+    </cit:CI_OnlineResource>
+  </mrd:onLine>
+</xsl:template>
+
 <!-- Copies everything -->
 <xsl:template match="@*|node()">
    <xsl:copy>
@@ -104,7 +77,7 @@ class ISO19115_3Extractor(Extractor):
 <xsl:template match="/mdb:MD_Metadata/mdb:distributionInfo/mrd:MD_Distribution/mrd:transferOptions/mrd:MD_DigitalTransferOptions">
   <xsl:copy>
      <xsl:apply-templates select="@*|node()"/>
-     {model_online} 
+     <xsl:call-template name="model-online"/>
   </xsl:copy>
 </xsl:template>
 
@@ -112,7 +85,7 @@ class ISO19115_3Extractor(Extractor):
   <xsl:copy>
      <xsl:apply-templates select="@*|node()"/>
      <mrd:MD_DigitalTransferOptions>
-     {model_online} 
+     <xsl:call-template name="model-online"/>
      </mrd:MD_DigitalTransferOptions>
   </xsl:copy>
 </xsl:template>
@@ -122,7 +95,7 @@ class ISO19115_3Extractor(Extractor):
      <xsl:apply-templates select="@*|node()"/>
      <mrd:transferOptions>
         <mrd:MD_DigitalTransferOptions>
-        {model_online} 
+        <xsl:call-template name="model-online"/>
         </mrd:MD_DigitalTransferOptions>
      </mrd:transferOptions>
   </xsl:copy>
@@ -134,7 +107,7 @@ class ISO19115_3Extractor(Extractor):
      <mrd:MD_Distribution>
         <mrd:transferOptions>
            <mrd:MD_DigitalTransferOptions>
-           {model_online} 
+           <xsl:call-template name="model-online"/>
            </mrd:MD_DigitalTransferOptions>
         </mrd:transferOptions>
      </mrd:MD_Distribution>
@@ -148,7 +121,7 @@ class ISO19115_3Extractor(Extractor):
       <mrd:MD_Distribution>
          <mrd:transferOptions>
             <mrd:MD_DigitalTransferOptions>
-            {model_online} 
+            <xsl:call-template name="model-online"/>
             </mrd:MD_DigitalTransferOptions>
          </mrd:transferOptions>
       </mrd:MD_Distribution>
@@ -156,7 +129,117 @@ class ISO19115_3Extractor(Extractor):
 </xsl:copy>
 </xsl:template>
 
-</xsl:stylesheet>""".encode(encoding)
+</xsl:stylesheet>"""
+
+# Header of ISO 19115-3 records that geonetwork will not accept and the header that replaces it
+OLD_HEADER = """<mdb:MD_Metadata xmlns:mdb="http://standards.iso.org/iso/19115/-3/mdb/1.0" xmlns:cat="http://standards.iso.org/iso/19115/-3/cat/1.0" xmlns:gfc="http://standards.iso.org/iso/19110/gfc/1.1" xmlns:cit="http://standards.iso.org/iso/19115/-3/cit/1.0" xmlns:gcx="http://standards.iso.org/iso/19115/-3/gcx/1.0" xmlns:gex="http://standards.iso.org/iso/19115/-3/gex/1.0" xmlns:lan="http://standards.iso.org/iso/19115/-3/lan/1.0" xmlns:srv="http://standards.iso.org/iso/19115/-3/srv/2.0" xmlns:mas="http://standards.iso.org/iso/19115/-3/mas/1.0" xmlns:mcc="http://standards.iso.org/iso/19115/-3/mcc/1.0" xmlns:mco="http://standards.iso.org/iso/19115/-3/mco/1.0" xmlns:mda="http://standards.iso.org/iso/19115/-3/mda/1.0" xmlns:mds="http://standards.iso.org/iso/19115/-3/mds/1.0" xmlns:mdt="http://standards.iso.org/iso/19115/-3/mdt/1.0" xmlns:mex="http://standards.iso.org/iso/19115/-3/mex/1.0" xmlns:mmi="http://standards.iso.org/iso/19115/-3/mmi/1.0" xmlns:mpc="http://standards.iso.org/iso/19115/-3/mpc/1.0" xmlns:mrc="http://standards.iso.org/iso/19115/-3/mrc/1.0" xmlns:mrd="http://standards.iso.org/iso/19115/-3/mrd/1.0" xmlns:mri="http://standards.iso.org/iso/19115/-3/mri/1.0" xmlns:mrl="http://standards.iso.org/iso/19115/-3/mrl/1.0" xmlns:mrs="http://standards.iso.org/iso/19115/-3/mrs/1.0" xmlns:msr="http://standards.iso.org/iso/19115/-3/msr/1.0" xmlns:mdq="http://standards.iso.org/iso/19157/-2/mdq/1.0" xmlns:mac="http://standards.iso.org/iso/19115/-3/mac/1.0" xmlns:gco="http://standards.iso.org/iso/19115/-3/gco/1.0" xmlns:gml="http://www.opengis.net/gml/3.2" xmlns:xlink="http://www.w3.org/1999/xlink" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://standards.iso.org/iso/19115/-3/mds/1.0 http://standards.iso.org/iso/19115/-3/mds/1.0/mds.xsd">"""
+NEW_HEADER = """<mdb:MD_Metadata xmlns:mdb="http://standards.iso.org/iso/19115/-3/mdb/2.0" xmlns:cat="http://standards.iso.org/iso/19115/-3/cat/1.0" xmlns:gfc="http://standards.iso.org/iso/19110/gfc/1.1" xmlns:cit="http://standards.iso.org/iso/19115/-3/cit/2.0" xmlns:gcx="http://standards.iso.org/iso/19115/-3/gcx/1.0" xmlns:gex="http://standards.iso.org/iso/19115/-3/gex/1.0" xmlns:lan="http://standards.iso.org/iso/19115/-3/lan/1.0" xmlns:srv="http://standards.iso.org/iso/19115/-3/srv/2.1" xmlns:mas="http://standards.iso.org/iso/19115/-3/mas/1.0" xmlns:mcc="http://standards.iso.org/iso/19115/-3/mcc/1.0" xmlns:mco="http://standards.iso.org/iso/19115/-3/mco/1.0" xmlns:mda="http://standards.iso.org/iso/19115/-3/mda/1.0" xmlns:mds="http://standards.iso.org/iso/19115/-3/mds/2.0" xmlns:mdt="http://standards.iso.org/iso/19115/-3/mdt/2.0" xmlns:mex="http://standards.iso.org/iso/19115/-3/mex/1.0" xmlns:mmi="http://standards.iso.org/iso/19115/-3/mmi/1.0" xmlns:mpc="http://standards.iso.org/iso/19115/-3/mpc/1.0" xmlns:mrc="http://standards.iso.org/iso/19115/-3/mrc/2.0" xmlns:mrd="http://standards.iso.org/iso/19115/-3/mrd/1.0" xmlns:mri="http://standards.iso.org/iso/19115/-3/mri/1.0" xmlns:mrl="http://standards.iso.org/iso/19115/-3/mrl/2.0" xmlns:mrs="http://standards.iso.org/iso/19115/-3/mrs/1.0" xmlns:msr="http://standards.iso.org/iso/19115/-3/msr/2.0" xmlns:mdq="http://standards.iso.org/iso/19157/-2/mdq/1.0" xmlns:mac="http://standards.iso.org/iso/19115/-3/mac/2.0" xmlns:gco="http://standards.iso.org/iso/19115/-3/gco/1.0" xmlns:gml="http://www.opengis.net/gml/3.2" xmlns:xlink="http://www.w3.org/1999/xlink" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://standards.iso.org/iso/19115/-3/mds/2.0 http://standards.iso.org/iso/19115/-3/mds/2.0/mds.xsd">"""
+
+
+def header_namespaces(header: str) -> (dict, dict):
+    """
+    :param header: start tag of 'mdb:MD_Metadata' element
+    :returns: namespaces declared in header, dict of prefix -> URI, and its attributes
+    """
+    root = etree.fromstring(header + "</mdb:MD_Metadata>")
+    return root.nsmap, dict(root.attrib)
+
+
+OLD_NSMAP, OLD_ATTRIB = header_namespaces(OLD_HEADER)
+NEW_NSMAP, NEW_ATTRIB = header_namespaces(NEW_HEADER)
+
+# Namespaces that are upgraded, old URI -> new URI
+NAMESPACE_UPGRADES = {OLD_NSMAP[prefix]: NEW_NSMAP[prefix] for prefix in OLD_NSMAP if OLD_NSMAP[prefix] != NEW_NSMAP[prefix]}
+
+# While names are being upgraded the old namespaces are also declared on the root, so that lxml does not declare them on its children
+UPGRADE_NSMAP = {**NEW_NSMAP, **{f"old{idx}": uri for idx, uri in enumerate(NAMESPACE_UPGRADES)}}
+
+# Finds the elements and attributes in the old namespaces
+OLD_ELEMENT_TAGS = [f"{{{uri}}}*" for uri in NAMESPACE_UPGRADES]
+OLD_ATTRIBUTES = etree.XPath("//@*[" + " or ".join(f"namespace-uri()='{uri}'" for uri in NAMESPACE_UPGRADES) + "]")
+
+
+def upgrade_name(name: str) -> str:
+    """
+    :param name: element or attribute name in lxml's '{URI}local' form
+    :returns: name in the upgraded namespace, or the same name if its namespace is not upgraded
+    """
+    if not name.startswith('{'):
+        return name
+    uri, local = name[1:].split('}', 1)
+    return f"{{{NAMESPACE_UPGRADES.get(uri, uri)}}}{local}"
+
+
+def upgrade_header(root: etree._Element) -> etree._Element:
+    """
+    Replaces the old header because geonetwork will not accept it, the names of the elements and attributes in the
+    old namespaces are changed to the new namespaces. Records that do not have the old header are returned unchanged.
+
+    NB: lxml cannot change the namespaces declared on an element, so the children are moved to a new root element
+
+    :param root: XML doc root
+    :returns: XML doc root
+    """
+    if root.nsmap != OLD_NSMAP or dict(root.attrib) != OLD_ATTRIB:
+        return root
+    upgrade_root = etree.Element(upgrade_name(root.tag), nsmap=UPGRADE_NSMAP)
+    upgrade_root.extend(root)
+    for elem in upgrade_root.iter(OLD_ELEMENT_TAGS):
+        elem.tag = upgrade_name(elem.tag)
+    # Keep the order of the attributes
+    for elem in {attr.getparent() for attr in OLD_ATTRIBUTES(upgrade_root)}:
+        attrib = list(elem.attrib.items())
+        elem.attrib.clear()
+        for name, value in attrib:
+            elem.set(upgrade_name(name), value)
+    # Move the children again, to a root that only declares the new namespaces
+    new_root = etree.Element(upgrade_name(root.tag), attrib=NEW_ATTRIB, nsmap=NEW_NSMAP)
+    new_root.text = root.text
+    new_root.extend(upgrade_root)
+    return new_root
+
+
+class ISO19115_3Extractor(Extractor):
+    """
+    Retrieves ISO 19115-3 XML from a geonetwork server or similar
+    Uses an XSLT to insert extra fields
+    Outputs ISO 19115-3 XML to file
+    Returns True upon success
+    """
+
+    @staticmethod
+    def source_url(params: dict) -> str:
+        """
+        Returns the URL of the metadata record
+
+        :param params: parameters of 'write_record()'
+        :returns: URL string
+        """
+        return params['metadata_url']
+
+    def write_record(self, name: str, bbox: Coords, model_endpath: str, metadata_url: str, output_file: str) -> bool:
+        """
+        Writes out ISO 19115-3 XML from an ISO 19115-3 source
+
+        :param name: name of model
+        :param bbox: 2D bounding box. This parameter is not used, we retain the record's coords instead
+        :param model_endpath: model path
+        :param metadara_url: URL of metadata record
+        :param output_file: name of output file e.g. 'blah.xml'
+        :returns: boolean
+        """
+        print(f"Converting: {model_endpath}")
+        # Read XML from URL
+        try:
+            metadata = fetch(metadata_url)
+        except Exception as e:
+            print(f"Cannot retrieve URL {metadata_url}\n", e)
+            return False
+        if metadata.encoding is not None:
+            encoding = metadata.encoding
+        else:
+            encoding = 'utf-8'
+
         # Parse XML
         parser = etree.XMLParser(recover=False)
         try:
@@ -164,26 +247,16 @@ class ISO19115_3Extractor(Extractor):
         except lxml.etree.XMLSyntaxError as xse:
             print(f"Error in {metadata.text}: {xse}")
             return False
-        xslt_tree = etree.XML(xslt)
-        # Create XSLT
-        transform = etree.XSLT(xslt_tree)
         # Apply XSLT
-        result = transform(doc)
-        byte_result = etree.tostring(result, pretty_print=True)
-        if byte_result is not None:
-            str_result = byte_result.decode('utf-8')
-            # Replace header because geonetwork will not accept old header
-            str_result = str_result.replace("""<mdb:MD_Metadata xmlns:mdb="http://standards.iso.org/iso/19115/-3/mdb/1.0" xmlns:cat="http://standards.iso.org/iso/19115/-3/cat/1.0" xmlns:gfc="http://standards.iso.org/iso/19110/gfc/1.1" xmlns:cit="http://standards.iso.org/iso/19115/-3/cit/1.0" xmlns:gcx="http://standards.iso.org/iso/19115/-3/gcx/1.0" xmlns:gex="http://standards.iso.org/iso/19115/-3/gex/1.0" xmlns:lan="http://standards.iso.org/iso/19115/-3/lan/1.0" xmlns:srv="http://standards.iso.org/iso/19115/-3/srv/2.0" xmlns:mas="http://standards.iso.org/iso/19115/-3/mas/1.0" xmlns:mcc="http://standards.iso.org/iso/19115/-3/mcc/1.0" xmlns:mco="http://standards.iso.org/iso/19115/-3/mco/1.0" xmlns:mda="http://standards.iso.org/iso/19115/-3/mda/1.0" xmlns:mds="http://standards.iso.org/iso/19115/-3/mds/1.0" xmlns:mdt="http://standards.iso.org/iso/19115/-3/mdt/1.0" xmlns:mex="http://standards.iso.org/iso/19115/-3/mex/1.0" xmlns:mmi="http://standards.iso.org/iso/19115/-3/mmi/1.0" xmlns:mpc="http://standards.iso.org/iso/19115/-3/mpc/1.0" xmlns:mrc="http://standards.iso.org/iso/19115/-3/mrc/1.0" xmlns:mrd="http://standards.iso.org/iso/19115/-3/mrd/1.0" xmlns:mri="http://standards.iso.org/iso/19115/-3/mri/1.0" xmlns:mrl="http://standards.iso.org/iso/19115/-3/mrl/1.0" xmlns:mrs="http://standards.iso.org/iso/19115/-3/mrs/1.0" xmlns:msr="http://standards.iso.org/iso/19115/-3/msr/1.0" xmlns:mdq="http://standards.iso.org/iso/19157/-2/mdq/1.0" xmlns:mac="http://standards.iso.org/iso/19115/-3/mac/1.0" xmlns:gco="http://standards.iso.org/iso/19115/-3/gco/1.0" xmlns:gml="http://www.opengis.net/gml/3.2" xmlns:xlink="http://www.w3.org/1999/xlink" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://standards.iso.org/iso/19115/-3/mds/1.0 http://standards.iso.org/iso/19115/-3/mds/1.0/mds.xsd">""",
-                   """<mdb:MD_Metadata xmlns:mdb="http://standards.iso.org/iso/19115/-3/mdb/2.0" xmlns:cat="http://standards.iso.org/iso/19115/-3/cat/1.0" xmlns:gfc="http://standards.iso.org/iso/19110/gfc/1.1" xmlns:cit="http://standards.iso.org/iso/19115/-3/cit/2.0" xmlns:gcx="http://standards.iso.org/iso/19115/-3/gcx/1.0" xmlns:gex="http://standards.iso.org/iso/19115/-3/gex/1.0" xmlns:lan="http://standards.iso.org/iso/19115/-3/lan/1.0" xmlns:srv="http://standards.iso.org/iso/19115/-3/srv/2.1" xmlns:mas="http://standards.iso.org/iso/19115/-3/mas/1.0" xmlns:mcc="http://standards.iso.org/iso/19115/-3/mcc/1.0" xmlns:mco="http://standards.iso.org/iso/19115/-3/mco/1.0" xmlns:mda="http://standards.iso.org/iso/19115/-3/mda/1.0" xmlns:mds="http://standards.iso.org/iso/19115/-3/mds/2.0" xmlns:mdt="http://standards.iso.org/iso/19115/-3/mdt/2.0" xmlns:mex="http://standards.iso.org/iso/19115/-3/mex/1.0" xmlns:mmi="http://standards.iso.org/iso/19115/-3/mmi/1.0" xmlns:mpc="http://standards.iso.org/iso/19115/-3/mpc/1.0" xmlns:mrc="http://standards.iso.org/iso/19115/-3/mrc/2.0" xmlns:mrd="http://standards.iso.org/iso/19115/-3/mrd/1.0" xmlns:mri="http://standards.iso.org/iso/19115/-3/mri/1.0" xmlns:mrl="http://standards.iso.org/iso/19115/-3/mrl/2.0" xmlns:mrs="http://standards.iso.org/iso/19115/-3/mrs/1.0" xmlns:msr="http://standards.iso.org/iso/19115/-3/msr/2.0" xmlns:mdq="http://standards.iso.org/iso/19157/-2/mdq/1.0" xmlns:mac="http://standards.iso.org/iso/19115/-3/mac/2.0" xmlns:gco="http://standards.iso.org/iso/19115/-3/gco/1.0" xmlns:gml="http://www.opengis.net/gml/3.2" xmlns:xlink="http://www.w3.org/1999/xlink" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://standards.iso.org/iso/19115/-3/mds/2.0 http://standards.iso.org/iso/19115/-3/mds/2.0/mds.xsd">""")
-
-            # Add '3D Geomodels' keyword
-            xml_string = add_models_keyword(str_result, 'utf-8', 'ISO19115-3')
-
-            # Write to disk
-            with open(os.path.join(self.output_dir, output_file), 'w') as ff:
-                ff.write(xml_string)
-
-            return True
-        return False
+        result = transform_records(get_transform(XSLT), [doc], [model_endpath])[0]
+        # Replace header because geonetwork will not accept old header, then add '3D Geomodels' keyword
+        root = result.getroot()
+        if root is None:
+            return False
+        root = enrich(root, [upgrade_header, keyword_stage('ISO19115-3')])
+
+        # Write to disk
+        write_xml(root, os.path.join(self.output_dir, output_file))
+        return True
 
 
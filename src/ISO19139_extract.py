@@ -1,64 +1,40 @@
 #!/usr/bin/env python3
 
 import os
-import requests
 from lxml import etree
 
 from extractor import Extractor
-from add_model_keyw import add_models_keyword
+from fetch import fetch
+from enrich import enrich, keyword_stage, write_xml, get_transform, transform_records
 from local_types import Coords
 
-class ISO19139Extractor(Extractor):
-    """ Uses an XSLT to insert elements into ISO 19139 XML
-        Outputs ISO 19139 XML to file
-        Returns True upon success
-    """
-
-    def write_record(self, name: str, bbox: Coords, model_endpath: str, metadata_url: str, output_file: str) -> bool:
-        """
-        Reads ISO 19139 from a source adds extra fields and outputs XML to file
-
-        :param name: name of model
-        :param bbox: 2D bounding box. This parameter is not used, we retain the record's coords instead
-        :param model_endpath: model path
-        :param metadara_url: URL of metadata record
-        :param output_file: name of output file e.g. 'blah.xml'
-        :returns: boolean
-        """
-        print(f"Converting: {model_endpath}")
-        # Read XML from URL
-        try:
-            metadata = requests.get(metadata_url)
-        except Exception as e:
-            print(f"Cannot retrieve URL {metadata_url}\n", e)
-            return False
-
-        # XML Namespaces
-        ns = {'gmd': 'http://www.isotc211.org/2005/gmd', 'gco': 'http://www.isotc211.org/2005/gco'}
-
-        # XML snippet to be inserted into XML record
-        model_online = f"""<gmd:onLine>
-                  <gmd:CI_OnlineResource>
-                     <gmd:linkage>
-                        <gmd:URL>https://geomodels.auscope.org.au/model/{model_endpath}</gmd:URL>
-                     </gmd:linkage>
-                     <gmd:protocol>
-                        <gco:CharacterString>WWW:LINK-1.0-http--link</gco:CharacterString>
-                     </gmd:protocol>
-                     <gmd:name>
-                        <gco:CharacterString>3D Geological Model</gco:CharacterString>
-                     </gmd:name>
-                  </gmd:CI_OnlineResource>
-               </gmd:onLine>
-        """
-
-        # Stylesheet to do the insertion
-        # Path is '/gmd:MD_Metadata/gmd:distributionInfo/gmd:MD_Distribution/gmd:transferOptions/gmd:MD_DigitalTransferOptions'
-        xslt = f"""<?xml version="1.0" encoding="UTF-8"?>
+# Stylesheet to insert a link to the model, the model's URL is passed in as the 'model_url' parameter
+# Path is '/gmd:MD_Metadata/gmd:distributionInfo/gmd:MD_Distribution/gmd:transferOptions/gmd:MD_DigitalTransferOptions'
+XSLT = b"""<?xml version="1.0" encoding="UTF-8"?>
 <xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform" xmlns:gmd="http://www.isotc211.org/2005/gmd" xmlns:gco="http://www.isotc211.org/2005/gco">
 
 <xsl:output method="xml" indent="yes"/>
 
+<!-- URL of model in geomodels website -->
+<xsl:param name="model_url"/>
+
+<!-- XML snippet to be inserted into XML record -->
+<xsl:template name="model-online">
+  <gmd:onLine>
+    <gmd:CI_OnlineResource>
+      <gmd:linkage>
+        <gmd:URL><xsl:value-of select="$model_url"/></gmd:URL>
+      </gmd:linkage>
+      <gmd:protocol>
+        <gco:CharacterString>WWW:LINK-1.0-http--link</gco:CharacterString>
+      </gmd:protocol>
+      <gmd:name>
+        <gco:CharacterString>3D Geological Model</gco:CharacterString>
+      </gmd:name>
+    </gmd:CI_OnlineResource>
+  </gmd:onLine>
+</xsl:template>
+
 <!-- Copies everything -->
 <xsl:template match="@*|node()">
    <xsl:copy>
@@ -69,7 +45,7 @@ class ISO19139Extractor(Extractor):
 <xsl:template match="/gmd:MD_Metadata/gmd:distributionInfo/gmd:MD_Distribution/gmd:transferOptions/gmd:MD_DigitalTransferOptions">
   <xsl:copy>
      <xsl:apply-templates select="@*|node()"/>
-     {model_online} 
+     <xsl:call-template name="model-online"/>
   </xsl:copy>
 </xsl:template>
 
@@ -77,7 +53,7 @@ class ISO19139Extractor(Extractor):
   <xsl:copy>
      <xsl:apply-templates select="@*|node()"/>
      <gmd:MD_DigitalTransferOptions>
-     {model_online} 
+     <xsl:call-template name="model-online"/>
      </gmd:MD_DigitalTransferOptions>
   </xsl:copy>
 </xsl:template>
@@ -87,7 +63,7 @@ class ISO19139Extractor(Extractor):
      <xsl:apply-templates select="@*|node()"/>
      <gmd:transferOptions>
         <gmd:MD_DigitalTransferOptions>
-        {model_online} 
+        <xsl:call-template name="model-online"/>
         </gmd:MD_DigitalTransferOptions>
      </gmd:transferOptions>
   </xsl:copy>
@@ -99,7 +75,7 @@ class ISO19139Extractor(Extractor):
      <gmd:MD_Distribution>
         <gmd:transferOptions>
            <gmd:MD_DigitalTransferOptions>
-           {model_online} 
+           <xsl:call-template name="model-online"/>
            </gmd:MD_DigitalTransferOptions>
         </gmd:transferOptions>
      </gmd:MD_Distribution>
@@ -113,7 +89,7 @@ class ISO19139Extractor(Extractor):
       <gmd:MD_Distribution>
          <gmd:transferOptions>
             <gmd:MD_DigitalTransferOptions>
-            {model_online} 
+            <xsl:call-template name="model-online"/>
             </gmd:MD_DigitalTransferOptions>
          </gmd:transferOptions>
       </gmd:MD_Distribution>
@@ -121,26 +97,56 @@ class ISO19139Extractor(Extractor):
 </xsl:copy>
 </xsl:template>
 
-</xsl:stylesheet>""".encode('utf-8')
+</xsl:stylesheet>"""
+
+class ISO19139Extractor(Extractor):
+    """ Uses an XSLT to insert elements into ISO 19139 XML
+        Outputs ISO 19139 XML to file
+        Returns True upon success
+    """
+
+    @staticmethod
+    def source_url(params: dict) -> str:
+        """
+        Returns the URL of the metadata record
+
+        :param params: parameters of 'write_record()'
+        :returns: URL string
+        """
+        return params['metadata_url']
+
+    def write_record(self, name: str, bbox: Coords, model_endpath: str, metadata_url: str, output_file: str) -> bool:
+        """
+        Reads ISO 19139 from a source adds extra fields and outputs XML to file
+
+        :param name: name of model
+        :param bbox: 2D bounding box. This parameter is not used, we retain the record's coords instead
+        :param model_endpath: model path
+        :param metadara_url: URL of metadata record
+        :param output_file: name of output file e.g. 'blah.xml'
+        :returns: boolean
+        """
+        print(f"Converting: {model_endpath}")
+        # Read XML from URL
+        try:
+            metadata = fetch(metadata_url)
+        except Exception as e:
+            print(f"Cannot retrieve URL {metadata_url}\n", e)
+            return False
+
         # Recovers from minor syntax errors
         parser = etree.XMLParser(recover=True)
         encoding = 'utf-8'
         if metadata.encoding is not None:
             encoding = metadata.encoding
         doc = etree.fromstring(bytes(metadata.text, encoding), parser=parser)
-        xslt_tree = etree.XML(xslt)
-        transform = etree.XSLT(xslt_tree)
-        result = transform(doc)
-        byte_result = etree.tostring(result, pretty_print=True)
-        if byte_result is not None:
-            str_result = byte_result.decode('utf-8')
-
-            # Add '3D Geological Models' keyword and write to disk
-            xml_string = add_models_keyword(str_result, 'utf-8', 'ISO19139')
-
-            # Write to disk
-            with open(os.path.join(self.output_dir, output_file), 'w') as ff:
-                ff.write(xml_string)
-            return True
-        return False
+        result = transform_records(get_transform(XSLT), [doc], [model_endpath])[0]
+        root = result.getroot()
+        if root is None:
+            return False
+
+        # Add '3D Geological Models' keyword and write to disk
+        root = enrich(root, [keyword_stage('ISO19139')])
+        write_xml(root, os.path.join(self.output_dir, output_file))
+        return True
 
@@ -17,19 +17,32 @@ def add_coords(coords: Coords, text: str, encoding: str, iso_ver: str) -> str:
     :param iso_ver: ISO XML version i.e. 'ISO19115-3' or 'ISO19139'
     :returns: boolean and saves to disk for iso_ver 'ISO19115-3' or XML string for 'ISO19139'
     """
+    root = etree.fromstring(bytes(text, encoding))
+    root = insert_coords(coords, root, iso_ver)
+    return etree.tostring(root, pretty_print=True).decode("utf-8")
+
+
+def insert_coords(coords: Coords, root: etree._Element, iso_ver: str) -> etree._Element:
+    """
+    Add coordinates to a parsed XML record
+
+    :param coords: coordinates
+    :param root: XML doc root
+    :param iso_ver: ISO XML version i.e. 'ISO19115-3' or 'ISO19139'
+    :returns: XML doc root
+    """
     if iso_ver.upper() == 'ISO19115-3':
-        return __add_coords_iso19115_3(coords, text, encoding)
-    return __add_coords_iso19139(coords, text, encoding)
+        return __insert_coords_iso19115_3(coords, root)
+    return __insert_coords_iso19139(coords, root)
 
 
-def __add_coords_iso19139(coords: Coords, text: str, encoding: str) -> str:
+def __insert_coords_iso19139(coords: Coords, root: etree._Element) -> etree._Element:
     """
     Uses XPATH insert technique to add in BBOX coords to an ISO19139 XML record
 
     :param coords: coordinates
-    :param text: XML text
-    :param encoding: XML text encoding e.g. 'utf-8'
-    :returns: boolean and saves to disk for iso_ver 'ISO19115-3' or XML string for 'ISO19139'
+    :param root: XML doc root
+    :returns: XML doc root
     """
     # ISO19139 XML Namespace dict
     ns = { 'gmd':"http://www.isotc211.org/2005/gmd",
@@ -40,9 +53,6 @@ def __add_coords_iso19139(coords: Coords, text: str, encoding: str) -> str:
            'xlink':"http://www.w3.org/1999/xlink" }
 
 
-    # Parse XML metadata record
-    root = etree.fromstring(bytes(text, encoding))
-
     # Point in XML where insertion takes place
     insertpoint_xpath_list = ['gmd:MD_Metadata', 'gmd:identificationInfo', 'gmd:MD_DataIdentification', 'gmd:BLAH'] 
 
@@ -70,20 +80,17 @@ def __add_coords_iso19139(coords: Coords, text: str, encoding: str) -> str:
          </gmd:extent>
     """
     # Insert 
-    root = insert(root, insert_txt, insertpoint_xpath_list, ns)
-    xml_string = etree.tostring(root, pretty_print=True).decode("utf-8")
-    return xml_string
+    return insert(root, insert_txt, insertpoint_xpath_list, ns)
 
 
 
-def __add_coords_iso19115_3(coords: Coords, text: str, encoding: str) -> str:
+def __insert_coords_iso19115_3(coords: Coords, root: etree._Element) -> etree._Element:
     """
     Uses XPATH insert technique to add in BBOX coords to an ISO19115-3 XML record
 
     :param coords: coordinates
-    :param text: XML text
-    :param encoding: XML text encoding e.g. 'utf-8'
-    :returns: boolean and saves to disk for iso_ver 'ISO19115-3' or XML string for 'ISO19139'
+    :param root: XML doc root
+    :returns: XML doc root
     """
     # ISO19115-3 XML Namespace dict
     ns = {'mdb': "http://standards.iso.org/iso/19115/-3/mdb/1.0",
@@ -117,9 +124,6 @@ def __add_coords_iso19115_3(coords: Coords, text: str, encoding: str) -> str:
             'xsi': "http://www.w3.org/2001/XMLSchema-instance" }
 
 
-    # Parse XML metadata record
-    root = etree.fromstring(bytes(text, encoding))
-
     # Point in XML where insertion takes place
     insertpoint_xpath_list = ['mdb:MD_Metadata', 'mdb:identificationInfo', 'mri:MD_DataIdentification', 'mri:BLAH'] 
 
@@ -146,6 +150,4 @@ def __add_coords_iso19115_3(coords: Coords, text: str, encoding: str) -> str:
                      </mri:extent>
     """
     # Insert 
-    root = insert(root, insert_txt, insertpoint_xpath_list, ns)
-    xml_string = etree.tostring(root, pretty_print=True).decode("utf-8")
-    return xml_string
+    return insert(root, insert_txt, insertpoint_xpath_list, ns)
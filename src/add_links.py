@@ -11,11 +11,22 @@ def add_model_link(model_endpath: str, text: str) -> str:
     :param text: XML text
     :returns: XML string
     """
-    # XML Namespace dict
-    ns = {'gmd': 'http://www.isotc211.org/2005/gmd', 'gco': 'http://www.isotc211.org/2005/gco'}
-
     # Parse XML metadata record
     root = etree.fromstring(bytes(text, 'utf-8'))
+    root = insert_model_link(model_endpath, root)
+    return etree.tostring(root, pretty_print=True).decode("utf-8")
+
+
+def insert_model_link(model_endpath: str, root: etree._Element) -> etree._Element:
+    """
+    Uses XPATH insert technique to add in models URL to a parsed ISO 19139 record
+
+    :param model_endpath: model path in geomodels website
+    :param root: XML doc root
+    :returns: XML doc root
+    """
+    # XML Namespace dict
+    ns = {'gmd': 'http://www.isotc211.org/2005/gmd', 'gco': 'http://www.isotc211.org/2005/gco'}
     insert_point_xpath_list = [ 'gmd:MD_Metadata', 'gmd:distributionInfo', 'gmd:MD_Distribution', 'gmd:transferOptions',
             'gmd:MD_DigitalTransferOptions', 'gmd:BLAH']
 
@@ -36,6 +47,4 @@ def add_model_link(model_endpath: str, text: str) -> str:
     """
 
     # Insert 
-    root = insert(root, insert_txt, insert_point_xpath_list, ns)
-    xml_string = etree.tostring(root, pretty_print=True).decode("utf-8")
-    return xml_string
+    return insert(root, insert_txt, insert_point_xpath_list, ns)
@@ -60,19 +60,31 @@ def add_models_keyword(text, encoding, iso_ver):
     :param iso_ver: ISO XML version string, either 'ISO19139' or 'ISO19115-3'
     :returns: XML string
     """
+    root = etree.fromstring(bytes(text, encoding))
+    root = insert_models_keyword(root, iso_ver)
+    return etree.tostring(root, pretty_print=True).decode("utf-8")
+
+
+def insert_models_keyword(root, iso_ver):
+    """
+    Uses XPATH insert technique to add in "3D Geological Models" keyword to a parsed XML record
+
+    :param root: XML doc root
+    :param iso_ver: ISO XML version string, either 'ISO19139' or 'ISO19115-3'
+    :returns: XML doc root
+    """
     if iso_ver == 'ISO19115-3':
-        return __add_models_keyword_iso19115_3(text, encoding)
-    return __add_models_keyword_iso19139(text, encoding)
+        return __insert_models_keyword_iso19115_3(root)
+    return __insert_models_keyword_iso19139(root)
 
 
 
-def __add_models_keyword_iso19139(text, encoding):
+def __insert_models_keyword_iso19139(root):
     """
     Uses XPATH insert technique to add in "3D Geological Models" keyword to an ISO19139 XML record
 
-    :param text: XML text to be inserted
-    :param encoding: character encoding of text, e.g. 'utf-8'
-    :returns: XML string
+    :param root: XML doc root
+    :returns: XML doc root
     """
     # ISO19139 XML Namespace dict
     ns = { 'gmd':"http://www.isotc211.org/2005/gmd",
@@ -83,9 +95,6 @@ def __add_models_keyword_iso19139(text, encoding):
            'xlink':"http://www.w3.org/1999/xlink" }
 
 
-    # Parse XML metadata record
-    root = etree.fromstring(bytes(text, encoding))
-
     # Point in XML where insertion takes place
     insertpoint_xpath_list = ['gmd:MD_Metadata', 'gmd:identificationInfo', 'gmd:MD_DataIdentification', 'gmd:BLAH'] 
 
@@ -104,19 +113,16 @@ def __add_models_keyword_iso19139(text, encoding):
          </gmd:descriptiveKeywords>
     """
     # Insert 
-    root = insert(root, insert_txt, insertpoint_xpath_list, ns)
-    xml_string = etree.tostring(root, pretty_print=True).decode("utf-8")
-    return xml_string
+    return insert(root, insert_txt, insertpoint_xpath_list, ns)
 
 
 
-def __add_models_keyword_iso19115_3(text, encoding):
+def __insert_models_keyword_iso19115_3(root):
     """
     Uses XPATH insert technique to add in "3D Geological Models" keyword to an ISO19115-3 XML record
 
-    :param text: XML text to be inserted
-    :param encoding: character encoding of text, e.g. 'utf-8'
-    :returns: XML string
+    :param root: XML doc root
+    :returns: XML doc root
     """
     # ISO19115-3 XML Namespace dict
     ns = {'mdb': "http://standards.iso.org/iso/19115/-3/mdb/1.0",
@@ -150,9 +156,6 @@ def __add_models_keyword_iso19115_3(text, encoding):
             'xsi': "http://www.w3.org/2001/XMLSchema-instance" }
 
 
-    # Parse XML metadata record
-    root = etree.fromstring(bytes(text, encoding))
-
     # Point in XML where insertion takes place
     insertpoint_xpath_list = ['mdb:MD_Metadata', 'mdb:identificationInfo', 'mri:MD_DataIdentification', 'mri:BLAH'] 
 
@@ -169,6 +172,4 @@ def __add_models_keyword_iso19115_3(text, encoding):
 </mri:descriptiveKeywords>
     """
     # Insert 
-    root = insert(root, insert_txt, insertpoint_xpath_list, ns)
-    xml_string = etree.tostring(root, pretty_print=True).decode("utf-8")
-    return xml_string
+    return insert(root, insert_txt, insertpoint_xpath_list, ns)
@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 import json
-import sys
+import threading
 
 import boto3
 import botocore
+import botocore.config
+
+from config import BEDROCK_ENDPOINT_URL, BEDROCK_MAX_CONCURRENCY, BEDROCK_BATCH_SIZE, BEDROCK_ATTEMPTS
 
 """
 Use Claude V2.0 model to summarize text via AWS Bedrock and 'boto3' package
@@ -32,6 +35,35 @@ Assistant:
     },
 }
 
+# Prefix of summaries generated by claude
+CLAUDE_ATTRIBUTION = "Generated by Anthropic Claude V2.0: "
+
+# Summariser backend settings, see 'summary.py'
+MAX_CONCURRENCY = BEDROCK_MAX_CONCURRENCY
+BATCH_SIZE = BEDROCK_BATCH_SIZE
+ATTRIBUTION = CLAUDE_ATTRIBUTION
+
+# Bedrock runtime client shared by all summaries, see 'get_client()'
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> botocore.client.BaseClient:
+    """
+    Returns the Bedrock runtime client, creating it if necessary. boto3 clients are thread safe, so one client
+    and its connection pool is shared by all threads.
+    Throttled requests are retried by botocore, which also slows down the rate of requests when throttled.
+
+    :returns: AWS boto3 client object, connected to 'bedrock-runtime'
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            config = botocore.config.Config(retries={'max_attempts': BEDROCK_ATTEMPTS, 'mode': 'adaptive'},
+                                            max_pool_connections=BEDROCK_MAX_CONCURRENCY)
+            _client = boto3.client(service_name='bedrock-runtime', endpoint_url=BEDROCK_ENDPOINT_URL, config=config)
+        return _client
+
 
 def run_claude(text: str) -> str:
     """ Run claude summarizer
@@ -39,22 +71,56 @@ def run_claude(text: str) -> str:
     :param text: text string to be summarized
     :returns: summary text
     """
+    return CLAUDE_ATTRIBUTION + claude_summary(text)
+
+
+def claude_summary(text: str) -> str:
+    """ Run claude summarizer, without attribution
+
+    :param text: text string to be summarized
+    :returns: summary text
+    :raises: RuntimeError if the summary could not be made
+    """
     try:
-        brt = boto3.client(service_name='bedrock-runtime')
+        brt = get_client()
         body, modelId = run_model('claude', brt, text)
         accept = 'application/json'
         contentType = 'application/json'
         response = brt.invoke_model(body=body, modelId=modelId, accept=accept, contentType=contentType)
-    except botocore.exceptions.BotoCoreError as bce:
-        print("AWS boto3 error:", bce)
-        sys.exit(1)
+    except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError) as bce:
+        raise RuntimeError(f"Bedrock error: {bce}") from bce
     try:
         response_body = json.loads(response.get('body').read())
     except json.JSONDecodeError as jde:
-        print("Could not decode response from AWS:", jde)
-        sys.exit(1)
-    summary = response_body.get('completion', '')
-    return "Generated by Anthropic Claude V2.0: " + summary
+        raise RuntimeError(f"Could not decode response from Bedrock: {jde}") from jde
+    return response_body.get('completion', '')
+
+
+def claude_stream(text: str, usage: dict):
+    """ Streams a claude summary, a chunk at a time, without attribution
+
+    :param text: text string to be summarized
+    :param usage: dict, 'output_tokens' is set to the number of generated tokens upon completion
+    :returns: iterator of summary text chunks
+    :raises: RuntimeError if the summary could not be made
+    """
+    try:
+        brt = get_client()
+        body, modelId = run_model('claude', brt, text)
+        accept = 'application/json'
+        contentType = 'application/json'
+        response = brt.invoke_model_with_response_stream(body=body, modelId=modelId, accept=accept, contentType=contentType)
+        for event in response.get('body'):
+            chunk = json.loads(event['chunk']['bytes'])
+            yield chunk.get('completion', '')
+            # Last chunk has the metrics
+            metrics = chunk.get('amazon-bedrock-invocationMetrics')
+            if metrics is not None:
+                usage['output_tokens'] = metrics.get('outputTokenCount')
+    except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError) as bce:
+        raise RuntimeError(f"Bedrock error: {bce}") from bce
+    except json.JSONDecodeError as jde:
+        raise RuntimeError(f"Could not decode response from Bedrock: {jde}") from jde
 
 
 def run_model(model_name: str, brt: botocore.client.BaseClient, text: str) -> (str, str):
@@ -70,3 +136,17 @@ def run_model(model_name: str, brt: botocore.client.BaseClient, text: str) -> (s
         **config["params"]
     })
     return body, config['modelId']
+
+
+def cache_settings() -> dict:
+    """ Settings that change the summaries
+
+    :returns: dict of settings
+    """
+    model = MODELS['claude']
+    return {'model': model['modelId'], 'prompt': model['prompt'], 'params': model['params']}
+
+
+# Summariser backend functions, see 'summary.py'
+summarise = claude_summary
+stream = claude_stream
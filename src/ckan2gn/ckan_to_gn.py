@@ -1,17 +1,41 @@
 import requests
 import os
 import sys
+import time
+import sqlite3
+import hashlib
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 
 """
 A simple script to:
     1. Retrieve all public records from a CKAN service
     2. Insert CKAN records into a Geonetwork service
 
+Records are fetched from CKAN by a pool of workers while another pool of workers inserts the fetched records into
+Geonetwork. Each service has one HTTP session that keeps its connections alive. A report of the number of records
+synced, the throughput and any failures is printed at the end.
+
+The sync is differential: a local SQLite database holds the 'metadata_modified' time of each CKAN record and a hash
+of its XML when it was last sent to Geonetwork. Records are only fetched if CKAN has modified them, and only sent if
+their XML has changed. Records that have been deleted from CKAN are reported, and deleted from Geonetwork if
+'CKAN2GN_DELETE' is set.
+
 This requires the 'iso19115' extension to be installed in CKAN and the following env. vars:
     1. 'CKAN2GN_GN_USERNAME' geonetwork username for an account that can create records
     2. 'CKAN2GN_GN_PASSWORD' geonetwork password for an account that can create records
     3. 'CKAN2GN_GN_URL' geonetork service URL
     4. 'CKAN2GN_CKAN_URL' CKAN service URL
+
+Optional env. vars:
+    1. 'CKAN2GN_MODIFIED_SINCE' only CKAN records modified on or after this date are inserted e.g. '2024-01-31'
+    2. 'CKAN2GN_CKAN_ROWS' number of CKAN records in each page of search results, default is 100
+    3. 'CKAN2GN_CKAN_WORKERS' number of records fetched from CKAN at the same time, default is 4
+    4. 'CKAN2GN_GN_WORKERS' number of records inserted into Geonetwork at the same time, default is 2
+    5. 'CKAN2GN_STATE_DB' path of the SQLite sync state database, default is 'ckan2gn_state.db'
+    6. 'CKAN2GN_DELETE' if 'true', records deleted from CKAN are deleted from Geonetwork
 """
 
 # Geonetwork username and password:
@@ -22,104 +46,484 @@ GN_PASSWORD = os.environ.get('CKAN2GN_GN_PASSWORD')
 GN_URL = os.environ.get('CKAN2GN_GN_URL')
 CKAN_URL = os.environ.get('CKAN2GN_CKAN_URL')
 
-def get_gn_xsrf_token(session: requests.sessions.Session) -> str:
-    """ Retrieves XSRF token from Geonetwork
+# Only insert CKAN records modified on or after this date
+MODIFIED_SINCE = os.environ.get('CKAN2GN_MODIFIED_SINCE')
 
-    :param session: requests Session object
-    :returns: XSRF as string or None upon error
-    """
-    authenticate_url = GN_URL + '/geonetwork/srv/eng/info?type=me'
-    response = session.post(authenticate_url)
+# Number of CKAN records in each page of search results, CKAN servers usually limit this to 1000
+CKAN_ROWS = int(os.environ.get('CKAN2GN_CKAN_ROWS', '100'))
+
+# Maximum number of pages of CKAN search results fetched at the same time
+CKAN_MAX_CONCURRENCY = 4
+
+# Number of records fetched from CKAN at the same time
+CKAN_WORKERS = int(os.environ.get('CKAN2GN_CKAN_WORKERS', '4'))
+
+# Number of records inserted into Geonetwork at the same time
+GN_WORKERS = int(os.environ.get('CKAN2GN_GN_WORKERS', '2'))
+
+# SQLite database that holds the state of the last sync
+STATE_DB = os.environ.get('CKAN2GN_STATE_DB', 'ckan2gn_state.db')
+
+# Delete records from Geonetwork when they are deleted from CKAN
+DELETE = os.environ.get('CKAN2GN_DELETE', '').lower() == 'true'
+
+# Connect and read timeouts in seconds
+TIMEOUT = (10, 120)
 
-    # Extract XRSF token
-    xsrf_token = response.cookies.get("XSRF-TOKEN")
-    if xsrf_token:
-        return xsrf_token
-    return None
+# Order of CKAN search results, a fixed order keeps the pages consistent while they are fetched concurrently
+CKAN_SORT = 'metadata_modified asc, id asc'
 
-def list_ckan_records():
-    """ Contacts CKAN and retrieves a list of package ids for all public records
+# Fields of CKAN search results, the XML of the record is fetched separately
+CKAN_FIELDS = ['id', 'name', 'metadata_modified']
 
-    :returns: list of package id strings or None upon error
+def make_session(pool_size: int) -> requests.sessions.Session:
+    """ Makes an HTTP session that keeps up to 'pool_size' connections alive for reuse
+
+    :param pool_size: maximum number of connections to each host, should be at least the number of threads using it
+    :returns: requests Session object
     """
-    print("LISTING CKAN RECORDS")
     session = requests.Session()
-    url_path =  'api/3/action/package_list'
-    url = f'{CKAN_URL}/{url_path}'
-    r = session.get(url)
-    resp = r.json()
-    if resp['success'] is False:
-        print(f"Package list error: {resp.get('error','')}")
-        return None
-    return resp['result']
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
-def get_ckan_record(package_id: str) -> str|None:
-    """ Given a package id retrieves its record metadata
+def ckan_search_filter(modified_since: str = None) -> str:
+    """ Makes a Solr filter query for CKAN's 'package_search'
+    NB: This script only needs 'requests' so that it can run as a standalone docker image, so this is a copy of
+    'search_filter()' in 'src/ckan_extract.py' rather than an import of it. 'tests/test_ckan2gn.py' checks that they agree.
 
-    :param package_id: CKAN package_id string
-    :returns: package metadata as a dict or None upon error
+    :param modified_since: optional date, only records modified on or after this date are found e.g. '2024-01-31'
+    :returns: filter query string
     """
-    print(f"FETCHING CKAN RECORD {package_id}")
-    session = requests.Session()
-    # Set up CKAN URL
-    url_path =  'api/3/action/iso19115_package_show'
-    url = f'{CKAN_URL}/{url_path}'
-    r = session.get(url, params={'format':'xml', 'id':package_id})
-    resp = r.json()
-    if resp['success'] is False:
-        print(f"Package show error: {resp.get('error','')}")
+    # CKAN only searches records of type 'dataset' unless the filter mentions a type
+    fq = '+dataset_type:*'
+    if modified_since:
+        if 'T' not in modified_since:
+            modified_since += 'T00:00:00'
+        if not modified_since.endswith('Z'):
+            modified_since += 'Z'
+        fq += f' +metadata_modified:[{modified_since} TO *]'
+    return fq
+
+
+class CkanClient:
+    """ Fetches records from a CKAN service, all requests share one HTTP session
+    """
+
+    def __init__(self, ckan_url: str, workers: int = CKAN_WORKERS):
+        """
+        :param ckan_url: CKAN service URL
+        :param workers: number of threads that use the client at the same time
+        """
+        self.ckan_url = ckan_url
+        self.session = make_session(max(workers, CKAN_MAX_CONCURRENCY))
+
+    def search_page(self, fq: str, start: int) -> dict:
+        """ Fetches one page of CKAN search results
+
+        :param fq: Solr filter query
+        :param start: offset of first record in page
+        :returns: result dict, 'count' is the total number of records found and 'results' is a list of package dicts
+        :raises: requests.RequestException or ValueError upon error
+        """
+        url_path =  'api/3/action/package_search'
+        url = f'{self.ckan_url}/{url_path}'
+        # NB: 'fl' is sent as a repeated parameter so that CKAN receives it as a list
+        r = self.session.get(url, params={'fq': fq, 'sort': CKAN_SORT, 'start': start, 'rows': CKAN_ROWS, 'fl': CKAN_FIELDS},
+                             timeout=TIMEOUT)
+        r.raise_for_status()
+        resp = r.json()
+        if resp['success'] is False:
+            raise ValueError(f"Package search error: {resp.get('error','')}")
+        return resp['result']
+
+    def search_records(self, modified_since: str = None, result: dict = None):
+        """ Finds all public records using 'package_search'
+        The first page of results gives the number of records, then the remaining pages are fetched concurrently.
+        Records are yielded as each page arrives.
+
+        :param modified_since: optional date, only records modified on or after this date are found e.g. '2024-01-31'
+        :param result: optional dict, 'count' is set to the number of records that CKAN reports
+        :returns: generator of package dicts with 'id', 'name' and 'metadata_modified' keys
+        :raises: requests.RequestException or ValueError upon error
+        """
+        print("SEARCHING CKAN RECORDS")
+        fq = ckan_search_filter(modified_since)
+        first = self.search_page(fq, 0)
+        print(f"Found {first['count']} CKAN records")
+        if result is not None:
+            result['count'] = first['count']
+        yield from first['results']
+        executor = ThreadPoolExecutor(max_workers=CKAN_MAX_CONCURRENCY)
+        try:
+            futures = [executor.submit(self.search_page, fq, start) for start in range(CKAN_ROWS, first['count'], CKAN_ROWS)]
+            for future in as_completed(futures):
+                yield from future.result()['results']
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def get_record(self, package_id: str) -> str:
+        """ Given a package id retrieves its ISO 19115 XML record
+
+        :param package_id: CKAN package_id string
+        :returns: XML record as a string
+        :raises: requests.RequestException or ValueError upon error
+        """
+        print(f"FETCHING CKAN RECORD {package_id}")
+        url_path =  'api/3/action/iso19115_package_show'
+        url = f'{self.ckan_url}/{url_path}'
+        r = self.session.get(url, params={'format':'xml', 'id':package_id}, timeout=TIMEOUT)
+        r.raise_for_status()
+        resp = r.json()
+        if resp['success'] is False:
+            raise ValueError(f"Package show error: {resp.get('error','')}")
+        return resp['result']
+
+
+    def is_deleted(self, package_id: str) -> bool:
+        """ Checks that a record has been deleted from CKAN, using 'package_show'
+
+        :param package_id: CKAN package_id string
+        :returns: True if CKAN does not have the record or it has been deleted
+        :raises: requests.RequestException or ValueError upon error
+        """
+        url_path =  'api/3/action/package_show'
+        url = f'{self.ckan_url}/{url_path}'
+        r = self.session.get(url, params={'id':package_id}, timeout=TIMEOUT)
+        if r.status_code == requests.codes['not_found']:
+            return True
+        r.raise_for_status()
+        resp = r.json()
+        if resp['success'] is False:
+            raise ValueError(f"Package show error: {resp.get('error','')}")
+        return resp['result'].get('state') == 'deleted'
+
+
+class GeonetworkClient:
+    """ Inserts records into Geonetwork, all requests share one HTTP session
+    The XSRF token is fetched upon first use and fetched again if Geonetwork refuses it e.g. when its session expires
+    """
+
+    def __init__(self, gn_url: str, username: str, password: str, workers: int = GN_WORKERS):
+        """
+        :param gn_url: Geonetwork service URL
+        :param username: Geonetwork username for an account that can create records
+        :param password: Geonetwork password
+        :param workers: number of threads that use the client at the same time
+        """
+        self.gn_url = gn_url
+        self.session = make_session(workers)
+        self.session.auth = (username, password)
+        self.xsrf_token = None
+        self.lock = threading.Lock()
+
+    def refresh_xsrf_token(self, stale_token: str | None = None) -> str:
+        """ Retrieves XSRF token from Geonetwork
+        If several threads find that the token is stale at the same time only one of them fetches a new token
+
+        :param stale_token: token that was refused, or None
+        :returns: XSRF as string
+        :raises: requests.RequestException or ValueError upon error
+        """
+        with self.lock:
+            if self.xsrf_token is not None and self.xsrf_token != stale_token:
+                return self.xsrf_token
+            authenticate_url = self.gn_url + '/geonetwork/srv/eng/info?type=me'
+            response = self.session.post(authenticate_url, timeout=TIMEOUT)
+
+            # Extract XRSF token
+            xsrf_token = response.cookies.get("XSRF-TOKEN")
+            if not xsrf_token:
+                raise ValueError(f"Could not find geonetwork XSRF token, status code {response.status_code}")
+            self.xsrf_token = xsrf_token
+            return xsrf_token
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """ Sends a request to Geonetwork with the XSRF token, fetching a new token if Geonetwork refuses it
+
+        :param method: HTTP method e.g. 'PUT'
+        :param path: path of API e.g. '/geonetwork/srv/api/records'
+        :param kwargs: keyword arguments of 'requests.Session.request()'
+        :returns: requests Response object
+        :raises: requests.RequestException or ValueError upon error
+        """
+        xsrf_token = self.xsrf_token or self.refresh_xsrf_token()
+        headers = kwargs.pop('headers', {})
+        for attempt in range(2):
+            response = self.session.request(method, self.gn_url + path, headers={**headers, 'X-XSRF-TOKEN': xsrf_token},
+                                            timeout=TIMEOUT, **kwargs)
+            # A '403 Forbidden' reply means that the XSRF token has expired
+            if response.status_code != requests.codes['forbidden'] or attempt > 0:
+                break
+            print("Geonetwork refused XSRF token, fetching a new one")
+            xsrf_token = self.refresh_xsrf_token(xsrf_token)
+        return response
+
+    def insert_record(self, xml_string: str) -> str | None:
+        """ Inserts a record into Geonetwork, replacing the record with the same uuid if there is one
+
+        :param xml_string: XML to be inserted as a string
+        :returns: uuid of record in Geonetwork, or None if Geonetwork did not report it
+        :raises: requests.RequestException or ValueError if insert failed
+        """
+        # 'uuidProcessing' is set to 'OVERWRITE' so that changed records replace the existing ones,
+        # records that do not exist yet are created
+        params = {'metadataType': 'METADATA',
+                  'publishToAll': 'true',
+                  'uuidProcessing': 'OVERWRITE',  # Available values : GENERATEUUID, NOTHING, OVERWRITE
+                  'group': '2'
+        }
+        # Set header for connection
+        headers = {'Accept': 'application/json',
+                   'Content-Type': 'application/xml'
+        }
+        response = self.request('PUT', '/geonetwork/srv/api/records', data=xml_string.encode('utf-8'), params=params,
+                                headers=headers)
+        if response.status_code >= 400:
+            raise ValueError(f"Failed with status: {response.status_code} {response.text}")
+        resp = response.json()
+
+        # Check if record was created in Geonetwork
+        if response.status_code != requests.codes['created'] or resp.get('numberOfRecordsProcessed') != 1 or \
+                resp.get('numberOfRecordsWithErrors') != 0:
+            raise ValueError(f"Insert failed: status code: {response.status_code} {resp}")
+        # 'metadataInfos' maps Geonetwork's internal id to a list of info dicts
+        for infos in (resp.get('metadataInfos') or {}).values():
+            for info in infos:
+                if info.get('uuid'):
+                    return info['uuid']
         return None
-    return resp['result']
-    
 
-def insert_gn_record(session: requests.sessions.Session, xsrf_token: str, xml_string: str) -> True:
-    """ Inserts a record into Geonetwork
+    def delete_record(self, uuid: str):
+        """ Deletes a record from Geonetwork
 
-    :param session: requests Session object
-    :param xsrf_token: Geonetwork's XSRF token as a string
-    :param xml_string: XML to be inserted as a string
-    :returns: True or False if insert succeeded
+        :param uuid: uuid of record
+        :raises: requests.RequestException or ValueError if delete failed
+        """
+        response = self.request('DELETE', f'/geonetwork/srv/api/records/{uuid}', headers={'Accept': 'application/json'})
+        # The record may already have been deleted
+        if response.status_code >= 400 and response.status_code != requests.codes['not_found']:
+            raise ValueError(f"Delete failed with status: {response.status_code} {response.text}")
+
+
+class SyncState:
+    """ SQLite database of the CKAN records that have been sent to Geonetwork, thread safe
+    For each CKAN package id it holds the record's uuid in Geonetwork, its 'metadata_modified' time in CKAN
+    and the SHA256 hash of its XML
     """
-    print("INSERTING GN RECORD")
-    # Set header for connection
-    headers = {'Accept': 'application/json',
-               'Content-Type': 'application/xml',
-               'X-XSRF-TOKEN': xsrf_token
-    }
-
-    # Set the parameters
-    # Currently 'uuidProcessing' is set to 'NOTHING' so that records that
-    # already exist are rejected by Geonetwork as duplicates
-    params = {'metadataType': 'METADATA',
-              'publishToAll': 'true',
-              'uuidProcessing': 'NOTHING',  # Available values : GENERATEUUID, NOTHING, OVERWRITE
-              'group': '2'
-    }
-
-    print(f"Doing PUT request: {GN_URL + '/geonetwork/srv/api/records'}")
-    try:
-        # Send a put request to the endpoint to create record
-        response = session.put(GN_URL + '/geonetwork/srv/api/records',
-                            data=xml_string,
-                            params=params,
-                            auth=(GN_USERNAME, GN_PASSWORD),
-                            headers=headers
-        )
-        response.raise_for_status()
-    except requests.exceptions.HTTPError:
-        print(f"Failed with status: {response.status_code}")
-        print(f"Error message: {response.text}")
-        return False
-    resp = response.json()
-
-    # Check if record was created in Geonetwork
-    if response.status_code == requests.codes['created'] and resp['numberOfRecordsProcessed'] == 1 and \
-            resp['numberOfRecordsWithErrors'] == 0:
-        print("GN Record Inserted")
-        return True
-    print(f"Insert failed: status code: {response.status_code}\n{resp}")
-    return False
-        
+
+    def __init__(self, db_file: str = STATE_DB):
+        """
+        :param db_file: path of SQLite database file, created if it does not exist
+        """
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS records (
+                                    package_id TEXT PRIMARY KEY,
+                                    uuid TEXT,
+                                    metadata_modified TEXT NOT NULL,
+                                    xml_sha256 TEXT NOT NULL,
+                                    synced TEXT NOT NULL)""")
+
+    def get(self, package_id: str) -> dict | None:
+        """ Looks up the state of a record
+
+        :param package_id: CKAN package id
+        :returns: dict with 'uuid', 'metadata_modified' and 'xml_sha256' keys, or None if it has not been synced
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT uuid, metadata_modified, xml_sha256 FROM records WHERE package_id = ?",
+                                    (package_id,)).fetchone()
+        if row is None:
+            return None
+        return {'uuid': row[0], 'metadata_modified': row[1], 'xml_sha256': row[2]}
+
+    def record(self, package_id: str, uuid: str | None, metadata_modified: str, xml_sha256: str):
+        """ Records that a record has been synced
+
+        :param package_id: CKAN package id
+        :param uuid: uuid of record in Geonetwork
+        :param metadata_modified: 'metadata_modified' time of record in CKAN
+        :param xml_sha256: SHA256 hex digest of record's XML
+        """
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+                              (package_id, uuid, metadata_modified, xml_sha256,
+                               datetime.datetime.now(datetime.timezone.utc).isoformat()))
+
+    def delete(self, package_id: str):
+        """ Removes a record
+
+        :param package_id: CKAN package id
+        """
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM records WHERE package_id = ?", (package_id,))
+
+    def package_ids(self) -> set:
+        """
+        :returns: set of CKAN package ids of all synced records
+        """
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT package_id FROM records")}
+
+    def close(self):
+        self.conn.close()
+
+
+class SyncReport:
+    """ Counts the records synced and collects failures, thread safe
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.found = 0
+        self.not_modified = 0
+        self.fetched = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deleted_upstream = 0
+        self.deleted = 0
+        self.failures = []
+
+    def add(self, counter: str):
+        """ Adds one to a count
+
+        :param counter: one of 'found', 'not_modified', 'fetched', 'inserted', 'updated', 'unchanged', 'deleted_upstream', 'deleted'
+        """
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def add_failure(self, package_id: str | None, stage: str, error: Exception):
+        """ Records a failure
+
+        :param package_id: CKAN package id, or None if the failure is not for one record
+        :param stage: 'search', 'fetch', 'insert' or 'delete'
+        :param error: exception raised
+        """
+        with self.lock:
+            self.failures.append((package_id, stage, f"{type(error).__name__}: {error}"))
+
+    def print(self):
+        """ Prints the throughput and the failures
+        """
+        elapsed = time.perf_counter() - self.start
+        sent = self.inserted + self.updated
+        print(f"\nSynced {sent} of {self.found} CKAN records in {elapsed:.1f}s"
+              f" ({sent / elapsed if elapsed > 0 else 0.0:.2f} records/s): {self.inserted} inserted, {self.updated} updated,"
+              f" {self.not_modified} not modified, {self.unchanged} with unchanged XML, {len(self.failures)} failed")
+        if self.deleted_upstream > 0:
+            print(f"{self.deleted_upstream} records have been deleted from CKAN, {self.deleted} deleted from Geonetwork")
+        for package_id, stage, error in self.failures:
+            print(f"  {package_id or ''} {stage} failed: {error}")
+
+
+def sync(ckan: CkanClient, gn: GeonetworkClient, state: SyncState, modified_since: str = None,
+         ckan_workers: int = CKAN_WORKERS, gn_workers: int = GN_WORKERS, delete: bool = False) -> SyncReport:
+    """ Sends new and changed CKAN records to Geonetwork
+    A pool of workers fetches the records that CKAN has modified since the last sync, each record whose XML has
+    changed is passed to another pool of workers that sends it to Geonetwork.
+    Records in the sync state that CKAN no longer has are found, unless only recently modified records are searched
+    or the search did not find as many records as CKAN reported. Each of these is checked with 'package_show'.
+
+    :param ckan: CKAN client
+    :param gn: Geonetwork client
+    :param state: sync state, updated with the records that are sent
+    :param modified_since: optional date, only records modified on or after this date are searched e.g. '2024-01-31'
+    :param ckan_workers: number of records fetched from CKAN at the same time
+    :param gn_workers: number of records inserted into Geonetwork at the same time
+    :param delete: if True, records deleted from CKAN are deleted from Geonetwork
+    :returns: SyncReport object
+    """
+    report = SyncReport()
+    # Limits the number of records that have been found but not yet inserted, so that fetching cannot run far ahead
+    in_flight = threading.BoundedSemaphore(ckan_workers + 2 * gn_workers)
+
+    def insert(package: dict, prev: dict | None, xml_string: str, digest: str):
+        try:
+            uuid = gn.insert_record(xml_string)
+            state.record(package['id'], uuid or (prev or {}).get('uuid'), package['metadata_modified'], digest)
+            report.add('inserted' if prev is None else 'updated')
+            print(f"GN Record {'Inserted' if prev is None else 'Updated'} '{package['id']}'")
+        except Exception as e:
+            report.add_failure(package['id'], 'insert', e)
+        finally:
+            in_flight.release()
+
+    found = set()
+    searched = {}
+    # NB: 'ckan_pool' is shut down first, after it has passed all the fetched records to 'gn_pool'
+    with ThreadPoolExecutor(max_workers=gn_workers) as gn_pool, ThreadPoolExecutor(max_workers=ckan_workers) as ckan_pool:
+
+        def fetch(package: dict, prev: dict | None):
+            # The record's slot is released here unless it is passed on to 'insert()'
+            scheduled = False
+            try:
+                xml_string = ckan.get_record(package['id'])
+                report.add('fetched')
+                digest = hashlib.sha256(xml_string.encode('utf-8')).hexdigest()
+                if prev is not None and prev['xml_sha256'] == digest:
+                    # Modified in CKAN, but not in a way that changes the XML
+                    state.record(package['id'], prev['uuid'], package['metadata_modified'], digest)
+                    report.add('unchanged')
+                    return
+                gn_pool.submit(insert, package, prev, xml_string, digest)
+                scheduled = True
+            except Exception as e:
+                report.add_failure(package['id'], 'fetch', e)
+            finally:
+                if not scheduled:
+                    in_flight.release()
+
+        try:
+            for package in ckan.search_records(modified_since, searched):
+                report.add('found')
+                found.add(package['id'])
+                prev = state.get(package['id'])
+                if prev is not None and prev['metadata_modified'] == package['metadata_modified']:
+                    report.add('not_modified')
+                    continue
+                in_flight.acquire()
+                ckan_pool.submit(fetch, package, prev)
+        except Exception as e:
+            report.add_failure(None, 'search', e)
+            searched = {}
+
+    # Records can only be known to be deleted if all of CKAN's records were found
+    if modified_since is not None or 'count' not in searched:
+        return report
+    if len(found) != searched['count']:
+        # e.g. a record was modified during the search, moving the others between pages
+        print(f"WARNING: Found {len(found)} of {searched['count']} CKAN records, not looking for deleted records")
+        return report
+    for package_id in sorted(state.package_ids() - found):
+        try:
+            # Records missing from the search may still be in CKAN
+            if not ckan.is_deleted(package_id):
+                print(f"WARNING: CKAN record '{package_id}' was not found by search, but has not been deleted")
+                continue
+        except Exception as e:
+            report.add_failure(package_id, 'delete', e)
+            continue
+        report.add('deleted_upstream')
+        print(f"CKAN record '{package_id}' has been deleted")
+        if not delete:
+            continue
+        uuid = state.get(package_id)['uuid']
+        if uuid is None:
+            print(f"WARNING: Geonetwork uuid of CKAN record '{package_id}' is unknown, it must be deleted by hand")
+            continue
+        try:
+            gn.delete_record(uuid)
+            state.delete(package_id)
+            report.add('deleted')
+        except Exception as e:
+            report.add_failure(package_id, 'delete', e)
+    return report
+
 
 if __name__ == "__main__":
     # Check env. vars
@@ -128,20 +532,18 @@ if __name__ == "__main__":
         print("           'CKAN2GN_GN_USERNAME' 'CKAN2GN_GN_PASSWORD' 'CKAN2GN_GN_URL' 'CKAN2GN_CKAN_URL'")
         sys.exit(1)
     # Connect to server
-    session = requests.Session()
-    xsrf = get_gn_xsrf_token(session)
-    if xsrf is not None:
-        # Get records from CKAN
-        for id in list_ckan_records():
-            print(f"\nInserting '{id}'")
-            xml_string = get_ckan_record(id)
-            if xml_string is not None:
-                # Insert GN record
-                insert_gn_record(session, xsrf, xml_string)
-            else:
-                print(f"Could not get record id '{id}' from CKAN")
-    else:
-        print("Could not find geonetwork XSRF token")
-
-    
-
+    gn = GeonetworkClient(GN_URL, GN_USERNAME, GN_PASSWORD)
+    try:
+        gn.refresh_xsrf_token()
+    except (requests.RequestException, ValueError) as e:
+        print(f"Could not find geonetwork XSRF token: {e}")
+        sys.exit(1)
+    # Copy new and changed records from CKAN
+    state = SyncState(STATE_DB)
+    try:
+        report = sync(CkanClient(CKAN_URL), gn, state, MODIFIED_SINCE, delete=DELETE)
+    finally:
+        state.close()
+    report.print()
+    if len(report.failures) > 0:
+        sys.exit(1)
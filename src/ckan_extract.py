@@ -1,16 +1,134 @@
 #!/usr/bin/env python3
 
 import os
-import requests
 import json 
 from pathlib import Path
 import datetime
 import geojson
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from pygeometa.core import render_j2_template
 
+import disk_cache
 from extractor import Extractor
+from fetch import fetch, make_url
+from config import CACHE_DIR, CKAN_SEARCH_ROWS, CKAN_MAX_CONCURRENCY
+
+# Search state, key is CKAN URL, value is the latest 'metadata_modified' found and the package ids that were wanted
+SEARCH_STATE_FILE = os.path.join(CACHE_DIR, 'ckan_search.json')
+
+# Order of 'package_search' results, a fixed order keeps the pages consistent while they are fetched concurrently
+SEARCH_SORT = 'metadata_modified asc, id asc'
+
+
+def package_search_url(ckan_url: str) -> str:
+    """
+    Returns URL of CKAN's 'package_search' API
+
+    :param ckan_url: URL to CKAN website
+    :returns: URL string
+    """
+    url_path = Path('api') / '3' / 'action' / 'package_search'
+    return f'{ckan_url}/{url_path}'
+
+
+def solr_date(date: str) -> str:
+    """
+    Converts a date or a CKAN 'metadata_modified' timestamp to a Solr date
+
+    :param date: e.g. '2024-01-31' or '2024-01-31T10:20:30.123456'
+    :returns: date string in UTC e.g. '2024-01-31T00:00:00Z'
+    """
+    if 'T' not in date:
+        date += 'T00:00:00'
+    return date if date.endswith('Z') else date + 'Z'
+
+
+def search_filter(package_ids: list = None, modified_since: str = None) -> str:
+    """
+    Makes a Solr filter query for 'package_search'
+
+    :param package_ids: optional list of package ids or names
+    :param modified_since: optional date, only packages modified on or after this date are found
+    :returns: filter query string
+    """
+    # CKAN only searches packages of type 'dataset' unless the filter mentions a type
+    terms = ['dataset_type:*']
+    if package_ids:
+        ids = ' OR '.join(f'"{package_id}"' for package_id in package_ids)
+        terms.append(f"(id:({ids}) OR name:({ids}))")
+    if modified_since:
+        terms.append(f"metadata_modified:[{solr_date(modified_since)} TO *]")
+    return ' '.join(f"+{term}" for term in terms)
+
+
+def search_page(ckan_url: str, fq: str, start: int, rows: int) -> dict:
+    """
+    Fetches one page of 'package_search' results
+
+    :param ckan_url: URL to CKAN website
+    :param fq: Solr filter query
+    :param start: offset of first package in page
+    :param rows: number of packages in page
+    :returns: result dict, 'count' is the total number of packages found and 'results' is a list of package dicts
+    :raises: requests.RequestException or ValueError if the search failed
+    """
+    r = fetch(package_search_url(ckan_url), params={'fq': fq, 'sort': SEARCH_SORT, 'start': start, 'rows': rows})
+    r.raise_for_status()
+    resp = r.json()
+    if resp.get('success') is not True:
+        raise ValueError(f"package_search failed: {resp.get('error', '')}")
+    return resp['result']
+
+
+def search_packages(ckan_url: str, fq: str, rows: int = None):
+    """
+    Finds packages with 'package_search'. The first page gives the number of packages found, then the remaining pages
+    are fetched concurrently, up to 'CKAN_MAX_CONCURRENCY' at a time. Packages are yielded as each page arrives.
+
+    :param ckan_url: URL to CKAN website
+    :param fq: Solr filter query, see 'search_filter()'
+    :param rows: number of packages in each page, default is 'CKAN_SEARCH_ROWS'
+    :returns: generator of package dicts
+    :raises: requests.RequestException or ValueError if a search failed
+    """
+    rows = rows or CKAN_SEARCH_ROWS
+    first = search_page(ckan_url, fq, 0, rows)
+    print(f"Found {first['count']} package(s) in {ckan_url}")
+    yield from first['results']
+    executor = ThreadPoolExecutor(max_workers=CKAN_MAX_CONCURRENCY)
+    try:
+        futures = [executor.submit(search_page, ckan_url, fq, start, rows) for start in range(rows, first['count'], rows)]
+        for future in as_completed(futures):
+            yield from future.result()['results']
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def load_search_state(state_file: str = SEARCH_STATE_FILE) -> dict:
+    """
+    Reads the state of previous searches
+
+    :param state_file: JSON state file
+    :returns: dict, key is CKAN URL, value is dict with 'modified' and 'ids' keys
+    """
+    if disk_cache.cache_mode != disk_cache.CACHE_USE:
+        return {}
+    state = disk_cache.load_json(state_file)
+    return state if isinstance(state, dict) else {}
+
+
+def save_search_state(state: dict, state_file: str = SEARCH_STATE_FILE):
+    """
+    Writes out the state of searches
+
+    :param state: dict, key is CKAN URL, value is dict with 'modified' and 'ids' keys
+    :param state_file: JSON state file
+    """
+    if disk_cache.cache_mode == disk_cache.CACHE_OFF:
+        return
+    disk_cache.atomic_write_json(state_file, state, 'CKAN search state', indent=1)
 
 
 class CkanExtractor(Extractor):
@@ -151,6 +269,27 @@ class CkanExtractor(Extractor):
         return True
 
 
+    @staticmethod
+    def package_show_url(ckan_url: str) -> str:
+        """
+        Returns URL of CKAN's 'package_show' API
+
+        :param ckan_url: URL to CKAN website
+        :returns: URL string
+        """
+        url_path =  Path('api') / '3' / 'action' / 'package_show'
+        return f'{ckan_url}/{url_path}'
+
+    @staticmethod
+    def source_url(params: dict) -> str:
+        """
+        Returns the CKAN API URL of the package
+
+        :param params: parameters of 'write_record()'
+        :returns: URL string
+        """
+        return make_url(CkanExtractor.package_show_url(params['ckan_url']), {'q':'type:report', 'id':params['package_id']})
+
     def write_record(self, name, bbox, model_endpath, ckan_url, package_id, output_file):
         """
         Write out XML for a CKAN record
@@ -164,10 +303,9 @@ class CkanExtractor(Extractor):
         """
         print(f"Converting: {model_endpath}")
         # Set up CKAN URL
-        url_path =  Path('api') / '3' / 'action' / 'package_show'
-        url = f'{ckan_url}/{url_path}'
+        url = self.package_show_url(ckan_url)
         # print("URL=", url)
-        r = requests.get(url, params={'q':'type:report', 'id':package_id})
+        r = fetch(url, params={'q':'type:report', 'id':package_id})
         try:
             dict = json.loads(r.text)
         except json.JSONDecodeError:
@@ -175,3 +313,58 @@ class CkanExtractor(Extractor):
         if dict['success'] is True:
             return self.output_xml(dict['result'], r.url, model_endpath, output_file)
         return False
+
+    def search(self, param_list: list, modified_since: str = None, force: bool = False,
+               state_file: str = SEARCH_STATE_FILE) -> list:
+        """
+        Writes out records by finding their packages with 'package_search', instead of fetching each package.
+        Pages of results are fetched concurrently and packages are written out as they arrive.
+        Unless 'modified_since' is given, only packages modified since the last search are requested.
+        Configured packages that are not found are fetched with 'package_show' if they have not been written out yet.
+
+        :param param_list: list of dicts, each dict is the parameters of 'write_record()'
+        :param modified_since: optional date, only packages modified on or after this date are searched e.g. '2024-01-31'
+        :param force: if True, search all packages, not just those modified since the last search
+        :param state_file: JSON file that holds the latest 'metadata_modified' of each search
+        :returns: list of (params, error message) tuples, one for each record that failed
+        """
+        failures = []
+        state = load_search_state(state_file)
+        for ckan_url in dict.fromkeys(params['ckan_url'] for params in param_list):
+            wanted = {params['package_id']: params for params in param_list if params['ckan_url'] == ckan_url}
+            prev = state.get(ckan_url, {})
+            # Search incrementally if the same packages were searched before
+            incremental = not force and modified_since is None and 'modified' in prev and set(wanted) <= set(prev.get('ids', []))
+            since = prev.get('modified') if incremental else modified_since
+            fq = search_filter(list(wanted), since)
+            print(f"Searching {ckan_url} {fq}")
+            pending = dict(wanted)
+            modified = prev.get('modified') if incremental else None
+            try:
+                for package in search_packages(ckan_url, fq):
+                    if modified is None or package['metadata_modified'] > modified:
+                        modified = package['metadata_modified']
+                    # Packages can be configured by id or by name
+                    params = pending.pop(package['name'], None) or pending.pop(package['id'], None)
+                    if params is None:
+                        continue
+                    print(f"Converting: {params['model_endpath']}")
+                    try:
+                        if not self.output_xml(package, self.source_url(params), params['model_endpath'],
+                                               params['output_file']):
+                            failures.append((params, "Could not write record"))
+                    except Exception as e:
+                        failures.append((params, f"{type(e).__name__}: {e}"))
+            except Exception as e:
+                failures += [(params, f"Search failed, {type(e).__name__}: {e}") for params in pending.values()]
+                continue
+            if modified is not None:
+                state[ckan_url] = {'modified': modified, 'ids': sorted(wanted)}
+            # Packages that were not found have not changed, unless they have never been written out
+            for params in pending.values():
+                if not incremental or not os.path.exists(os.path.join(self.output_dir, params['output_file'])):
+                    error = self.try_write_record(params)
+                    if error is not None:
+                        failures.append((params, error))
+        save_search_state(state, state_file)
+        return failures
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 """
@@ -125,6 +126,7 @@ CONFIG = {
         #
         # NT also has an OAI-PMH interface
         'nt2': { 'method': 'OAIPMH',
+                'oai_url': 'https://geoscience.nt.gov.au/gemis/ntgsoai/request',
                 'params': [  { 'name': 'McArthur Basin',
                                'model_endpath': 'mcarthur',
                                'oai_id': 'oai:geoscience.nt.gov.au:1/81751',
@@ -157,3 +159,93 @@ OUTPUT_DIR = str(Path(__file__).parent / 'output')
 # Runs in cloud using Anthropic Claude LLM via AWS Bedrock
 USE_CLAUDE = False
 
+# Directory of the geomodel portal's model JSON files, these have the model extents
+GEOMODELS_DIR = os.path.join("geomodelportal", "ui", "src", "assets", "geomodels")
+
+# Directory for persistent caches, e.g. converted PDF text
+CACHE_DIR = str(Path(__file__).parent / 'cache')
+
+# Maximum size of the docling PDF conversion cache in bytes
+DOCLING_CACHE_MAX_BYTES = 500 * 1024 * 1024
+
+# Keyword extraction: run yake separately on each section of the PDF text, sections are delimited by markdown headings
+YAKE_BY_SECTION = True
+
+# Keyword extraction: maximum number of words of PDF text given to yake, the rest of the text is ignored
+YAKE_MAX_TOKENS = 40000
+
+# Keyword extraction: sections are joined into chunks of up to this many words, yake is run on each chunk
+YAKE_CHUNK_TOKENS = 5000
+
+# Keyword extraction: number of processes used to run yake on the chunks of PDF files, one pool is shared by all records
+# When records are processed in parallel ('--jobs') yake is run in each record's worker process instead
+YAKE_WORKERS = 4
+
+# Summaries: PDF text longer than this many tokens is split into chunks at its markdown headings,
+# each chunk is summarised and then the chunk summaries are summarised
+SUMMARY_CHUNK_TOKENS = 3000
+
+# Summaries: the summariser backend used by 'PDF' provider groups that do not have a 'summariser' key,
+# either 'bedrock' or 'ollama', see "CONFIG.md"
+SUMMARISER = 'bedrock' if USE_CLAUDE else 'ollama'
+
+# Summaries: stream the LLM's output, recording time to first token and tokens per second, these are printed at the end of a run
+# NB: With 'bedrock' this needs the 'bedrock:InvokeModelWithResponseStream' IAM permission as well as 'bedrock:InvokeModel'
+SUMMARY_STREAM = False
+
+# Summaries: cached summaries are used for this many seconds
+SUMMARY_CACHE_TTL = 90 * 24 * 60 * 60
+
+# Summaries: maximum size of the summary cache in bytes
+SUMMARY_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# AWS Bedrock: endpoint URL of the Bedrock runtime service, None uses the AWS default for the region
+BEDROCK_ENDPOINT_URL = None
+
+# AWS Bedrock: maximum number of concurrent requests
+BEDROCK_MAX_CONCURRENCY = 4
+
+# AWS Bedrock: number of requests queued at a time when summarising the chunks of a PDF file
+BEDROCK_BATCH_SIZE = 8
+
+# AWS Bedrock: number of attempts made for each request when throttled or unavailable
+BEDROCK_ATTEMPTS = 6
+
+# ollama: maximum number of concurrent requests, should not be more than the server's OLLAMA_NUM_PARALLEL
+OLLAMA_MAX_CONCURRENCY = 1
+
+# ollama: number of requests queued at a time when summarising the chunks of a PDF file
+OLLAMA_BATCH_SIZE = 2
+
+# Fetching records: maximum number of concurrent requests to each host when records are fetched ahead of conversion
+FETCH_MAX_PER_HOST = 4
+
+# Fetching records: connect and read timeouts in seconds
+FETCH_TIMEOUT = (10, 60)
+
+# Fetching records: number of attempts made to fetch a record when the request fails or the server is busy
+FETCH_ATTEMPTS = 3
+
+# Fetching records: delay in seconds before the first retry, doubled for each retry
+FETCH_BACKOFF = 1.0
+
+# OAI-PMH: maximum number of concurrent requests to each service
+OAI_MAX_CONCURRENCY = 4
+
+# OAI-PMH: number of attempts made for each request when the service is unavailable or too busy
+OAI_ATTEMPTS = 4
+
+# OAI-PMH: delay in seconds before the first retry if the service does not send 'Retry-After', doubled for each retry
+OAI_BACKOFF = 5.0
+
+# OAI-PMH: maximum delay in seconds before a retry, longer 'Retry-After' delays are shortened
+OAI_MAX_RETRY_AFTER = 120
+
+# OAI-PMH: connect and read timeouts in seconds
+OAI_TIMEOUT = (10, 60)
+
+# CKAN: number of packages in each page of 'package_search' results, CKAN servers usually limit this to 1000
+CKAN_SEARCH_ROWS = 100
+
+# CKAN: maximum number of 'package_search' pages fetched at the same time
+CKAN_MAX_CONCURRENCY = 4
@@ -0,0 +1,173 @@
+import os
+import gzip
+import json
+import threading
+
+"""
+A simple persistent cache that stores compressed values as files on disk
+The cache is bounded in size and evicts the least recently used files first
+"""
+
+# Cache modes, set from the command line
+#   'use'     - read from and write to the cache
+#   'refresh' - ignore existing cache entries, but write out new ones
+#   'off'     - do not read or write the cache
+CACHE_USE = 'use'
+CACHE_REFRESH = 'refresh'
+CACHE_OFF = 'off'
+
+cache_mode = CACHE_USE
+
+def set_cache_mode(mode: str):
+    """
+    Sets the cache mode for all caches in this run
+
+    :param mode: one of 'use', 'refresh' or 'off'
+    """
+    global cache_mode
+    if mode not in (CACHE_USE, CACHE_REFRESH, CACHE_OFF):
+        raise ValueError(f"Unknown cache mode {mode}")
+    cache_mode = mode
+
+
+def atomic_write(path: str, data: bytes, description: str = 'file') -> bool:
+    """
+    Writes a file, its directory is created if necessary
+    The data is written to a temporary file first so that readers never see a partial file
+
+    :param path: path of file
+    :param data: content of file
+    :param description: what the file is, used in the warning printed if it cannot be written
+    :returns: True if the file was written
+    """
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as fd:
+            fd.write(data)
+        os.replace(tmp_path, path)
+    except OSError as oe:
+        print(f"WARNING: Cannot write {description} {path}: {oe}")
+        return False
+    return True
+
+
+def atomic_write_json(path: str, data, description: str = 'file', indent: int = None) -> bool:
+    """
+    Writes a JSON file, see 'atomic_write()'
+
+    :param path: path of file
+    :param data: JSON serialisable data
+    :param description: what the file is, used in the warning printed if it cannot be written
+    :param indent: optional JSON indent
+    :returns: True if the file was written
+    """
+    return atomic_write(path, json.dumps(data, indent=indent).encode('utf-8'), description)
+
+
+def load_json(path: str, default=None):
+    """
+    Reads a JSON file
+
+    :param path: path of file
+    :param default: value returned if the file is missing or cannot be parsed
+    :returns: data read from file or default
+    """
+    try:
+        with open(path) as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return default
+
+
+class DiskCache:
+    """
+    Size bounded LRU cache of gzip compressed files, one file per key
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        :param cache_dir: directory where cache files are kept, created upon first write
+        :param max_bytes: maximum total size of the cache files in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + '.gz')
+
+    def get(self, key: str) -> bytes | None:
+        """
+        Fetches a value from the cache
+
+        :param key: cache key, must be usable as a filename e.g. a hex digest
+        :returns: value as bytes or None if not in cache
+        """
+        if cache_mode != CACHE_USE:
+            return None
+        path = self.__path(key)
+        try:
+            with gzip.open(path, 'rb') as fd:
+                data = fd.read()
+        except (OSError, EOFError):
+            return None
+        # Mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def contains(self, key: str) -> bool:
+        """
+        Returns True if a value can be fetched from the cache
+
+        :param key: cache key
+        :returns: boolean
+        """
+        return cache_mode == CACHE_USE and os.path.isfile(self.__path(key))
+
+    def put(self, key: str, data: bytes):
+        """
+        Stores a value in the cache, then evicts old entries if the cache is too large
+
+        :param key: cache key, must be usable as a filename e.g. a hex digest
+        :param data: value as bytes
+        """
+        if cache_mode == CACHE_OFF:
+            return
+        if atomic_write(self.__path(key), gzip.compress(data), 'cache file'):
+            self.evict()
+
+    def evict(self):
+        """
+        Deletes least recently used cache files until the cache is no larger than 'max_bytes'
+        """
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.gz'):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        """
+        Deletes all cache files
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.gz'):
+                    os.remove(entry.path)
@@ -0,0 +1,97 @@
+from lxml import etree
+
+from add_coords import insert_coords
+from add_links import insert_model_link
+from add_model_keyw import insert_models_keyword
+from local_types import Coords
+
+"""
+In-memory enrichment pipeline for ISO 19139 and ISO 19115-3 XML records
+
+A parsed XML record is passed through a list of stages, each stage takes an XML doc root and returns an XML doc root.
+The record is only serialised once, when it is written to disk.
+"""
+
+# Compiled stylesheets, key is the stylesheet, created upon first use
+_transforms = {}
+
+
+def get_transform(xslt: bytes) -> etree.XSLT:
+    """
+    Returns a compiled stylesheet, compiling it if necessary
+
+    :param xslt: stylesheet
+    :returns: lxml XSLT object
+    """
+    if xslt not in _transforms:
+        _transforms[xslt] = etree.XSLT(etree.XML(xslt))
+    return _transforms[xslt]
+
+
+def transform_records(transform: etree.XSLT, docs: list, model_endpaths: list) -> list:
+    """
+    Inserts model links into a batch of XML documents using a compiled stylesheet,
+    the model's URL is passed to the stylesheet as its 'model_url' parameter
+
+    :param transform: compiled stylesheet, see 'get_transform()'
+    :param docs: list of parsed XML documents
+    :param model_endpaths: list of model paths, one for each document
+    :returns: list of transformed XML documents
+    """
+    return [transform(doc, model_url=etree.XSLT.strparam(f"https://geomodels.auscope.org.au/model/{model_endpath}"))
+            for doc, model_endpath in zip(docs, model_endpaths)]
+
+
+def model_link_stage(model_endpath: str):
+    """
+    Stage that inserts a link to the model in geomodels website, ISO 19139 only
+
+    :param model_endpath: model path in geomodels website
+    :returns: stage function
+    """
+    return lambda root: insert_model_link(model_endpath, root)
+
+
+def keyword_stage(iso_ver: str):
+    """
+    Stage that inserts the "AuScope 3D Geological Models" keyword
+
+    :param iso_ver: ISO XML version string, either 'ISO19139' or 'ISO19115-3'
+    :returns: stage function
+    """
+    return lambda root: insert_models_keyword(root, iso_ver)
+
+
+def coords_stage(coords: Coords, iso_ver: str):
+    """
+    Stage that inserts a bounding box
+
+    :param coords: coordinates
+    :param iso_ver: ISO XML version string, either 'ISO19139' or 'ISO19115-3'
+    :returns: stage function
+    """
+    return lambda root: insert_coords(coords, root, iso_ver)
+
+
+def enrich(root: etree._Element, stages: list) -> etree._Element:
+    """
+    Passes an XML record through a list of stages
+
+    :param root: XML doc root
+    :param stages: list of stage functions
+    :returns: XML doc root
+    """
+    for stage in stages:
+        root = stage(root)
+    return root
+
+
+def write_xml(root: etree._Element, filename: str):
+    """
+    Serialises an XML record and writes it to disk
+
+    :param root: XML doc root
+    :param filename: output filename
+    """
+    with open(filename, 'wb') as ff:
+        ff.write(etree.tostring(root, pretty_print=True))
@@ -15,7 +15,70 @@ class Extractor:
             pass
         self.output_dir = OUTPUT_DIR
 
+    @staticmethod
+    def source_url(params: dict) -> str | None:
+        """
+        Returns the URL that 'write_record()' fetches for a set of parameters, so that it can be fetched ahead of time
+
+        :param params: parameters of 'write_record()'
+        :returns: URL string or None if the extractor does not fetch from a URL
+        """
+        return None
+
+    @staticmethod
+    def source_file(params: dict) -> str | None:
+        """
+        Returns the local file that 'write_record()' reads for a set of parameters, used to tell if it has changed
+
+        :param params: parameters of 'write_record()'
+        :returns: path of file or None if the extractor does not read a local file
+        """
+        return None
+
+    @staticmethod
+    def input_settings(options: dict) -> dict:
+        """
+        Returns the settings outside of the config that change the records written by the extractor,
+        they are added to the inputs of each record in the build manifest
+
+        :param options: keyword arguments of the extractor's constructor
+        :returns: dict of settings
+        """
+        return {}
+
     def write_record(self, bbox: Coords, model_endpath: str):
         """ NB: The input  parameters for this function should match the parameters defined in the configuration file
         """
         pass
+
+    def write_records(self, param_list: list, jobs: int = 1) -> list:
+        """
+        Writes out a record for each set of parameters
+        Errors are collected so that one bad record does not stop the others from being written
+
+        :param param_list: list of dicts, each dict is the parameters of 'write_record()'
+        :param jobs: number of parallel jobs, this is ignored unless the extractor supports it
+        :returns: list of (params, error message) tuples, one for each record that failed
+        """
+        failures = []
+        for params in param_list:
+            error = self.try_write_record(params)
+            if error is not None:
+                failures.append((params, error))
+        return failures
+
+    def try_write_record(self, params: dict) -> str | None:
+        """
+        Calls 'write_record()' and catches any errors
+
+        :param params: parameters of 'write_record()'
+        :returns: error message or None if record was written
+        """
+        try:
+            if self.write_record(**params):
+                return None
+            return "Could not write record"
+        except TypeError as te:
+            return f"Python Error in {params}\n{te}\n\nPlease check config.py file"
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
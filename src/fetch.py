@@ -0,0 +1,199 @@
+import time
+import threading
+from contextlib import nullcontext
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import FETCH_MAX_PER_HOST, FETCH_TIMEOUT, FETCH_ATTEMPTS, FETCH_BACKOFF
+
+"""
+Fetches metadata records from web services
+
+All the records in the config can be fetched concurrently ahead of time using 'prefetch()'
+The extractors then call 'fetch()', which hands over the prefetched response or fetches the URL if it was not prefetched
+Prefetches can be conditional, if the record has not changed since the last run the server replies '304 Not Modified'
+"""
+
+# HTTP status codes that are retried
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# Shared HTTP session, keeps connections alive between requests
+_session = None
+
+# Responses fetched by 'prefetch()', key is URL
+_prefetched = {}
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the shared HTTP session, creating it if necessary
+
+    :returns: requests Session object
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=FETCH_MAX_PER_HOST)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
+def make_url(url: str, params: dict = None) -> str:
+    """
+    Adds query parameters to a URL
+
+    :param url: URL
+    :param params: optional dict of query parameters
+    :returns: URL string
+    """
+    if not params:
+        return url
+    return requests.Request('GET', url, params=params).prepare().url
+
+
+def validators(response: requests.Response) -> dict:
+    """
+    Gets the HTTP validators of a response, these identify the version of the resource
+
+    :param response: requests Response object
+    :returns: dict with 'etag' and/or 'last_modified' keys, empty if the server did not send them
+    """
+    found = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+    return {key: val for key, val in found.items() if val is not None}
+
+
+def conditional_headers(source: dict | None) -> dict:
+    """
+    Makes the headers of a conditional request, the server replies '304 Not Modified' if the resource is unchanged
+
+    :param source: optional dict of validators, see 'validators()'
+    :returns: dict of HTTP headers
+    """
+    headers = {}
+    if source is not None and 'etag' in source:
+        headers['If-None-Match'] = source['etag']
+    if source is not None and 'last_modified' in source:
+        headers['If-Modified-Since'] = source['last_modified']
+    return headers
+
+
+def prefetched(url: str) -> requests.Response | Exception | None:
+    """
+    Looks at a prefetched response, without handing it over
+
+    :param url: URL
+    :returns: requests Response object, the exception raised when fetching it or None if it was not prefetched
+    """
+    return _prefetched.get(url)
+
+
+def forget(url: str):
+    """
+    Discards a prefetched response that will not be used
+
+    :param url: URL
+    """
+    _prefetched.pop(url, None)
+
+
+def _retry_delay(attempt: int, response: requests.Response | None) -> float | None:
+    """
+    Decides whether to retry a request
+
+    :param attempt: number of attempts made so far
+    :param response: response or None if the request raised an exception
+    :returns: delay in seconds before the next attempt, or None if there should be no retry
+    """
+    if attempt >= FETCH_ATTEMPTS:
+        return None
+    if response is not None and response.status_code not in RETRY_STATUS:
+        return None
+    return FETCH_BACKOFF * 2 ** (attempt - 1)
+
+
+def _get(url: str, headers: dict = None, semaphore: threading.Semaphore = None) -> requests.Response:
+    """
+    Fetches a URL, retrying upon failure
+
+    :param url: URL
+    :param headers: optional dict of HTTP headers
+    :param semaphore: optional semaphore that limits the number of concurrent requests to the URL's host,
+                      it is not held while waiting to retry
+    :returns: requests Response object
+    :raises: requests.RequestException if the URL could not be fetched
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        with semaphore or nullcontext():
+            try:
+                response = get_session().get(url, headers=headers, timeout=FETCH_TIMEOUT)
+            except requests.RequestException:
+                response = None
+                if _retry_delay(attempt, None) is None:
+                    raise
+        delay = _retry_delay(attempt, response)
+        if delay is None:
+            return response
+        time.sleep(delay)
+
+
+def fetch(url: str, params: dict = None) -> requests.Response:
+    """
+    Fetches a URL, retrying upon failure. Uses the prefetched response if there is one
+
+    :param url: URL
+    :param params: optional dict of query parameters
+    :returns: requests Response object
+    :raises: requests.RequestException if the URL could not be fetched
+    """
+    full_url = make_url(url, params)
+    if full_url in _prefetched:
+        response = _prefetched.pop(full_url)
+        if isinstance(response, Exception):
+            raise response
+        # A '304 Not Modified' reply to a conditional prefetch has no content, so fetch it again
+        if response.status_code != 304:
+            return response
+    return _get(full_url)
+
+
+def fetch_all(urls: list, headers: dict = None) -> dict:
+    """
+    Fetches a list of URLs concurrently in a pool of threads, limiting the number of concurrent requests to each host
+
+    :param urls: list of URLs
+    :param headers: optional dict, key is URL, value is dict of HTTP headers sent with that URL
+    :returns: dict, key is URL, value is requests Response object or the exception raised when fetching it
+    """
+    semaphores = {}
+    for url in urls:
+        semaphores.setdefault(urlparse(url).netloc, threading.BoundedSemaphore(FETCH_MAX_PER_HOST))
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(len(urls), FETCH_MAX_PER_HOST * len(semaphores)))) as executor:
+        futures = {url: executor.submit(_get, url, (headers or {}).get(url), semaphores[urlparse(url).netloc]) for url in urls}
+        for url, future in futures.items():
+            error = future.exception()
+            results[url] = error if error is not None else future.result()
+    return results
+
+
+def prefetch(urls: list, headers: dict = None):
+    """
+    Fetches URLs concurrently ahead of time, 'fetch()' will then return these responses
+
+    :param urls: list of URLs
+    :param headers: optional dict, key is URL, value is dict of HTTP headers e.g. from 'conditional_headers()'
+    """
+    urls = list(dict.fromkeys(url for url in urls if url is not None))
+    if len(urls) == 0:
+        return
+    start = time.perf_counter()
+    responses = fetch_all(urls, headers)
+    _prefetched.update(responses)
+    unchanged = sum(1 for resp in responses.values() if not isinstance(resp, Exception) and resp.status_code == 304)
+    print(f"Fetched {len(urls)} record(s) in {time.perf_counter() - start:.1f}s, {unchanged} unchanged")
@@ -0,0 +1,63 @@
+import os
+import re
+import sys
+import subprocess
+
+"""
+Measures the time taken to import modules, using python's '-X importtime' option in a fresh interpreter
+"""
+
+# A line of '-X importtime' output: 'import time: <self us> | <cumulative us> | <indent><module>'
+IMPORTTIME_REGEX = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$")
+
+# Directory of the source modules, the modules are imported from here
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(output: str) -> list:
+    """
+    Parses the output of python's '-X importtime' option
+
+    :param output: text written to stderr by python
+    :returns: list of (module name, self time, cumulative time, depth) tuples in order of output, times are in seconds,
+              depth is 0 for modules imported directly, 1 for the modules they import etc.
+    """
+    entries = []
+    for line in output.splitlines():
+        match = IMPORTTIME_REGEX.match(line)
+        if match is not None:
+            self_us, cumul_us, indent, module = match.groups()
+            entries.append((module, int(self_us) / 1e6, int(cumul_us) / 1e6, (len(indent) - 1) // 2))
+    return entries
+
+
+def profile_imports(modules: list, args: list = None) -> list:
+    """
+    Imports modules in a new python process and measures the time taken
+
+    :param modules: list of module names
+    :param args: optional list of arguments to run instead of importing modules e.g. ['process.py', '--help']
+    :returns: list of (module name, self time, cumulative time, depth) tuples, see 'parse_importtime()'
+    """
+    if args is None:
+        args = ['-c', f"import {', '.join(modules)}"]
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=SRC_DIR, capture_output=True, text=True)
+    return parse_importtime(proc.stderr)
+
+
+def print_profile(entries: list, modules: list = None, top: int = 15):
+    """
+    Prints an import time breakdown: the modules imported directly and the slowest modules overall
+
+    :param entries: list of (module name, self time, cumulative time, depth) tuples, see 'parse_importtime()'
+    :param modules: optional list of the module names that were imported, used to leave out python's own startup modules
+    :param top: number of slowest modules to print
+    """
+    direct = [entry for entry in entries if entry[3] == 0 and (modules is None or entry[0] in modules)]
+    print(f"Import time: {sum(entry[2] for entry in direct):.2f}s")
+    print("\nModules imported directly:")
+    for module, self_secs, cumul_secs, depth in sorted(direct, key=lambda entry: entry[2], reverse=True):
+        print(f"  {cumul_secs:8.3f}s  {module}")
+    print(f"\nSlowest {top} modules, excluding the modules they import:")
+    for module, self_secs, cumul_secs, depth in sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]:
+        print(f"  {self_secs:8.3f}s  {module}")
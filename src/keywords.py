@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 
 import os
+import re
+import pickle
 import sqlite3
+import threading
+import multiprocessing
 from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
 
 import yake
 
+import disk_cache
+from config import CACHE_DIR, YAKE_BY_SECTION, YAKE_MAX_TOKENS, YAKE_CHUNK_TOKENS, YAKE_WORKERS
+from term_matcher import TermMatcher
+
 
 """
 Uses yake and USGS vocabulary to create geoscience keywords
@@ -13,34 +22,218 @@ Uses yake and USGS vocabulary to create geoscience keywords
     yake:   https://pypi.org/project/yake/
 """
 
-def phrase_in_dict(phrase: str, in_dict: dict) -> (bool, str):
+# USGS Thesaurus DB (https://apps.usgs.gov/thesaurus/)
+THESAURUS_DB = os.path.join(os.path.dirname(__file__), '../db/thesauri.db')
+
+# Pickled lookup table built from the USGS Thesaurus DB, rebuilt when the DB file changes
+TERMS_CACHE_FILE = os.path.join(CACHE_DIR, 'usgs_terms.pickle')
+
+# Lookup table and its term matcher shared by all records in this process, see 'get_db_terms()'
+_kw_lookup = None
+_term_matcher = None
+_kw_lookup_lock = threading.Lock()
+
+# Number of keywords yake extracts from a PDF file
+YAKE_TOP = 500
+
+# yake keyword extractor shared by all records in this process, see 'get_yake_extractor()'
+_yake_extractor = None
+
+# Processes that run yake on the chunks of PDF files, shared by all records, see 'get_yake_pool()'
+_yake_pool = None
+_yake_pool_lock = threading.Lock()
+
+# Markdown heading, group 1 is the level, group 2 is the title
+HEADING_REGEX = re.compile(r"^(#{1,6})\s+(.*)$")
+
+# Sections that are left out of keyword extraction
+SKIP_SECTION_REGEX = re.compile(r"^\W*(\d+(\.\d+)*\W*)?(references|bibliography|acknowledge?ments?|appendix|appendices)\b", re.IGNORECASE)
+
+def phrase_in_dict(phrase: str, in_dict: dict, matcher: TermMatcher = None) -> (bool, str):
     """
-    Returns true if phrase is in in_dict
+    Returns true if a term in in_dict is in phrase
+
+    :param phrase: phrase, one or more words
+    :param in_dict: lookup table mapping terms to keywords
+    :param matcher: optional 'TermMatcher' built from the terms in 'in_dict'
+    :returns: tuple (true if found, keyword of first term found)
     """
-    words = phrase.split(' ')
-    for word in words:
-        if word in in_dict:
-            return True, in_dict[word]
+    if matcher is None:
+        matcher = TermMatcher(in_dict.keys())
+    for term, start, end in matcher.find(phrase):
+        return True, in_dict[term]
     return False, ''
 
-def run_yake(kw_lookup: dict, text: str) -> set:
+def get_yake_extractor() -> yake.KeywordExtractor:
+    """
+    Returns the yake keyword extractor, creating it if necessary
+
+    :returns: yake KeywordExtractor
+    """
+    global _yake_extractor
+    if _yake_extractor is None:
+        _yake_extractor = yake.KeywordExtractor(top=YAKE_TOP)
+    return _yake_extractor
+
+def split_sections(text: str) -> list:
+    """
+    Splits markdown text into sections at its headings.
+    Tables and sections such as references and appendices are left out.
+
+    :param text: markdown text, e.g. from docling
+    :returns: list of sections' text
+    """
+    sections = []
+    lines = []
+    # Level of the heading of the section being skipped, None if not skipping
+    skip_level = None
+    for line in text.splitlines():
+        match = HEADING_REGEX.match(line)
+        if match is not None:
+            level = len(match.group(1))
+            if skip_level is not None and level > skip_level:
+                # Subsection of a skipped section
+                continue
+            skip_level = level if SKIP_SECTION_REGEX.match(match.group(2)) else None
+            if len(lines) > 0:
+                sections.append('\n'.join(lines))
+            lines = []
+            if skip_level is None:
+                lines.append(match.group(2))
+        elif skip_level is None and not line.lstrip().startswith('|'):
+            lines.append(line)
+    if len(lines) > 0:
+        sections.append('\n'.join(lines))
+    return [section.strip() for section in sections if section.strip() != '']
+
+def limit_tokens(sections: list, max_tokens: int) -> list:
+    """
+    Truncates a list of sections so that they have no more than 'max_tokens' words in total
+
+    :param sections: list of sections' text
+    :param max_tokens: maximum number of words
+    :returns: list of sections' text
+    """
+    limited = []
+    total = 0
+    for section in sections:
+        words = section.split()
+        if total + len(words) > max_tokens:
+            remaining = max_tokens - total
+            if remaining > 0:
+                limited.append(' '.join(words[:remaining]))
+            break
+        limited.append(section)
+        total += len(words)
+    return limited
+
+def pack_sections(sections: list, chunk_tokens: int) -> list:
+    """
+    Joins consecutive sections into chunks of up to 'chunk_tokens' words, yake has a large overhead for each
+    piece of text, so it is not run on small sections separately
+
+    :param sections: list of sections' text
+    :param chunk_tokens: maximum number of words in a chunk, unless a single section is larger
+    :returns: list of chunks' text
+    """
+    chunks = []
+    chunk = []
+    chunk_len = 0
+    for section in sections:
+        section_len = len(section.split())
+        if chunk_len + section_len > chunk_tokens and len(chunk) > 0:
+            chunks.append('\n\n'.join(chunk))
+            chunk = []
+            chunk_len = 0
+        chunk.append(section)
+        chunk_len += section_len
+    if len(chunk) > 0:
+        chunks.append('\n\n'.join(chunk))
+    return chunks
+
+def extract_chunk_keywords(chunk: str) -> list:
+    """
+    Runs yake on one chunk of text
+
+    :param chunk: text
+    :returns: list of (keyword, score) tuples, lower scores are better
+    """
+    return get_yake_extractor().extract_keywords(chunk)
+
+def get_yake_pool(workers: int) -> ProcessPoolExecutor | None:
+    """
+    Returns the pool of processes that run yake, starting it upon first use. The pool is reused for all records.
+    Its processes are spawned rather than forked, as this process may have threads running and docling loaded.
+
+    :param workers: number of processes in pool
+    :returns: ProcessPoolExecutor or None if yake should be run in this process
+    """
+    global _yake_pool
+    # Do not start a pool from inside a worker process e.g. one of the processes of 'PDFExtractor.write_records()'
+    if workers <= 1 or multiprocessing.parent_process() is not None:
+        return None
+    with _yake_pool_lock:
+        if _yake_pool is None:
+            _yake_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _yake_pool
+
+def shutdown_yake_pool():
+    """
+    Stops the pool of processes that run yake, if it was started
+    """
+    global _yake_pool
+    with _yake_pool_lock:
+        if _yake_pool is not None:
+            _yake_pool.shutdown()
+            _yake_pool = None
+
+def extract_yake_keywords(text: str, workers: int = 1) -> list:
+    """
+    Runs yake on some text, within the 'YAKE_MAX_TOKENS' word budget.
+    If 'YAKE_BY_SECTION' is set the text is split at its markdown headings, leaving out tables and references,
+    yake is run on chunks of 'YAKE_CHUNK_TOKENS' words and the results are merged,
+    each keyword is given its best score from all the chunks.
+
+    :param text: text
+    :param workers: number of processes used to run yake on the chunks, see 'get_yake_pool()'
+    :returns: list of (keyword, score) tuples, best first
+    """
+    if not YAKE_BY_SECTION:
+        return get_yake_extractor().extract_keywords(' '.join(limit_tokens([text], YAKE_MAX_TOKENS)))
+    chunks = pack_sections(limit_tokens(split_sections(text), YAKE_MAX_TOKENS), YAKE_CHUNK_TOKENS)
+    pool = get_yake_pool(workers) if len(chunks) > 1 else None
+    if pool is not None:
+        results = list(pool.map(extract_chunk_keywords, chunks))
+    else:
+        results = [extract_chunk_keywords(chunk) for chunk in chunks]
+    scores = {}
+    for result in results:
+        for kw, score in result:
+            if kw not in scores or score < scores[kw]:
+                scores[kw] = score
+    return sorted(scores.items(), key=lambda item: item[1])[:YAKE_TOP]
+
+def run_yake(kw_lookup: dict, text: str, matcher: TermMatcher = None, workers: int = 1) -> set:
     """
     Runs yake on some text and returns the top keywords
 
-    :param bw_lookup: lookup table mapping used to categorise geoscience terms into keywords
+    :param kw_lookup: lookup table mapping used to categorise geoscience terms into keywords
     :param text: text to search for keywords
+    :param matcher: optional 'TermMatcher' built from the terms in 'kw_lookup'
+    :param workers: number of processes used to run yake
     :returns: set() of yake's keywords
     """
-    kw_extractor = yake.KeywordExtractor(top=500)
+    if matcher is None:
+        matcher = TermMatcher(kw_lookup.keys())
     # Extracts yakes top keywords
-    keywords = kw_extractor.extract_keywords(text)
+    keywords = extract_yake_keywords(text, workers)
     # Map yakes keywords to USGS keywords
     kw_set = set()
     for kw in keywords:
         if kw[0] in kw_lookup:
             kw_set.add(kw_lookup[kw[0]])
             continue
-        included, kw = phrase_in_dict(kw[0], kw_lookup)
+        included, kw = phrase_in_dict(kw[0], kw_lookup, matcher)
         if included:
             kw_set.add(kw)
     # If no USGS keywords found then just use YAKE's estimates
@@ -62,58 +255,204 @@ CREATE TABLE term (
 def extract_db_terms() -> dict:
     """ Function to create a lookup table that translates geological terms into keywords using USGS vocab
     """
-    keyword_lkup = {}
     name_dict = {}
     link_dict = {}
     # Connect to USGS Thesaurus DB (https://apps.usgs.gov/thesaurus/)
-    db_file = os.path.join(os.path.dirname(__file__), '../db/thesauri.db')
-    with closing(sqlite3.connect(db_file)) as con:
+    with closing(sqlite3.connect(THESAURUS_DB)) as con:
         with closing(con.cursor()) as cur:
             for row in cur.execute("SELECT code, name, parent FROM term"):
                 # print(row)
                 link_dict[row[0]] = row[2]
                 name_dict[row[0]] = row[1]
-    for k,v in link_dict.items():
-        parent = v
-        child = -1
-        gchild = -1
-        ggchild = -1
-        while parent != 1 and parent is not None:
-            ggchild = gchild
-            gchild = child
-            child = parent
-            parent = link_dict[parent]
-        try:
-            if name_dict[ggchild] not in ['chemical elements', 'chemical element groups']:
-                # print("parent of", name_dict[k], "is:  ", name_dict[ggchild]) 
-                keyword_lkup[name_dict[k]] = name_dict[ggchild]
-        except KeyError:
-            pass
+    return build_keyword_lookup(link_dict, name_dict)
+
+
+def resolve_categories(link_dict: dict) -> (dict, set, set):
+    """
+    Finds the category of each term in the USGS vocab hierarchy, i.e. its ancestor three levels below the root.
+    The hierarchy is walked down from the top one level at a time, so each term is visited once and
+    inherits its category from its parent.
+
+    :param link_dict: maps term code to parent term code, terms at the top of the hierarchy have a parent of 1 or None
+    :returns: tuple (categories, cycles, orphans)
+              categories maps term code to the code of its category, or None if it is less than three levels deep
+              or its ancestors cannot be resolved,
+              cycles is a set of term codes that are their own ancestors,
+              orphans is a set of parent codes that are not in 'link_dict'
+    """
+    children = {}
+    for code, parent in link_dict.items():
+        children.setdefault(parent, []).append(code)
+
+    categories = {}
+    # The top level, NB: the children of 1 are already in the top level
+    level = children.get(1, []) + children.get(None, [])
+    for depth in (1, 2, 3):
+        for code in level:
+            categories[code] = code if depth == 3 else None
+        level = [child for code in level if code != 1 for child in children.get(code, ())]
+    # Below the categories each term inherits its parent's category
+    while len(level) > 0:
+        next_level = []
+        for code in level:
+            categories[code] = categories[link_dict[code]]
+            if code in children:
+                next_level += children[code]
+        level = next_level
+
+    # Terms not reached from the top are below a cycle or a missing parent
+    cycles = set()
+    orphans = set()
+    if len(categories) < len(link_dict):
+        for code in link_dict:
+            if code in categories:
+                continue
+            path = []
+            node = code
+            while node in link_dict and node not in categories and node not in path:
+                path.append(node)
+                node = link_dict[node]
+            if node in path:
+                cycles.update(path[path.index(node):])
+            elif node not in link_dict:
+                orphans.add(node)
+            for path_node in path:
+                categories[path_node] = None
+    return categories, cycles, orphans
+
+
+def build_keyword_lookup(link_dict: dict, name_dict: dict) -> dict:
+    """
+    Creates a lookup table that maps the name of each term to the name of its parent's category
+
+    :param link_dict: maps term code to parent term code
+    :param name_dict: maps term code to term name
+    :returns: lookup table, maps a variety of geoscience words to keywords
+    """
+    categories, cycles, orphans = resolve_categories(link_dict)
+    if len(cycles) > 0:
+        print(f"WARNING: USGS vocab has a cycle in its hierarchy, ignoring terms: {sorted(cycles)}")
+    if len(orphans) > 0:
+        print(f"WARNING: USGS vocab has unknown parent terms, ignoring their descendants: {sorted(orphans)}")
+    # Keyword for each category, None if the category is excluded
+    category_keywords = {None: None}
+    for category in set(categories.values()):
+        if category is not None and name_dict[category] not in ['chemical elements', 'chemical element groups']:
+            category_keywords[category] = name_dict[category]
+        else:
+            category_keywords[category] = None
+    keyword_lkup = {}
+    for code, parent in link_dict.items():
+        keyword = category_keywords[categories.get(parent)]
+        if keyword is not None:
+            keyword_lkup[name_dict[code]] = keyword
     return keyword_lkup
 
-def run_usgs(kw_dict: dict, text: str) -> set:
+
+def __load_terms_cache(db_stamp: tuple) -> dict | None:
+    """
+    Loads the pickled lookup table if it was built from the current version of the DB
+
+    :param db_stamp: (modification time, size) of the DB file
+    :returns: lookup table or None if there is no usable cache file
+    """
+    if disk_cache.cache_mode != disk_cache.CACHE_USE:
+        return None
+    try:
+        with open(TERMS_CACHE_FILE, 'rb') as fd:
+            cached = pickle.load(fd)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if not isinstance(cached, dict) or cached.get('db_stamp') != db_stamp:
+        return None
+    return cached.get('lookup')
+
+
+def __save_terms_cache(db_stamp: tuple, kw_lookup: dict):
+    """
+    Pickles the lookup table, along with the version of the DB it was built from
+
+    :param db_stamp: (modification time, size) of the DB file
+    :param kw_lookup: lookup table
+    """
+    if disk_cache.cache_mode == disk_cache.CACHE_OFF:
+        return
+    disk_cache.atomic_write(TERMS_CACHE_FILE, pickle.dumps({'db_stamp': db_stamp, 'lookup': kw_lookup}, protocol=pickle.HIGHEST_PROTOCOL),
+                            'cache file')
+
+
+def get_db_terms() -> dict:
+    """
+    Returns the lookup table that translates geological terms into keywords using USGS vocab.
+    It is built once per process, and kept on disk until the DB file changes.
+
+    :returns: lookup table, maps a variety of geoscience words to keywords
+    """
+    global _kw_lookup
+    with _kw_lookup_lock:
+        if _kw_lookup is None:
+            # NB: Also stops sqlite from creating an empty DB if the file is missing
+            st = os.stat(THESAURUS_DB)
+            db_stamp = (st.st_mtime_ns, st.st_size)
+            kw_lookup = __load_terms_cache(db_stamp)
+            if kw_lookup is None:
+                kw_lookup = extract_db_terms()
+                __save_terms_cache(db_stamp, kw_lookup)
+            _kw_lookup = kw_lookup
+        return _kw_lookup
+
+
+def get_db_terms_matcher() -> (dict, TermMatcher):
+    """
+    Returns the lookup table from 'get_db_terms()' and a 'TermMatcher' for its terms, built once per process
+
+    :returns: tuple (lookup table, TermMatcher)
+    """
+    global _term_matcher
+    kw_lookup = get_db_terms()
+    with _kw_lookup_lock:
+        if _term_matcher is None:
+            _term_matcher = TermMatcher(kw_lookup.keys())
+        return kw_lookup, _term_matcher
+
+def run_usgs(kw_dict: dict, text: str, matcher: TermMatcher = None) -> set:
     """
     Looks for keywords using USGS vocabulary
 
     :param kw_dict: keyword dict extracted from USGS vocab - maps a variety of geoscience words to keywords
     :param text: text in which to look for keywords
+    :param matcher: optional 'TermMatcher' built from the terms in 'kw_dict'
     :returns: set() of keywords
     """
-    kw_set = set()
-    text = text.replace('\n',' ')
-    for word in text.split(' '):
-        if word.isalpha() and word in kw_dict:
-            kw_set.add(kw_dict[word])
-    return kw_set    
+    if matcher is None:
+        matcher = TermMatcher(kw_dict.keys())
+    return set(kw_dict[term] for term in matcher.count(text))
+
+def rank_keywords(kw_set: set, kw_dict: dict, text: str, matcher: TermMatcher) -> list:
+    """
+    Ranks keywords by the number of times their USGS vocab terms appear in the text
+
+    :param kw_set: set of keywords
+    :param kw_dict: keyword dict extracted from USGS vocab - maps a variety of geoscience words to keywords
+    :param text: text
+    :param matcher: 'TermMatcher' built from the terms in 'kw_dict'
+    :returns: list of keywords, most frequent first
+    """
+    hits = {}
+    for term, count in matcher.count(text).items():
+        hits[kw_dict[term]] = hits.get(kw_dict[term], 0) + count
+    return sorted(kw_set, key=lambda kw: (-hits.get(kw, 0), kw))
 
-def get_keywords(text: str) -> set:
+def get_keywords(text: str, workers: int = YAKE_WORKERS) -> list:
     """
     Extracts keywords from text
 
     :param text: text
-    :returns: set of geoscience keywords
+    :param workers: number of processes used to run yake
+    :returns: list of geoscience keywords, most frequent first
     """
-    # Creates lookup table using USGS Thesaurus
-    kw_dict = extract_db_terms()
+    # Lookup table using USGS Thesaurus
+    kw_dict, matcher = get_db_terms_matcher()
     # Runs yake and matches yake's keywords with USGS Thesaurus
-    return run_yake(kw_dict, text)
+    kw_set = run_yake(kw_dict, text, matcher, workers)
+    return rank_keywords(kw_set, kw_dict, text, matcher)
@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import threading
+
+from config import CACHE_DIR
+from disk_cache import atomic_write_json, load_json
+
+"""
+Build manifest: a record of the inputs of each output XML file, so that a record is only rebuilt when its inputs change
+
+The inputs of a record are its config parameters (including its bounding box), the extractor's options and
+settings (e.g. the summariser's model and prompt), the templates in 'data/templates' and its source. A source is either a local file, identified by its hash, or a URL,
+identified by its HTTP 'ETag' and 'Last-Modified' headers, or by a hash of its content if the server sends neither.
+"""
+
+# File that holds the manifest
+MANIFEST_FILE = os.path.join(CACHE_DIR, 'build_manifest.json')
+
+# Directory of jinja templates used to render records
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'templates')
+
+# Changing this rebuilds every record
+MANIFEST_VERSION = 1
+
+# Hashes of template directories, calculated once per run
+_templates_hashes = {}
+
+
+def file_sha256(path: str) -> str:
+    """
+    :param path: path of file
+    :returns: SHA256 hex digest of file's content
+    """
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as fd:
+        for block in iter(lambda: fd.read(1024 * 1024), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def templates_hash(templates_dir: str = TEMPLATES_DIR) -> str:
+    """
+    Hashes the names and contents of all the files in a templates directory
+
+    :param templates_dir: templates directory
+    :returns: SHA256 hex digest
+    """
+    if templates_dir not in _templates_hashes:
+        hasher = hashlib.sha256()
+        for dirpath, dirnames, filenames in os.walk(templates_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                hasher.update(os.path.relpath(path, templates_dir).encode('utf-8'))
+                hasher.update(bytes.fromhex(file_sha256(path)))
+        _templates_hashes[templates_dir] = hasher.hexdigest()
+    return _templates_hashes[templates_dir]
+
+
+def inputs_hash(method: str, params: dict, options: dict, source: dict, settings: dict = None) -> str:
+    """
+    Hashes the inputs of a record
+
+    :param method: name of extractor e.g. 'PDFExtractor'
+    :param params: config parameters of record, including its bounding box
+    :param options: keyword arguments of extractor e.g. {'summariser': 'ollama'}
+    :param source: state of source e.g. {'sha256': '...'} or {'etag': '...', 'last_modified': '...'}
+    :param settings: optional settings of extractor, see 'Extractor.input_settings()'
+    :returns: SHA256 hex digest
+    """
+    inputs = {
+        'version': MANIFEST_VERSION,
+        'method': method,
+        'params': params,
+        'options': options,
+        'source': source,
+        'settings': settings or {},
+        'templates': templates_hash()
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class BuildManifest:
+    """
+    Maps each output file to the hash of the inputs it was built from and the state of its source
+    """
+
+    def __init__(self, manifest_file: str = MANIFEST_FILE):
+        """
+        :param manifest_file: JSON file that holds the manifest, created upon first save
+        """
+        self.manifest_file = manifest_file
+        self.lock = threading.Lock()
+        manifest = load_json(manifest_file, {})
+        if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+            manifest = {}
+        self.entries = manifest.get('outputs', {})
+
+    def get(self, output_path: str) -> dict | None:
+        """
+        :param output_path: path of output file
+        :returns: dict with 'inputs' hash and 'source' state, or None if the file is not in the manifest
+        """
+        with self.lock:
+            return self.entries.get(os.path.abspath(output_path))
+
+    def is_fresh(self, output_path: str, digest: str) -> bool:
+        """
+        Is an output file up to date?
+
+        :param output_path: path of output file
+        :param digest: hash of the record's current inputs, see 'inputs_hash()'
+        :returns: True if the file exists and was built from the same inputs
+        """
+        entry = self.get(output_path)
+        return entry is not None and entry.get('inputs') == digest and os.path.exists(output_path)
+
+    def record(self, output_path: str, digest: str, source: dict | None):
+        """
+        Records the inputs of an output file that has just been built
+
+        :param output_path: path of output file
+        :param digest: hash of the record's inputs, see 'inputs_hash()'
+        :param source: state of source
+        """
+        with self.lock:
+            self.entries[os.path.abspath(output_path)] = {'inputs': digest, 'source': source}
+
+    def save(self):
+        """
+        Writes out the manifest
+        """
+        with self.lock:
+            manifest = {'version': MANIFEST_VERSION, 'outputs': dict(self.entries)}
+        atomic_write_json(self.manifest_file, manifest, 'build manifest', indent=1)
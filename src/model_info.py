@@ -0,0 +1,189 @@
+import os
+import glob
+import json
+
+import disk_cache
+from config import GEOMODELS_DIR, CACHE_DIR
+
+"""
+Bounding boxes of the geomodels, read from the model JSON files of the geomodel portal
+
+The extents in the model files are transformed from the model's CRS into EPSG:4326. Points along the edges of each
+extent are transformed, not just its corners, because straight edges in the model's CRS may be curved in EPSG:4326.
+The extents of all the models in the same CRS are transformed together.
+Results are kept in memory for the rest of the run and in a JSON cache file on disk, entries for a model file are
+reused until the file's modification time or size changes.
+"""
+
+# Persistent cache of model file info and bounding boxes
+MODEL_INFO_CACHE_FILE = os.path.join(CACHE_DIR, 'model_info.json')
+
+# Portal file in the geomodels directory that is not a model file
+PROVIDER_INFO_FILE = 'ProviderModelInfo.json'
+
+# Number of points along each edge of an extent that are transformed
+DENSIFY_PTS = 21
+
+# Transformers from each source CRS to EPSG:4326, creating them is slow
+_transformers = {}
+
+# Bounding boxes found in this run, key is geomodels directory, value is dict of model name -> bounding box
+_model_info = {}
+
+
+def get_transformer(crs: str):
+    """
+    Returns a transformer from a CRS to EPSG:4326, creating it upon first use
+
+    :param crs: CRS string from model file e.g. 'EPSG:28354'
+    :returns: pyproj Transformer object
+    """
+    if crs not in _transformers:
+        # pyproj is only needed when a bounding box is not in the cache
+        from pyproj import CRS, Transformer
+        _transformers[crs] = Transformer.from_crs(CRS.from_string(crs), CRS.from_epsg(4326))
+    return _transformers[crs]
+
+
+def edge_points(extent: list, densify_pts: int = DENSIFY_PTS) -> tuple:
+    """
+    Makes points along the edges of an extent
+
+    :param extent: [west, east, south, north]
+    :param densify_pts: number of points along each edge, including its corners
+    :returns: x and y numpy arrays of points, going around the extent
+    """
+    # numpy is only needed when a bounding box is not in the cache
+    import numpy as np
+    west, east, south, north = extent
+    steps = np.linspace(0.0, 1.0, densify_pts)
+    xs = west + (east - west) * steps
+    ys = south + (north - south) * steps
+    x = np.concatenate([xs, np.full(densify_pts, east), xs[::-1], np.full(densify_pts, west)])
+    y = np.concatenate([np.full(densify_pts, south), ys, np.full(densify_pts, north), ys[::-1]])
+    return x, y
+
+
+def model_bboxes(crs: str, extents: list) -> list:
+    """
+    Transforms the extents of models in the same CRS into bounding boxes in EPSG:4326
+
+    :param crs: CRS string from model files e.g. 'EPSG:28354'
+    :param extents: list of [west, east, south, north] in model's CRS
+    :returns: list of dicts, keys are 'south', 'west', 'north' and 'east', values are degrees
+    """
+    import numpy as np
+    points = [edge_points(extent) for extent in extents]
+    x = np.stack([x for x, y in points])
+    y = np.stack([y for x, y in points])
+    lat, lon = get_transformer(crs).transform(x.ravel(), y.ravel())
+    # Points that cannot be transformed are infinite
+    lat = np.where(np.isfinite(lat), lat, np.nan).reshape(x.shape)
+    lon = np.where(np.isfinite(lon), lon, np.nan).reshape(x.shape)
+    south, north = np.nanmin(lat, axis=1), np.nanmax(lat, axis=1)
+    west, east = np.nanmin(lon, axis=1), np.nanmax(lon, axis=1)
+    return [{'south': float(south[idx]), 'west': float(west[idx]), 'north': float(north[idx]), 'east': float(east[idx])}
+            for idx in range(len(extents))]
+
+
+def file_stamp(path: str) -> list:
+    """
+    :param path: path of file
+    :returns: [modification time in ns, size in bytes] of file
+    """
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def read_model_file(jfile: str) -> dict | None:
+    """
+    Reads the name, CRS and extent from a model file
+
+    :param jfile: path of model JSON file
+    :returns: dict with 'name', 'crs' and 'extent' keys or None if file cannot be read
+    """
+    try:
+        with open(jfile) as fd:
+            props = json.load(fd)['properties']
+        return {'name': props['name'], 'crs': props['crs'], 'extent': props['extent']}
+    except (OSError, ValueError, KeyError, TypeError) as err:
+        print(f"WARNING: Cannot read model info from {jfile}: {err}")
+        return None
+
+
+def __load_cache(cache_file: str, src_dir: str) -> dict:
+    """
+    Loads the cached model file entries
+
+    :param cache_file: path of JSON cache file
+    :param src_dir: geomodels directory, the cache is only used if it was built from the same directory
+    :returns: dict, key is model filename, value is dict of 'stamp', 'name', 'crs', 'extent' and 'bbox'
+    """
+    if disk_cache.cache_mode != disk_cache.CACHE_USE:
+        return {}
+    cached = disk_cache.load_json(cache_file)
+    if not isinstance(cached, dict) or cached.get('src_dir') != os.path.abspath(src_dir) \
+            or cached.get('densify_pts') != DENSIFY_PTS:
+        return {}
+    return cached.get('files', {})
+
+
+def __save_cache(cache_file: str, src_dir: str, files: dict):
+    """
+    Writes out the model file entries
+
+    :param cache_file: path of JSON cache file
+    :param src_dir: geomodels directory
+    :param files: dict, key is model filename, value is dict of 'stamp', 'name', 'crs', 'extent' and 'bbox'
+    """
+    if disk_cache.cache_mode == disk_cache.CACHE_OFF:
+        return
+    disk_cache.atomic_write_json(cache_file, {'src_dir': os.path.abspath(src_dir), 'densify_pts': DENSIFY_PTS, 'files': files},
+                                 'cache file')
+
+
+def get_model_info(names=None, src_dir: str = GEOMODELS_DIR, cache_file: str = MODEL_INFO_CACHE_FILE) -> dict:
+    """
+    Extracts a little info from model files
+
+    :param names: optional iterable of model names, only the bounding boxes of these models are calculated
+    :param src_dir: directory of geomodel JSON files
+    :param cache_file: path of JSON cache file
+    :returns: a dict: key is model name, val is dict of 'south', 'west', 'north', 'east' in EPSG:4326 coords in degrees
+    """
+    wanted = None if names is None else set(names)
+    bboxes = _model_info.setdefault(src_dir, {})
+    if wanted is not None and wanted <= bboxes.keys():
+        return {name: bboxes[name] for name in wanted}
+
+    cached = __load_cache(cache_file, src_dir)
+    files = {}
+    changed = False
+    # Entries that need a bounding box, grouped by CRS
+    by_crs = {}
+    for jfile in sorted(glob.glob(os.path.join(src_dir, "*.json"))):
+        filename = os.path.basename(jfile)
+        # Skip 'ProviderModelInfo.json' it is not a model file
+        if filename == PROVIDER_INFO_FILE:
+            continue
+        stamp = file_stamp(jfile)
+        entry = cached.get(filename)
+        if entry is None or entry.get('stamp') != stamp:
+            info = read_model_file(jfile)
+            if info is None:
+                continue
+            entry = {'stamp': stamp, **info, 'bbox': None}
+            changed = True
+        if entry['bbox'] is None and (wanted is None or entry['name'] in wanted):
+            by_crs.setdefault(entry['crs'], []).append(entry)
+        files[filename] = entry
+    for crs, entries in by_crs.items():
+        for entry, bbox in zip(entries, model_bboxes(crs, [entry['extent'] for entry in entries])):
+            entry['bbox'] = bbox
+        changed = True
+    for entry in files.values():
+        if entry['bbox'] is not None:
+            bboxes[entry['name']] = entry['bbox']
+    if changed or files.keys() != cached.keys():
+        __save_cache(cache_file, src_dir, files)
+    return {name: bbox for name, bbox in bboxes.items() if wanted is None or name in wanted}
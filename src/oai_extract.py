@@ -1,11 +1,131 @@
 import os
+import time
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
+from requests.adapters import HTTPAdapter
 from pygeometa.core import render_j2_template
 from sickle import Sickle
+from sickle.oaiexceptions import NoRecordsMatch
 
+import disk_cache
 from extractor import Extractor
 from local_types import Coords
+from config import CACHE_DIR, OAI_MAX_CONCURRENCY, OAI_ATTEMPTS, OAI_BACKOFF, OAI_MAX_RETRY_AFTER, OAI_TIMEOUT
+
+# Harvest state, key is OAI-PMH URL, prefix and set, value is the last datestamp harvested and the ids that were wanted
+HARVEST_STATE_FILE = os.path.join(CACHE_DIR, 'oai_harvest.json')
+
+# HTTP status codes that are retried
+RETRY_STATUS = (429, 503)
+
+# OAI-PMH clients, one per service URL, see 'get_client()'
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class SessionSickle(Sickle):
+    """
+    Sickle client that sends its requests through a shared HTTP session, keeping connections alive between requests.
+    Requests that are refused with '503 Service Unavailable' or '429 Too Many Requests' are retried after the delay
+    given in the 'Retry-After' header, or with exponential backoff if there is none. The latency of each request is logged.
+    """
+
+    def __init__(self, endpoint: str, session: requests.Session, **kwargs):
+        """
+        :param endpoint: OAI-PMH service URL
+        :param session: requests Session object
+        :param kwargs: keyword arguments of 'Sickle'
+        """
+        super().__init__(endpoint, **kwargs)
+        self.session = session
+
+    def retry_delay(self, attempt: int, response: requests.Response) -> float | None:
+        """
+        Decides whether to retry a request
+
+        :param attempt: number of attempts made so far
+        :param response: response
+        :returns: delay in seconds before the next attempt, or None if there should be no retry
+        """
+        if attempt >= OAI_ATTEMPTS or response.status_code not in RETRY_STATUS:
+            return None
+        try:
+            return min(float(response.headers['Retry-After']), OAI_MAX_RETRY_AFTER)
+        except (KeyError, ValueError):
+            # 'Retry-After' is missing or is a date
+            return OAI_BACKOFF * 2 ** (attempt - 1)
+
+    def _request(self, kwargs: dict) -> requests.Response:
+        attempt = 0
+        while True:
+            attempt += 1
+            start = time.perf_counter()
+            if self.http_method == 'GET':
+                response = self.session.get(self.endpoint, params=kwargs, **self.request_args)
+            else:
+                response = self.session.post(self.endpoint, data=kwargs, **self.request_args)
+            print(f"OAI-PMH {kwargs.get('verb')} {kwargs.get('identifier', '')} took {time.perf_counter() - start:.2f}s,"
+                  f" status {response.status_code}")
+            delay = self.retry_delay(attempt, response)
+            if delay is None:
+                return response
+            time.sleep(delay)
+
+
+def get_client(oai_url: str) -> SessionSickle:
+    """
+    Returns the client for an OAI-PMH service, creating it if necessary.
+    There is one client and HTTP session per service, shared by all threads.
+
+    :param oai_url: OAI-PMH service URL
+    :returns: SessionSickle object
+    """
+    with _clients_lock:
+        if oai_url not in _clients:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OAI_MAX_CONCURRENCY)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _clients[oai_url] = SessionSickle(oai_url, session, timeout=OAI_TIMEOUT)
+        return _clients[oai_url]
+
+
+def harvest_key(oai_url: str, oai_prefix: str, oai_set: str | None) -> str:
+    """
+    :param oai_url: OAI-PMH service URL
+    :param oai_prefix: OAI-PMH metadata prefix
+    :param oai_set: OAI-PMH set or None
+    :returns: key of harvest state
+    """
+    return f"{oai_url} {oai_prefix} {oai_set or ''}"
+
+
+def load_harvest_state(state_file: str = HARVEST_STATE_FILE) -> dict:
+    """
+    Reads the state of previous harvests
+
+    :param state_file: JSON state file
+    :returns: dict, key is from 'harvest_key()', value is dict with 'datestamp' and 'ids' keys
+    """
+    if disk_cache.cache_mode != disk_cache.CACHE_USE:
+        return {}
+    state = disk_cache.load_json(state_file)
+    return state if isinstance(state, dict) else {}
+
+
+def save_harvest_state(state: dict, state_file: str = HARVEST_STATE_FILE):
+    """
+    Writes out the state of harvests
+
+    :param state: dict, key is from 'harvest_key()', value is dict with 'datestamp' and 'ids' keys
+    :param state_file: JSON state file
+    """
+    if disk_cache.cache_mode == disk_cache.CACHE_OFF:
+        return
+    disk_cache.atomic_write_json(state_file, state, 'OAI-PMH harvest state', indent=1)
 
 
 class OaiExtractor(Extractor):
@@ -150,9 +270,7 @@ class OaiExtractor(Extractor):
         :returns: boolean success indicator
         """
         print(f"Converting: {model_endpath}")
-        # Open connection to OAI-PMH
-        sickle = Sickle(self.OAI_URL)
-        rec = sickle.GetRecord(identifier=oai_id, metadataPrefix=oai_prefix)
+        rec = get_client(self.OAI_URL).GetRecord(identifier=oai_id, metadataPrefix=oai_prefix)
 
         oai_dict = rec.get_metadata()
         #for k, v in oai_dict.items():
@@ -160,3 +278,77 @@ class OaiExtractor(Extractor):
 
         return self.output_xml(oai_dict, oai_id, bbox, model_endpath, service_name, output_file)
 
+    def write_records(self, param_list: list, jobs: int = 1) -> list:
+        """
+        Writes out a record for each set of parameters, fetching up to 'OAI_MAX_CONCURRENCY' records at the same time
+
+        :param param_list: list of dicts, each dict is the parameters of 'write_record()'
+        :param jobs: number of parallel jobs, not used, the service's concurrency limit applies instead
+        :returns: list of (params, error message) tuples, one for each record that failed
+        """
+        with ThreadPoolExecutor(max_workers=OAI_MAX_CONCURRENCY) as executor:
+            errors = list(executor.map(self.try_write_record, param_list))
+        return [(params, error) for params, error in zip(param_list, errors) if error is not None]
+
+    def harvest(self, param_list: list, oai_set: str = None, from_date: str = None, until_date: str = None,
+                force: bool = False, state_file: str = HARVEST_STATE_FILE) -> list:
+        """
+        Writes out records by harvesting the OAI-PMH service with 'ListRecords', instead of fetching each record.
+        The service's pages of records are read one at a time, following resumption tokens, and the records with
+        configured ids are written out as they arrive.
+        Unless 'from_date' is given, only records added or changed since the last harvest are requested.
+        Configured records that are not harvested are fetched with 'GetRecord' if they have not been written out yet.
+
+        :param param_list: list of dicts, each dict is the parameters of 'write_record()'
+        :param oai_set: optional OAI-PMH set to harvest
+        :param from_date: optional earliest datestamp to harvest e.g. '2024-01-31'
+        :param until_date: optional latest datestamp to harvest
+        :param force: if True, harvest all records, not just those changed since the last harvest
+        :param state_file: JSON file that holds the last datestamp of each harvest
+        :returns: list of (params, error message) tuples, one for each record that failed
+        """
+        failures = []
+        state = load_harvest_state(state_file)
+        for oai_prefix in dict.fromkeys(params['oai_prefix'] for params in param_list):
+            wanted = {params['oai_id']: params for params in param_list if params['oai_prefix'] == oai_prefix}
+            key = harvest_key(self.OAI_URL, oai_prefix, oai_set)
+            prev = state.get(key, {})
+            # Harvest incrementally if the same records were harvested before
+            incremental = not force and from_date is None and 'datestamp' in prev and set(wanted) <= set(prev.get('ids', []))
+            args = {'metadataPrefix': oai_prefix}
+            for arg, val in [('set', oai_set), ('from', prev.get('datestamp') if incremental else from_date),
+                             ('until', until_date)]:
+                if val is not None:
+                    args[arg] = val
+            print(f"Harvesting {self.OAI_URL} {args}")
+            pending = dict(wanted)
+            datestamp = prev.get('datestamp') if incremental else None
+            try:
+                for rec in get_client(self.OAI_URL).ListRecords(ignore_deleted=True, **args):
+                    if datestamp is None or rec.header.datestamp > datestamp:
+                        datestamp = rec.header.datestamp
+                    params = pending.pop(rec.header.identifier, None)
+                    if params is None:
+                        continue
+                    print(f"Converting: {params['model_endpath']}")
+                    try:
+                        if not self.output_xml(rec.metadata, params['oai_id'], params['bbox'], params['model_endpath'],
+                                               params['service_name'], params['output_file']):
+                            failures.append((params, "Could not write record"))
+                    except Exception as e:
+                        failures.append((params, f"{type(e).__name__}: {e}"))
+            except NoRecordsMatch:
+                pass
+            except Exception as e:
+                failures += [(params, f"Harvest failed, {type(e).__name__}: {e}") for params in pending.values()]
+                continue
+            if datestamp is not None:
+                state[key] = {'datestamp': datestamp, 'ids': sorted(wanted)}
+            # Records that were not harvested have not changed, unless they have never been written out
+            for params in pending.values():
+                if not incremental or not os.path.exists(os.path.join(self.output_dir, params['output_file'])):
+                    error = self.try_write_record(params)
+                    if error is not None:
+                        failures.append((params, error))
+        save_harvest_state(state, state_file)
+        return failures
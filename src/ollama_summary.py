@@ -1,17 +1,56 @@
 
 import ollama
 
+from config import OLLAMA_MAX_CONCURRENCY, OLLAMA_BATCH_SIZE
+
 # Choose your model
 # Run 'ollama pull deepseek-r1:8b' to fetch it
 model = "deepseek-r1:8b"
 
+# Summarization prompt
+PROMPT = "Summarize the following text:\n{text}"
+
+# Summariser backend settings, see 'summary.py'
+MAX_CONCURRENCY = OLLAMA_MAX_CONCURRENCY
+BATCH_SIZE = OLLAMA_BATCH_SIZE
+ATTRIBUTION = ''
+
 def ollama_summary(text: str) -> str:
 
     # Create a summarization prompt
-    prompt = f"Summarize the following text:\n{text}"
+    prompt = PROMPT.format(text=text)
 
     # Generate the summary
     response = ollama.chat(model=model, messages=[{"role": "user", "content": prompt}])
 
     # Return the result
     return response['message']['content']
+
+
+def ollama_stream(text: str, usage: dict):
+    """
+    Streams a summary of some text, a chunk at a time
+
+    :param text: text string to be summarized
+    :param usage: dict, 'output_tokens' is set to the number of generated tokens upon completion
+    :returns: iterator of summary text chunks
+    """
+    prompt = PROMPT.format(text=text)
+    for chunk in ollama.chat(model=model, messages=[{"role": "user", "content": prompt}], stream=True):
+        yield chunk['message']['content']
+        if chunk.get('done'):
+            usage['output_tokens'] = chunk.get('eval_count')
+
+
+def cache_settings() -> dict:
+    """
+    Settings that change the summaries
+
+    :returns: dict of settings
+    """
+    return {'model': model, 'prompt': PROMPT}
+
+
+# Summariser backend functions, see 'summary.py'
+summarise = ollama_summary
+stream = ollama_stream
@@ -1,18 +1,67 @@
 import os
 import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from pygeometa.core import render_j2_template
-from pdf_helper import parse_docling
+from pdf_helper import DocumentCache, DOC_CACHE
 
 from extractor import Extractor
-from keywords import get_keywords
-from summary import get_summary
+from config import SUMMARISER
+from keywords import get_keywords, THESAURUS_DB
+from summary import get_summary, summariser_settings
+from model_info import file_stamp
 from local_types import Coords
 
+def extract_text_keywords(pdf_file: str) -> (str, list):
+    """
+    Parses a PDF file and extracts its keywords
+    This is the CPU bound part of creating a PDF record, so it is run in a separate process
+
+    :param pdf_file: path to PDF file
+    :returns: text of PDF file, list of keywords
+    """
+    pdf_text = DOC_CACHE.get_text(pdf_file)
+    # Already running in a worker process, so do not start another pool of processes for yake
+    return pdf_text, get_keywords(pdf_text, workers=1)
+
+
 class PDFExtractor(Extractor):
     """ Creates an ISO 19115 XML file by reading a PDF file
     """
 
+    def __init__(self, doc_cache: DocumentCache = DOC_CACHE, summariser: str = None):
+        """
+        :param doc_cache: cache of PDF text, shared so that each PDF file is only parsed once per run
+        :param summariser: optional name of summariser backend e.g. 'ollama', defaults to 'SUMMARISER' in config
+        """
+        super().__init__()
+        self.doc_cache = doc_cache
+        self.summariser = summariser
+
+    @staticmethod
+    def source_file(params: dict) -> str:
+        """
+        Returns the PDF file of a record
+
+        :param params: parameters of 'write_record()'
+        :returns: path of PDF file
+        """
+        return params['pdf_file']
+
+    @staticmethod
+    def input_settings(options: dict) -> dict:
+        """
+        Returns the summariser backend's settings and the state of the thesaurus DB used to find keywords
+
+        :param options: keyword arguments of the constructor
+        :returns: dict of settings
+        """
+        settings = {'summariser': summariser_settings(options.get('summariser') or SUMMARISER)}
+        if os.path.exists(THESAURUS_DB):
+            settings['thesaurus'] = file_stamp(THESAURUS_DB)
+        return settings
+
     def write_record(self, name: str, model_endpath: str, pdf_file: str, pdf_url: str, organisation: str, title: str, bbox: Coords, output_file: str) -> bool:
         """
         Write XML record
@@ -32,12 +81,79 @@ class PDFExtractor(Extractor):
             print(f"{pdf_file} does not exist")
             return False
         # Extract keywords from PDF text
-        pdf_text = parse_docling(pdf_file)
+        pdf_text = self.doc_cache.get_text(pdf_file)
         kwset = get_keywords(pdf_text)
-        summary = get_summary(pdf_file)
+        summary = get_summary(pdf_text, pdf_file, self.summariser)
+        return self.output_xml(name, model_endpath, pdf_url, organisation, title, bbox, output_file, kwset, summary)
+
+    def write_records(self, param_list: list, jobs: int = 1) -> list:
+        """
+        Writes out a PDF record for each set of parameters
+        When 'jobs' > 1 PDF files are parsed and their keywords extracted in a pool of processes,
+        while the summaries are generated in a pool of threads. Records are written out in the order given.
+        The processes are spawned rather than forked, as this process may have docling's threads running.
+
+        :param param_list: list of dicts, each dict is the parameters of 'write_record()'
+        :param jobs: number of parallel jobs
+        :returns: list of (params, error message) tuples, one for each record that failed
+        """
+        if jobs <= 1:
+            return super().write_records(param_list, jobs)
+        failures = []
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn')) as process_pool, ThreadPoolExecutor(max_workers=jobs) as thread_pool:
+            summary_futures = []
+            for params in param_list:
+                if os.path.exists(params.get('pdf_file', '')):
+                    extract_future = process_pool.submit(extract_text_keywords, params['pdf_file'])
+                    summary_futures.append(thread_pool.submit(self.__summarise, extract_future, params['pdf_file']))
+                else:
+                    summary_futures.append(None)
+            # Write out records in config order so that the output is deterministic
+            for params, future in zip(param_list, summary_futures):
+                print(f"Converting: {params.get('model_endpath')}")
+                if future is None:
+                    failures.append((params, f"{params.get('pdf_file')} does not exist"))
+                    continue
+                try:
+                    kwset, summary = future.result()
+                    out_params = {k: v for k, v in params.items() if k != 'pdf_file'}
+                    if not self.output_xml(keywords=kwset, summary=summary, **out_params):
+                        failures.append((params, "Could not write record"))
+                except Exception as e:
+                    failures.append((params, f"{type(e).__name__}: {e}"))
+        return failures
+
+    def __summarise(self, extract_future, pdf_file: str) -> (list, str):
+        """
+        Waits for a PDF file to be parsed then summarises its text
+
+        :param extract_future: future of 'extract_text_keywords()'
+        :param pdf_file: path to PDF file
+        :returns: list of keywords, summary
+        """
+        pdf_text, kwset = extract_future.result()
+        self.doc_cache.add(pdf_file, pdf_text)
+        return kwset, get_summary(pdf_text, pdf_file, self.summariser)
+
+    def output_xml(self, name: str, model_endpath: str, pdf_url: str, organisation: str, title: str, bbox: Coords, output_file: str,
+                   keywords: list, summary: str) -> bool:
+        """
+        Uses jinja template to write out an ISO 19115-3 XML record
+
+        :param name: model name used in download links in record
+        :param model_endpath: path of model in website, used to create a link to website URL
+        :param pdf_url: URL for PDF file
+        :param organisation: name of organisation
+        :param title: title
+        :param bbox: bounding box coords, dict, keys are 'north', 'south' etc.
+        :param output_file: output filename e.g. 'blah.xml'
+        :param keywords: list of keywords extracted from PDF file, most relevant first
+        :param summary: summary of PDF file
+        :returns: boolean
+        """
         now = datetime.datetime.now()
         date_str = now.strftime("%d/%m/%Y")
-        keywords = list(kwset)
+        keywords = list(keywords)
         bbox_list = [str(bbox['west']), str(bbox['east']), str(bbox['south']), str(bbox['north'])]
 
         # Remove encodings that can upset XML
@@ -150,7 +266,6 @@ class PDFExtractor(Extractor):
             xml_string = render_j2_template(mcf_dict, template_dir=template_dir)
         except Exception as e:
             print(f"ERROR - jinja error {e} {mcf_dict=} {template_dir=}")
-            sys.exit(1)
             return False
 
         # write to disk
@@ -1,12 +1,177 @@
-from docling.document_converter import DocumentConverter
+import os
+import json
+import time
+import hashlib
+import threading
+from importlib.metadata import version, PackageNotFoundError
+
+from docling.datamodel.base_models import InputFormat
+from docling.datamodel.pipeline_options import PdfPipelineOptions
+from docling.document_converter import DocumentConverter, PdfFormatOption
+
+from disk_cache import DiskCache
+from config import CACHE_DIR, DOCLING_CACHE_MAX_BYTES
+
+# Options passed to docling's PDF pipeline, these form part of the docling cache key
+CONVERTER_OPTIONS = {
+    'do_ocr': True,
+    'do_table_structure': True
+}
+
+# Persistent cache of docling's markdown output
+DOCLING_CACHE = DiskCache(os.path.join(CACHE_DIR, 'docling'), DOCLING_CACHE_MAX_BYTES)
+
+# Process wide docling converter, its models are loaded once upon first use
+_converter = None
+_converter_lock = threading.Lock()
+
+# Converter timings: model loading time in seconds and a list of (filename, seconds) for each conversion
+CONVERTER_STATS = {'startup': None, 'documents': []}
+
+
+def make_converter() -> DocumentConverter:
+    """
+    Creates a docling converter using 'CONVERTER_OPTIONS'
+
+    :returns: docling DocumentConverter object
+    """
+    pipeline_options = PdfPipelineOptions(**CONVERTER_OPTIONS)
+    return DocumentConverter(format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)})
+
+
+def get_converter() -> DocumentConverter:
+    """
+    Returns the process wide docling converter, creating it and loading its models if necessary
+
+    :returns: docling DocumentConverter object
+    """
+    global _converter
+    with _converter_lock:
+        if _converter is None:
+            start = time.perf_counter()
+            converter = make_converter()
+            # Loads the layout and OCR models
+            converter.initialize_pipeline(InputFormat.PDF)
+            CONVERTER_STATS['startup'] = time.perf_counter() - start
+            print(f"docling converter started in {CONVERTER_STATS['startup']:.1f}s")
+            _converter = converter
+    return _converter
+
+
+def warm_up_converter():
+    """
+    Loads the docling models before the first PDF file is converted
+    """
+    get_converter()
+
+
+def shutdown_converter():
+    """
+    Releases the process wide docling converter and prints its timings
+    """
+    global _converter
+    with _converter_lock:
+        if _converter is None:
+            return
+        _converter = None
+    docs = CONVERTER_STATS['documents']
+    if len(docs) > 0:
+        total = sum(secs for filename, secs in docs)
+        print(f"docling converted {len(docs)} PDF file(s) in {total:.1f}s, average {total / len(docs):.1f}s per file,"
+              f" after {CONVERTER_STATS['startup']:.1f}s startup")
+    CONVERTER_STATS['startup'] = None
+    CONVERTER_STATS['documents'] = []
+
+
+def docling_cache_key(pdf_file: str) -> str:
+    """
+    Makes a cache key from the contents of a PDF file, docling's version and the converter options
+
+    :param pdf_file: filename
+    :returns: cache key as a hex digest string
+    """
+    hasher = hashlib.sha256()
+    with open(pdf_file, 'rb') as fd:
+        for block in iter(lambda: fd.read(1024 * 1024), b''):
+            hasher.update(block)
+    try:
+        docling_version = version('docling')
+    except PackageNotFoundError:
+        docling_version = 'unknown'
+    hasher.update(docling_version.encode('utf-8'))
+    hasher.update(json.dumps(CONVERTER_OPTIONS, sort_keys=True).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def needs_conversion(pdf_file: str) -> bool:
+    """
+    Returns True if the PDF file exists and its text cannot be read from the docling cache
+
+    :param pdf_file: filename
+    :returns: boolean
+    """
+    return os.path.exists(pdf_file) and not DOCLING_CACHE.contains(docling_cache_key(pdf_file))
+
 
 def parse_docling(pdf_file: str) -> str:
     """
     Extracts the text from a PDF file using docling
+    The markdown output is kept in a persistent cache, so unchanged PDF files are not converted again
     NB: Assumes PDF does not contain metadata, if exists should be utilised in future
 
     :param pdf_stream: filename
     """
-    converter = DocumentConverter()
+    key = docling_cache_key(pdf_file)
+    cached = DOCLING_CACHE.get(key)
+    if cached is not None:
+        return cached.decode('utf-8')
+    converter = get_converter()
+    start = time.perf_counter()
     doc = converter.convert(pdf_file).document
-    return doc.export_to_markdown()
+    markdown = doc.export_to_markdown()
+    secs = time.perf_counter() - start
+    CONVERTER_STATS['documents'].append((pdf_file, secs))
+    print(f"docling converted {pdf_file} in {secs:.1f}s")
+    DOCLING_CACHE.put(key, markdown.encode('utf-8'))
+    return markdown
+
+
+class DocumentCache:
+    """
+    Holds the markdown text of the PDF files converted during a run,
+    so that each PDF file is only parsed once by docling
+    """
+
+    def __init__(self):
+        self.docs = {}
+
+    def get_text(self, pdf_file: str) -> str:
+        """
+        Returns the markdown text of a PDF file, converting it with docling if it has not been seen before
+
+        :param pdf_file: path to PDF file
+        :returns: markdown text of PDF file
+        """
+        key = os.path.realpath(pdf_file)
+        if key not in self.docs:
+            self.docs[key] = parse_docling(pdf_file)
+        return self.docs[key]
+
+    def add(self, pdf_file: str, text: str):
+        """
+        Adds the markdown text of a PDF file that was converted elsewhere e.g. in another process
+
+        :param pdf_file: path to PDF file
+        :param text: markdown text of PDF file
+        """
+        self.docs[os.path.realpath(pdf_file)] = text
+
+    def clear(self):
+        """
+        Empties the cache
+        """
+        self.docs.clear()
+
+
+# Document cache shared by all PDF records in this run
+DOC_CACHE = DocumentCache()
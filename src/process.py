@@ -1,18 +1,16 @@
 #!/usr/bin/env python3
 import os
 import sys
-import glob
-import json
+import hashlib
 import argparse
+import importlib
 
-from pyproj import CRS, Transformer
-
-from oai_extract import OaiExtractor
-from ckan_extract import CkanExtractor
-from ISO19139_extract import ISO19139Extractor
-from ISO19115_3_extract import ISO19115_3Extractor
-from pdf_extract import PDFExtractor
+from summary import SUMMARY_CACHE, SUMMARY_METRICS, SUMMARISERS
 from extractor import Extractor
+from disk_cache import set_cache_mode, CACHE_OFF, CACHE_REFRESH
+from fetch import prefetch, prefetched, forget, validators, conditional_headers
+from manifest import BuildManifest, inputs_hash, file_sha256
+from model_info import get_model_info
 
 from config import CONFIG, OUTPUT_DIR
 
@@ -21,86 +19,234 @@ Create ISO19139 or ISO19115-3 XML metadata records from PDF reports or online me
 (e.g. CKAN, dSpace, geonetwork)
 """
 
-def convert(extractor: Extractor, param_list: list):
+# Extractor module and class name for each config method
+# Modules are only imported when a provider group uses them, some take seconds to import e.g. docling in 'pdf_extract'
+EXTRACTORS = {
+    'PDF': ('pdf_extract', 'PDFExtractor'),
+    'CKAN': ('ckan_extract', 'CkanExtractor'),
+    'ISO19115-3': ('ISO19115_3_extract', 'ISO19115_3Extractor'),
+    'ISO19139': ('ISO19139_extract', 'ISO19139Extractor'),
+    'OAIPMH': ('oai_extract', 'OaiExtractor')
+}
+
+def get_extractor(method: str) -> type | None:
+    """
+    Imports the extractor class for a config method
+
+    :param method: config method e.g. 'PDF'
+    :returns: 'Extractor' class or None if method is unknown
+    """
+    if method not in EXTRACTORS:
+        return None
+    module_name, class_name = EXTRACTORS[method]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def source_state(extractor: type, params: dict, entry: dict | None) -> dict | None:
+    """
+    Finds the current state of a record's source, used to tell if the source has changed since the record was built
+
+    :param extractor: 'Extractor' class
+    :param params: parameters of record
+    :param entry: the record's entry in the build manifest, or None
+    :returns: dict, {'sha256': <hash>} for local files, HTTP validators for URLs, or None if the state is unknown
+    """
+    source_file = extractor.source_file(params)
+    if source_file is not None:
+        return {'sha256': file_sha256(source_file)} if os.path.exists(source_file) else None
+    url = extractor.source_url(params)
+    response = prefetched(url) if url is not None else None
+    if response is None or isinstance(response, Exception):
+        return None
+    if response.status_code == 304:
+        return entry['source'] if entry is not None else None
+    if response.status_code != 200:
+        return None
+    # Hash the content if the server does not send validators
+    return validators(response) or {'sha256': hashlib.sha256(response.content).hexdigest()}
+
+
+def convert(extractor: type, param_list: list, jobs: int = 1, manifest: BuildManifest = None, force: bool = False,
+            **kwargs) -> list:
     """
     Runs conversion process
+    If there is a build manifest, records whose inputs have not changed since they were last built are skipped
 
-    :param extractor: 'Extractor' class instance
+    :param extractor: 'Extractor' class
     :param param_list: parameters for extraction process
+    :param jobs: number of parallel jobs
+    :param manifest: optional build manifest, it is updated with the records that are built
+    :param force: if True, build all records even if they have not changed
+    :param kwargs: keyword arguments passed to the 'Extractor' class constructor
+    :returns: list of (params, error message) tuples, one for each record that failed
     """
-    e = extractor()
+    pending = [(params, None, None, None) for params in param_list]
+    if manifest is not None:
+        pending = []
+        settings = extractor.input_settings(kwargs)
+        for params in param_list:
+            if 'output_file' not in params:
+                pending.append((params, None, None, None))
+                continue
+            output_path = os.path.join(OUTPUT_DIR, params['output_file'])
+            source = source_state(extractor, params, manifest.get(output_path))
+            digest = inputs_hash(extractor.__name__, params, kwargs, source, settings)
+            if not force and source is not None and manifest.is_fresh(output_path, digest):
+                forget(extractor.source_url(params))
+                continue
+            pending.append((params, output_path, digest, source))
+        if len(pending) < len(param_list):
+            print(f"Skipping {len(param_list) - len(pending)} record(s) that have not changed, use --force to rebuild them")
+        if len(pending) == 0:
+            return []
+
+    e = extractor(**kwargs)
     print(f"Converting using {e}")
-    for params in param_list:
-        try:
-            e.write_record(**params)
-        except TypeError as te:
-            print(f"Python Error in {params}\n{te}\n\nPlease check config.py file")
-            sys.exit(1)
+    failures = e.write_records([params for params, output_path, digest, source in pending], jobs)
+
+    if manifest is not None:
+        failed = [id(params) for params, error in failures]
+        for params, output_path, digest, source in pending:
+            if output_path is not None and id(params) not in failed:
+                manifest.record(output_path, digest, source)
+        manifest.save()
+    return failures
 
 
-def get_model_info() -> dict:
+def prefetch_config(config_vals: list, manifest: BuildManifest = None, force: bool = False):
     """
-    Extracts a little info from model files
+    Concurrently fetches the metadata records of all the given provider groups ahead of conversion
+    Records that are in the build manifest are fetched with conditional requests
 
-    :returns: a dict: key is model name, val is (south, west, north, east) tuple in EPSG:4326 coords in degrees
+    :param config_vals: list of config dicts for provider groups
+    :param manifest: optional build manifest
+    :param force: if True, do not make conditional requests
     """
-    SRC_DIR = os.path.join("geomodelportal", "ui", "src", "assets", "geomodels")
-    r_dict = {}
-    for jfile in glob.glob(os.path.join(SRC_DIR, "*.json")):
-        with open(jfile) as fd:
-            # Skip 'ProviderModelInfo.json' it is not a model file
-            if jfile[-22:] == 'ProviderModelInfo.json':
+    urls = []
+    headers = {}
+    for config_val in config_vals:
+        extractor = get_extractor(config_val['method'])
+        # Searched CKAN records are fetched in pages of search results instead
+        if extractor is None or (config_val['method'] == 'CKAN' and config_val.get('search')):
+            continue
+        for params in config_val['params']:
+            url = extractor.source_url(params)
+            urls.append(url)
+            if url is None or manifest is None or force or 'output_file' not in params:
                 continue
-            jobj = json.load(fd)
-            props = jobj['properties']
-            to_crs = CRS.from_epsg(4326)
-            from_crs = CRS.from_string(props['crs'])
-            transformer = Transformer.from_crs(from_crs, to_crs)
-            west, east, south, north = props['extent']
-            name = props['name']
-            southLat, westLong = transformer.transform(west, south)
-            northLat, eastLong = transformer.transform(east, north)
-            
-            r_dict[name] = {'south': southLat, 'west': westLong, 'north': northLat, 'east': eastLong}
-    return r_dict
-
-def oaipmh_convert(param_list: list):
-    """
-    Get records from Northern Territory Geological Service
-    """
-    OAI__URL = 'https://geoscience.nt.gov.au/gemis/ntgsoai/request'
-    oe = OaiExtractor(OAI__URL)
-    for params in param_list:
-        oe.write_record(**params)
-
-
-def process_config(config_val: dict):
-    # Get cooordinates from geomodels JSON config
-    coord_dict = get_model_info()
+            output_path = os.path.join(OUTPUT_DIR, params['output_file'])
+            entry = manifest.get(output_path)
+            if entry is not None and os.path.exists(output_path):
+                headers[url] = conditional_headers(entry['source'])
+    prefetch(urls, headers)
+
+
+def oaipmh_convert(param_list: list, oai_url: str | None, harvest: dict | bool = None, force: bool = False) -> list:
+    """
+    Get records from an OAI-PMH service
+
+    :param param_list: parameters for extraction process
+    :param oai_url: OAI-PMH service URL
+    :param harvest: optional, if True or a dict then records are harvested with 'ListRecords',
+                    a dict may have 'set', 'from' and 'until' keys for selective harvesting
+    :param force: if True, harvest all records, not just those changed since the last harvest
+    :returns: list of (params, error message) tuples, one for each record that failed
+    """
+    if oai_url is None:
+        return [(params, "Provider group has no 'oai_url'") for params in param_list]
+    oe = get_extractor('OAIPMH')(oai_url)
+    if harvest:
+        options = harvest if isinstance(harvest, dict) else {}
+        return oe.harvest(param_list, options.get('set'), options.get('from'), options.get('until'), force)
+    return oe.write_records(param_list)
+
+
+def ckan_search_convert(param_list: list, search: dict | bool, force: bool = False) -> list:
+    """
+    Get records from CKAN repositories using 'package_search'
+
+    :param param_list: parameters for extraction process
+    :param search: True or a dict, a dict may have a 'modified_since' key to only search recently modified packages
+    :param force: if True, search all packages, not just those modified since the last search
+    :returns: list of (params, error message) tuples, one for each record that failed
+    """
+    options = search if isinstance(search, dict) else {}
+    return get_extractor('CKAN')().search(param_list, options.get('modified_since'), force)
+
+
+def process_config(config_val: dict, jobs: int = 1, manifest: BuildManifest = None, force: bool = False) -> list:
+    """
+    Creates the records for a provider group in the config
 
+    :param config_val: config dict for provider group
+    :param jobs: number of parallel jobs
+    :param manifest: optional build manifest, records that have not changed since they were last built are skipped
+    :param force: if True, build all records even if they have not changed
+    :returns: list of (params, error message) tuples, one for each record that failed
+    """
     if config_val['method'] is None:
-        return
-    param_list = config_val['params']
+        return []
+
+    # Get cooordinates from geomodels JSON config
+    coord_dict = get_model_info(model_names([config_val]))
 
     # Insert model coordinates
-    for params in param_list:
+    param_list = []
+    failures = []
+    for params in config_val['params']:
         name = params['name']
-        params['bbox'] = coord_dict[name]
+        if name in coord_dict:
+            params['bbox'] = coord_dict[name]
+            param_list.append(params)
+        else:
+            failures.append((params, f"Cannot find model '{name}' in geomodels JSON files"))
 
     if config_val['method'] == 'PDF':
-        convert(PDFExtractor, param_list)
+        summariser = config_val.get('summariser')
+        if summariser is not None and summariser not in SUMMARISERS:
+            return failures + [(params, f"Unknown summariser '{summariser}', must be one of {', '.join(SUMMARISERS)}")
+                               for params in param_list]
+        from pdf_helper import needs_conversion, warm_up_converter
+        # Load docling's models once, they are shared by all PDF records
+        # NB: When running parallel jobs each worker process loads its own models
+        if jobs <= 1 and any(needs_conversion(params['pdf_file']) for params in param_list):
+            warm_up_converter()
+        return failures + convert(get_extractor('PDF'), param_list, jobs, manifest, force, summariser=summariser)
 
-    elif config_val['method'] == 'CKAN':
-        convert(CkanExtractor, param_list)
+    elif config_val['method'] == 'OAIPMH':
+        return failures + oaipmh_convert(param_list, config_val.get('oai_url'), config_val.get('harvest'), force)
 
-    elif config_val['method'] == 'ISO19115-3':
-        convert(ISO19115_3Extractor, param_list)
+    elif config_val['method'] == 'CKAN' and config_val.get('search'):
+        return failures + ckan_search_convert(param_list, config_val['search'], force)
 
-    elif config_val['method'] == 'ISO19139':
-        convert(ISO19139Extractor, param_list)
+    elif config_val['method'] in EXTRACTORS:
+        return failures + convert(get_extractor(config_val['method']), param_list, jobs, manifest, force)
+    return failures
 
-    elif config_val['method'] == 'OAIPMH':
-        oaipmh_convert(param_list)
+
+def model_names(config_vals: list) -> list:
+    """
+    Lists the model names used by some provider groups
+
+    :param config_vals: list of config dicts for provider groups
+    :returns: list of model names
+    """
+    return [params['name'] for config_val in config_vals if config_val['method'] is not None
+            for params in config_val['params']]
+
+
+def startup_modules(config_vals: list) -> list:
+    """
+    Lists the modules that are imported to create the records of some provider groups
+
+    :param config_vals: list of config dicts for provider groups
+    :returns: list of module names
+    """
+    modules = ['process']
+    for config_val in config_vals:
+        if config_val['method'] in EXTRACTORS:
+            modules.append(EXTRACTORS[config_val['method']][0])
+    return list(dict.fromkeys(modules))
 
 
 def main(sys_argv: list):
@@ -110,9 +256,20 @@ def main(sys_argv: list):
     """
     parser = argparse.ArgumentParser(description="Metarecogen")
     parser.add_argument('-r', '--record', action='store', help="Specify a record group to generate")
+    parser.add_argument('-j', '--jobs', action='store', type=int, default=1, help="Number of records to process in parallel")
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument('--no-cache', action='store_true', help="Do not read or write the persistent caches")
+    cache_group.add_argument('--refresh-cache', action='store_true', help="Ignore the persistent caches and rebuild them")
+    parser.add_argument('--force', action='store_true', help="Rebuild all records, even if their inputs have not changed")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="Print the time taken to import the modules needed by the selected record groups, then exit")
 
     # Parse command line arguments
     args = parser.parse_args(sys_argv[1:])
+    if args.no_cache:
+        set_cache_mode(CACHE_OFF)
+    elif args.refresh_cache:
+        set_cache_mode(CACHE_REFRESH)
 
     # Create output dir
     if not os.path.exists(OUTPUT_DIR):
@@ -125,14 +282,44 @@ def main(sys_argv: list):
     # Process one record specified on command line
     if args.record is not None:
         if args.record in CONFIG:
-            process_config(CONFIG[args.record])
+            config_vals = [CONFIG[args.record]]
         else:
             print(f"ERROR: Cannot find {args.record} in config")
             sys.exit(1)
     else:
         # Loop over config and process each one
-        for k, v in CONFIG.items():
-            process_config(v)
+        config_vals = list(CONFIG.values())
+
+    if args.profile_startup:
+        from import_profile import profile_imports, print_profile
+        modules = startup_modules(config_vals)
+        print_profile(profile_imports(modules), modules)
+        return
+
+    failures = []
+    manifest = BuildManifest()
+    try:
+        # Fetch remote metadata records for all provider groups at once
+        prefetch_config(config_vals, manifest, args.force)
+        # Read model bounding boxes for all provider groups at once
+        get_model_info(model_names(config_vals))
+        for config_val in config_vals:
+            failures += process_config(config_val, args.jobs, manifest, args.force)
+    finally:
+        # docling is only loaded if there were PDF records
+        if 'pdf_helper' in sys.modules:
+            sys.modules['pdf_helper'].shutdown_converter()
+        if 'keywords' in sys.modules:
+            sys.modules['keywords'].shutdown_yake_pool()
+        SUMMARY_CACHE.report()
+        SUMMARY_METRICS.report()
+
+    # Report records that could not be created
+    if len(failures) > 0:
+        print(f"\nERROR: {len(failures)} record(s) failed")
+        for params, error in failures:
+            print(f"  {params.get('output_file', params.get('name'))}: {error}")
+        sys.exit(1)
 
 if __name__ == "__main__":
         main(sys.argv)
@@ -1,32 +1,171 @@
 #!/usr/bin/env python3
 
 import os
-import sys
+import json
+import hashlib
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from bedrock_summary import run_claude
-from ollama_summary import ollama_summary
+from semantic_text_splitter import MarkdownSplitter
 
-from pdf_helper import parse_docling
-from config import OUTPUT_DIR, USE_CLAUDE
+from summary_cache import SummaryCache
+from summary_metrics import SummaryMetrics
+
+from config import OUTPUT_DIR, SUMMARISER, SUMMARY_CHUNK_TOKENS, CACHE_DIR
+from config import SUMMARY_CACHE_TTL, SUMMARY_CACHE_MAX_BYTES, SUMMARY_STREAM
 
 # Writes out a file of text extracted from PDF file
 OUTPUT_PDF_TXT = True
 
-def get_summary(filename: str) -> str:
+# Summaries of previous runs
+SUMMARY_CACHE = SummaryCache(os.path.join(CACHE_DIR, 'summaries.sqlite'), SUMMARY_CACHE_TTL, SUMMARY_CACHE_MAX_BYTES)
+
+# Timings of streamed summaries in this run
+SUMMARY_METRICS = SummaryMetrics()
+
+# Summariser backends, name -> module. A backend module is only imported when it is first used and has:
+#   MAX_CONCURRENCY - maximum number of its requests in progress at the same time, across all records
+#   BATCH_SIZE - number of requests queued at a time when summarising the chunks of one record
+#   ATTRIBUTION - prefix of its summaries
+#   summarise(text) - returns a summary of the text
+#   stream(text, usage) - returns an iterator of summary text chunks and sets usage['output_tokens'] upon completion
+#   cache_settings() - returns a dict of the settings that change its summaries, e.g. model and prompt
+SUMMARISERS = {
+    'bedrock': 'bedrock_summary',
+    'ollama': 'ollama_summary'
+}
+
+# Imported backend modules and their request slots, see 'get_summariser()'
+_summarisers = {}
+_summariser_slots = {}
+_summarisers_lock = threading.Lock()
+
+# Rough number of characters in a token, used to estimate the size of a prompt
+CHARS_PER_TOKEN = 4
+
+def count_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens in some text
+
+    :param text: text
+    :returns: approximate number of tokens
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def get_summariser(name: str):
+    """
+    Returns a summariser backend module, importing it upon first use
+
+    :param name: name of backend, a key of 'SUMMARISERS'
+    :returns: backend module
+    :raises: ValueError if the backend is unknown
+    """
+    with _summarisers_lock:
+        if name not in _summarisers:
+            if name not in SUMMARISERS:
+                raise ValueError(f"Unknown summariser '{name}', must be one of {', '.join(SUMMARISERS)}")
+            backend = importlib.import_module(SUMMARISERS[name])
+            _summariser_slots[name] = threading.BoundedSemaphore(backend.MAX_CONCURRENCY)
+            _summarisers[name] = backend
+        return _summarisers[name]
+
+def summarise_text(name: str, text: str, record: str = None) -> str:
+    """
+    Summarises text with a backend, waiting while the backend has 'MAX_CONCURRENCY' requests in progress.
+    In streaming mode the time to first token, latency and token throughput are recorded in 'SUMMARY_METRICS'
+
+    :param name: name of backend, a key of 'SUMMARISERS'
+    :param text: text to be summarised
+    :param record: optional name of record, used in the timings report
+    :returns: summary text string, without attribution
+    """
+    backend = get_summariser(name)
+    with _summariser_slots[name]:
+        if not SUMMARY_STREAM:
+            return backend.summarise(text)
+        usage = {}
+        return SUMMARY_METRICS.stream(name, record or 'unnamed', backend.stream(text, usage), usage, count_tokens)
+
+def summarise_texts(name: str, texts: list, record: str = None) -> list:
+    """
+    Summarises a list of texts with a backend, queueing up to its 'BATCH_SIZE' requests at a time
+
+    :param name: name of backend, a key of 'SUMMARISERS'
+    :param texts: list of text strings to be summarised
+    :param record: optional name of record, used in the timings report
+    :returns: list of summary text strings, in the same order as 'texts'
+    """
+    batch_size = get_summariser(name).BATCH_SIZE
+    with ThreadPoolExecutor(max_workers=max(1, min(batch_size, len(texts)))) as executor:
+        return list(executor.map(lambda text: summarise_text(name, text, record), texts))
+
+def map_reduce_summary(text: str, summarise_all, chunk_tokens: int = SUMMARY_CHUNK_TOKENS) -> str:
+    """
+    Summarises text that may be too long for a single prompt.
+    The text is split into chunks along its markdown headings, the chunks are summarised and
+    then the chunk summaries are summarised. This is repeated if the chunk summaries are still too long.
+
+    :param text: markdown text
+    :param summarise_all: function that takes a list of text strings and returns a list of their summaries
+    :param chunk_tokens: maximum number of tokens summarised in one prompt
+    :returns: summary text string
+    """
+    splitter = MarkdownSplitter.from_callback(count_tokens, chunk_tokens)
+    while count_tokens(text) > chunk_tokens:
+        reduced = '\n\n'.join(summarise_all(splitter.chunks(text)))
+        if len(reduced) >= len(text):
+            # Summaries are not getting any shorter
+            break
+        text = reduced
+    return summarise_all([text])[0]
+
+def summariser_settings(name: str = SUMMARISER) -> dict:
+    """
+    Returns the settings that change the summaries of a backend: its model, prompt and sampling parameters
+    and how the text is split into chunks
+
+    :param name: name of backend, a key of 'SUMMARISERS'
+    :returns: dict of settings
+    """
+    return {'backend': name, **get_summariser(name).cache_settings(), 'chunk_tokens': SUMMARY_CHUNK_TOKENS}
+
+def summary_cache_key(text: str, name: str = SUMMARISER) -> str:
+    """
+    Makes the summary cache key for some text, the summary depends upon the text, the backend,
+    its model, prompt and sampling parameters and how the text is split into chunks
+
+    :param text: text to be summarised
+    :param name: name of backend, a key of 'SUMMARISERS'
+    :returns: key string
+    """
+    settings = summariser_settings(name)
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    hasher.update(hashlib.sha256(text.encode('utf-8')).digest())
+    return hasher.hexdigest()
+
+def get_summary(pdf_text: str, pdf_file: str = None, summariser: str = None) -> str:
     """
-    Summarise a PDF file
+    Summarise the text extracted from a PDF file
 
-    :param filename: filename of PDF file
-    :returns: text string of PDF file
+    :param pdf_text: text of PDF file, as extracted by docling
+    :param pdf_file: optional filename of PDF file, used to name the text output file
+    :param summariser: optional name of backend, a key of 'SUMMARISERS', defaults to 'SUMMARISER' in config
+    :returns: summary text string
     """
-    pdf_text = parse_docling(filename)
+    name = summariser or SUMMARISER
     # Option to output to text file
-    if OUTPUT_PDF_TXT:
-        txt_filename = os.path.basename(filename).split('.')[0] + ".txt"
+    if OUTPUT_PDF_TXT and pdf_file is not None:
+        txt_filename = os.path.basename(pdf_file).split('.')[0] + ".txt"
         with open(os.path.join(OUTPUT_DIR, txt_filename), 'w') as fd:
             fd.write(pdf_text)
-    if USE_CLAUDE:
-        summary = run_claude(pdf_text)
-    else:
-        summary = ollama_summary(pdf_text)
+    key = summary_cache_key(pdf_text, name)
+    summary = SUMMARY_CACHE.get(key)
+    if summary is not None:
+        return summary
+    record = os.path.basename(pdf_file) if pdf_file is not None else None
+    summary = get_summariser(name).ATTRIBUTION + map_reduce_summary(pdf_text,
+                                                                    lambda texts: summarise_texts(name, texts, record))
+    SUMMARY_CACHE.put(key, summary)
     return summary
@@ -0,0 +1,108 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import closing
+
+import disk_cache
+
+"""
+A persistent cache of LLM summaries, kept in a SQLite file
+Entries expire after a time and the least recently used entries are evicted when the cache is too large
+"""
+
+class SummaryCache:
+    """
+    SQLite cache of summaries, keyed on a hash of the summarised text and the model settings
+    """
+
+    def __init__(self, db_file: str, ttl_secs: float, max_bytes: int):
+        """
+        :param db_file: SQLite file, created upon first write
+        :param ttl_secs: entries older than this many seconds are not used
+        :param max_bytes: maximum total size of the summaries in bytes
+        """
+        self.db_file = db_file
+        self.ttl_secs = ttl_secs
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        con = sqlite3.connect(self.db_file, timeout=30)
+        con.execute("CREATE TABLE IF NOT EXISTS summary (key TEXT PRIMARY KEY, summary TEXT NOT NULL, "
+                    "size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+        return con
+
+    def get(self, key: str) -> str | None:
+        """
+        Fetches a summary from the cache
+
+        :param key: cache key
+        :returns: summary or None if not in cache or expired
+        """
+        if disk_cache.cache_mode != disk_cache.CACHE_USE:
+            return None
+        summary = None
+        now = time.time()
+        with self.lock:
+            try:
+                with closing(self.__connect()) as con, con:
+                    row = con.execute("SELECT summary FROM summary WHERE key = ? AND created >= ?",
+                                      (key, now - self.ttl_secs)).fetchone()
+                    if row is not None:
+                        summary = row[0]
+                        # Mark as recently used
+                        con.execute("UPDATE summary SET accessed = ? WHERE key = ?", (now, key))
+            except sqlite3.Error as se:
+                print(f"WARNING: Cannot read summary cache {self.db_file}: {se}")
+            if summary is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return summary
+
+    def put(self, key: str, summary: str):
+        """
+        Stores a summary in the cache, then evicts expired and old entries if the cache is too large
+
+        :param key: cache key
+        :param summary: summary
+        """
+        if disk_cache.cache_mode == disk_cache.CACHE_OFF:
+            return
+        now = time.time()
+        with self.lock:
+            try:
+                with closing(self.__connect()) as con, con:
+                    con.execute("INSERT OR REPLACE INTO summary (key, summary, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                                (key, summary, len(summary.encode('utf-8')), now, now))
+                    self.__evict(con, now)
+            except (sqlite3.Error, OSError) as err:
+                print(f"WARNING: Cannot write to summary cache {self.db_file}: {err}")
+
+    def __evict(self, con: sqlite3.Connection, now: float):
+        """
+        Deletes expired entries, then least recently used entries until the cache is no larger than 'max_bytes'
+
+        :param con: open connection to the SQLite file
+        :param now: current time in seconds since epoch
+        """
+        con.execute("DELETE FROM summary WHERE created < ?", (now - self.ttl_secs,))
+        total = con.execute("SELECT COALESCE(SUM(size), 0) FROM summary").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in con.execute("SELECT key, size FROM summary ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            con.execute("DELETE FROM summary WHERE key = ?", (key,))
+            total -= size
+
+    def report(self):
+        """
+        Prints the number of cache hits and misses in this run
+        """
+        if self.hits + self.misses > 0:
+            print(f"Summary cache: {self.hits} hit(s), {self.misses} miss(es)")
@@ -0,0 +1,90 @@
+import time
+import threading
+
+"""
+Measures the time taken by LLM summaries, for comparing the capacity of local and cloud backends
+
+For each request the time to first token, the total latency and the number of generated tokens are recorded.
+Token counts are reported by the backend where possible, otherwise they are estimated from the text.
+"""
+
+class SummaryMetrics:
+    """
+    Collects timings of streamed LLM requests
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def stream(self, backend: str, record: str, chunks, usage: dict, count_tokens) -> str:
+        """
+        Reads a stream of text from an LLM and records its timings
+
+        :param backend: name of backend e.g. 'ollama'
+        :param record: name of record being summarised, used to group requests in the report
+        :param chunks: iterator of text chunks, as they are generated
+        :param usage: dict that the stream fills in with 'output_tokens' upon completion, if the backend reports it
+        :param count_tokens: function that estimates the number of tokens in some text
+        :returns: the whole text
+        """
+        start = time.perf_counter()
+        first = None
+        pieces = []
+        for chunk in chunks:
+            if first is None and chunk != '':
+                first = time.perf_counter()
+            pieces.append(chunk)
+        end = time.perf_counter()
+        text = ''.join(pieces)
+        output_tokens = usage.get('output_tokens')
+        with self.lock:
+            self.requests.append({
+                'backend': backend,
+                'record': record,
+                'ttft': (first if first is not None else end) - start,
+                'latency': end - start,
+                'output_tokens': output_tokens if output_tokens is not None else count_tokens(text),
+                'estimated': output_tokens is None
+            })
+        return text
+
+    def summarise(self, requests: list) -> dict:
+        """
+        Totals the timings of a list of requests
+
+        :param requests: list of request dicts
+        :returns: dict with number of 'requests', mean 'ttft', total 'latency', 'output_tokens'
+                  and 'tokens_per_sec' while generating, i.e. after the first token
+        """
+        latency = sum(req['latency'] for req in requests)
+        generating = sum(req['latency'] - req['ttft'] for req in requests)
+        output_tokens = sum(req['output_tokens'] for req in requests)
+        return {
+            'requests': len(requests),
+            'ttft': sum(req['ttft'] for req in requests) / len(requests),
+            'latency': latency,
+            'output_tokens': output_tokens,
+            'tokens_per_sec': output_tokens / generating if generating > 0 else 0.0
+        }
+
+    def report(self):
+        """
+        Prints the timings of each record and each backend
+        """
+        with self.lock:
+            requests = list(self.requests)
+        if len(requests) == 0:
+            return
+        print("\nSummary timings:")
+        groups = {}
+        for req in requests:
+            groups.setdefault((req['backend'], req['record']), []).append(req)
+        for backend in dict.fromkeys(req['backend'] for req in requests):
+            groups[(backend, 'all records')] = [req for req in requests if req['backend'] == backend]
+        for (backend, record), group in groups.items():
+            stats = self.summarise(group)
+            estimated = " (estimated)" if any(req['estimated'] for req in group) else ""
+            print(f"  {backend} {record}: {stats['requests']} request(s), time to first token {stats['ttft']:.2f}s, "
+                  f"latency {stats['latency']:.1f}s, {stats['output_tokens']} tokens{estimated}, "
+                  f"{stats['tokens_per_sec']:.1f} tokens/s")
@@ -0,0 +1,72 @@
+import re
+
+"""
+Finds multi-word vocabulary terms in text
+
+The terms are compiled into a trie of words. Text is scanned once, word by word, and at each word the longest term
+starting there is matched. Matching is case insensitive.
+"""
+
+# Words are runs of letters and digits
+WORD_REGEX = re.compile(r"[^\W_]+")
+
+# Key in a trie node that holds the term that ends at that node
+TERM_KEY = None
+
+
+class TermMatcher:
+    """
+    Matches a set of vocabulary terms in text
+    """
+
+    def __init__(self, terms):
+        """
+        :param terms: iterable of terms, each term is one or more words
+        """
+        self.trie = {}
+        for term in terms:
+            words = WORD_REGEX.findall(term.lower())
+            if len(words) == 0:
+                continue
+            node = self.trie
+            for word in words:
+                node = node.setdefault(word, {})
+            node[TERM_KEY] = term
+
+    def find(self, text: str) -> list:
+        """
+        Finds the terms in some text. At each word the longest term is matched, matches do not overlap
+
+        :param text: text
+        :returns: list of (term, start offset, end offset) tuples in order of appearance in the text
+        """
+        words = [(m.group().lower(), m.start(), m.end()) for m in WORD_REGEX.finditer(text)]
+        hits = []
+        idx = 0
+        while idx < len(words):
+            node = self.trie
+            match = None
+            end_idx = idx
+            while end_idx < len(words) and words[end_idx][0] in node:
+                node = node[words[end_idx][0]]
+                end_idx += 1
+                if TERM_KEY in node:
+                    match = (node[TERM_KEY], words[idx][1], words[end_idx - 1][2], end_idx)
+            if match is None:
+                idx += 1
+            else:
+                hits.append(match[:3])
+                idx = match[3]
+        return hits
+
+    def count(self, text: str) -> dict:
+        """
+        Counts the terms in some text
+
+        :param text: text
+        :returns: dict, key is term, value is number of times it appears in the text
+        """
+        counts = {}
+        for term, start, end in self.find(text):
+            counts[term] = counts.get(term, 0) + 1
+        return counts
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import sys
+import random
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from keywords import build_keyword_lookup
+
+"""
+Microbenchmark of the USGS vocab hierarchy resolution in 'keywords.build_keyword_lookup()'
+against the previous version, which walked from each term up to the root
+
+Run from the root directory:  python3 tests/bench_keywords.py
+"""
+
+def build_keyword_lookup_old(link_dict: dict, name_dict: dict) -> dict:
+    """
+    Previous version of 'keywords.build_keyword_lookup()', kept for comparison
+
+    :param link_dict: maps term code to parent term code
+    :param name_dict: maps term code to term name
+    :returns: lookup table
+    """
+    keyword_lkup = {}
+    for k,v in link_dict.items():
+        parent = v
+        child = -1
+        gchild = -1
+        ggchild = -1
+        while parent != 1 and parent is not None:
+            ggchild = gchild
+            gchild = child
+            child = parent
+            parent = link_dict[parent]
+        try:
+            if name_dict[ggchild] not in ['chemical elements', 'chemical element groups']:
+                keyword_lkup[name_dict[k]] = name_dict[ggchild]
+        except KeyError:
+            pass
+    return keyword_lkup
+
+
+def make_vocab(n_terms: int, max_depth: int = 10, spread: int = 0, seed: int = 1) -> (dict, dict):
+    """
+    Makes a random vocab hierarchy
+
+    :param n_terms: number of terms
+    :param max_depth: maximum number of levels below the root
+    :param spread: parents are chosen from this many of the most recent terms, 0 means all terms.
+                   The smaller it is, the deeper the hierarchy
+    :param seed: random seed
+    :returns: tuple (link_dict, name_dict)
+    """
+    rnd = random.Random(seed)
+    link_dict = {1: None}
+    name_dict = {1: 'root'}
+    depth = {1: 0}
+    codes = [1]
+    for code in range(2, n_terms + 2):
+        candidates = codes[-spread:] if spread > 0 else codes
+        parent = rnd.choice(candidates)
+        while depth[parent] >= max_depth:
+            parent = rnd.choice(codes)
+        link_dict[code] = parent
+        depth[code] = depth[parent] + 1
+        # Some terms share names, some categories are excluded from the lookup
+        name_dict[code] = rnd.choice(['chemical elements', f"term {code}", f"term {code // 2}"])
+        codes.append(code)
+    # Terms are not in hierarchy order in the DB
+    order = list(link_dict)
+    rnd.shuffle(order)
+    return {code: link_dict[code] for code in order}, name_dict
+
+
+if __name__ == "__main__":
+    # Shallow and wide like the USGS Thesaurus, then deeper hierarchies
+    for n_terms, max_depth, spread in ((20000, 10, 0), (20000, 20, 10), (20000, 50, 5)):
+        link_dict, name_dict = make_vocab(n_terms, max_depth, spread)
+        assert build_keyword_lookup(link_dict, name_dict) == build_keyword_lookup_old(link_dict, name_dict)
+        for func in (build_keyword_lookup_old, build_keyword_lookup):
+            secs = min(timeit.repeat(lambda: func(link_dict, name_dict), number=3, repeat=3)) / 3
+            print(f"{func.__name__}: {secs * 1000:.1f} ms for {n_terms} terms, max depth {max_depth}")
@@ -0,0 +1,151 @@
+import re
+import json
+import time
+import base64
+import threading
+from urllib.parse import urlparse, parse_qs
+
+"""
+Small fake CKAN and Geonetwork services, run them with 'stub_server()' e.g.
+
+    with stub_server(FakeCkan(5).respond) as ckan_url:
+"""
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+
+def reply(status: int, result: dict) -> tuple:
+    return status, JSON_HEADERS, json.dumps(result).encode()
+
+
+class FakeCkan:
+    """
+    A CKAN service with 'package_search', 'package_show' and 'iso19115_package_show' APIs
+    """
+    def __init__(self, count: int):
+        """
+        :param count: number of packages, their modification times are one day apart
+        """
+        self.packages = [self.package(i, f"2024-01-{i:02}T10:00:00.000001") for i in range(1, count + 1)]
+        # Ids of packages that 'package_search' leaves out, and a number added to its count
+        self.hidden = set()
+        self.extra_count = 0
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def package(i: int, modified: str, title: str = None) -> dict:
+        return {'id': f"uuid-{i}", 'name': f"ds{i:06}", 'title': title or f"Model {i}", 'notes': "A 3D model",
+                'metadata_created': "2023-01-01T00:00:00", 'metadata_modified': modified, 'state': 'active',
+                'license_title': "CC BY 4.0", 'license_url': "https://creativecommons.org/licenses/by/4.0/",
+                'organization': {'title': "Test Survey"}, 'resources': [{'url': "https://example.org/model.zip", 'name': "Model"}]}
+
+    def find(self, package_id: str) -> dict | None:
+        for package in self.packages:
+            if package_id in (package['id'], package['name']):
+                return package
+        return None
+
+    def respond(self, method, path, headers, body):
+        url = urlparse(path)
+        query = parse_qs(url.query)
+        args = {key: val[0] for key, val in query.items()}
+        with self.lock:
+            self.requests.append((url.path, args))
+        if url.path.endswith('/iso19115_package_show'):
+            package = self.find(args['id'])
+            if package is None:
+                return reply(404, {'success': False, 'error': 'Not found'})
+            return reply(200, {'success': True, 'result':
+                               f"<record><uuid>{package['id']}</uuid><title>{package['title']}</title></record>"})
+        if url.path.endswith('/package_show'):
+            package = self.find(args['id'])
+            if package is None:
+                return reply(404, {'success': False, 'error': 'Not found'})
+            return reply(200, {'success': True, 'result': package})
+        assert '+dataset_type:*' in args['fq']
+        matches = sorted([package for package in self.packages if package['state'] == 'active' and package['id'] not in self.hidden],
+                         key=lambda package: package['metadata_modified'])
+        ids = re.search(r'name:\(([^)]*)\)', args['fq'])
+        if ids is not None:
+            names = re.findall(r'"([^"]*)"', ids.group(1))
+            matches = [package for package in matches if package['name'] in names or package['id'] in names]
+        since = re.search(r'metadata_modified:\[(\S+)Z TO \*\]', args['fq'])
+        if since is not None:
+            matches = [package for package in matches if package['metadata_modified'] >= since.group(1)]
+        start, rows = int(args['start']), int(args['rows'])
+        results = matches[start:start + rows]
+        if 'fl' in query:
+            results = [{key: package[key] for key in query['fl']} for package in results]
+        return reply(200, {'success': True, 'result': {'count': len(matches) + self.extra_count, 'results': results}})
+
+
+class FakeGeonetwork:
+    """
+    A Geonetwork service whose 'records' API stores the records that are sent to it and deletes records,
+    the record's uuid is read from its '<uuid>' element. Requests must use basic authentication and send the
+    XSRF token from 'info?type=me' in both the 'XSRF-TOKEN' cookie and the 'X-XSRF-TOKEN' header.
+    """
+    def __init__(self, username: str = 'user', password: str = 'pass', token_lifetime: int = None, delay: float = 0.0):
+        """
+        :param username: username
+        :param password: password
+        :param token_lifetime: optional number of records that can be inserted with each XSRF token
+        :param delay: time in seconds taken to insert a record
+        """
+        self.auth = 'Basic ' + base64.b64encode(f"{username}:{password}".encode()).decode()
+        self.token_lifetime = token_lifetime
+        self.delay = delay
+        self.token = None
+        self.tokens_issued = 0
+        self.token_uses = 0
+        self.records = {}
+        self.requests = []
+        self.in_progress = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def respond(self, method, path, headers, body):
+        url = urlparse(path)
+        args = {key: val[0] for key, val in parse_qs(url.query).items()}
+        with self.lock:
+            self.requests.append((method, url.path, args))
+            if headers.get('Authorization') != self.auth:
+                return reply(401, {'message': 'Unauthorized'})
+            if method == 'POST' and url.path == '/geonetwork/srv/eng/info':
+                self.tokens_issued += 1
+                self.token = f"token{self.tokens_issued}"
+                self.token_uses = 0
+                return 200, {**JSON_HEADERS, 'Set-Cookie': f"XSRF-TOKEN={self.token}; Path=/"}, b'{}'
+            if self.token is None or headers.get('X-XSRF-TOKEN') != self.token \
+                    or f"XSRF-TOKEN={self.token}" not in headers.get('Cookie', ''):
+                return reply(403, {'message': 'Invalid CSRF token'})
+            self.token_uses += 1
+            if self.token_lifetime is not None and self.token_uses >= self.token_lifetime:
+                self.token = None
+            self.in_progress += 1
+            self.peak = max(self.peak, self.in_progress)
+        try:
+            time.sleep(self.delay)
+            return self.records_api(method, url.path, args, body)
+        finally:
+            with self.lock:
+                self.in_progress -= 1
+
+    def records_api(self, method, path, args, body):
+        if method == 'PUT' and path == '/geonetwork/srv/api/records':
+            uuid = re.search(r'<uuid>([^<]*)</uuid>', body.decode()).group(1)
+            with self.lock:
+                if uuid in self.records and args['uuidProcessing'] == 'NOTHING':
+                    return reply(201, {'numberOfRecordsProcessed': 0, 'numberOfRecordsWithErrors': 1})
+                self.records[uuid] = body.decode()
+                internal_id = str(list(self.records).index(uuid))
+            return reply(201, {'numberOfRecordsProcessed': 1, 'numberOfRecordsWithErrors': 0,
+                               'metadataInfos': {internal_id: [{'uuid': uuid, 'message': f"Metadata imported with UUID '{uuid}'"}]}})
+        match = re.fullmatch(r'/geonetwork/srv/api/records/([^/]+)', path)
+        if method == 'DELETE' and match is not None:
+            with self.lock:
+                if self.records.pop(match.group(1), None) is None:
+                    return reply(404, {'message': 'Not found'})
+            return 204, {}, b''
+        return reply(404, {'message': 'Not found'})
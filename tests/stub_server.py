@@ -0,0 +1,47 @@
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+"""
+A local HTTP server used to stand in for web services in tests
+"""
+
+@contextmanager
+def stub_server(respond):
+    """
+    Runs a local HTTP server in a background thread
+
+    :param respond: function called for each request with (method, path, headers, body),
+                    returns (status code, headers dict, body bytes)
+    :returns: base URL of server e.g. 'http://127.0.0.1:12345'
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def handle_request(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length) if length > 0 else b''
+            status, headers, resp_body = respond(self.command, self.path, self.headers, body)
+            self.send_response(status)
+            for key, val in headers.items():
+                self.send_header(key, val)
+            self.send_header('Content-Length', str(len(resp_body)))
+            self.end_headers()
+            self.wfile.write(resp_body)
+
+        do_GET = handle_request
+        do_POST = handle_request
+        do_PUT = handle_request
+        do_DELETE = handle_request
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
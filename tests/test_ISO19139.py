@@ -1,4 +1,7 @@
-from ISO19139_extract import ISO19139Extractor
+from lxml import etree
+
+from ISO19139_extract import ISO19139Extractor, XSLT
+from enrich import get_transform, transform_records
 
 def test_ISO19139():
     metadata_urls = [
@@ -10,3 +13,17 @@ def test_ISO19139():
     for name, url in metadata_urls:
         ce.write_record(name, {'north': '0.0', 'south': '-45', 'east': '-145', 'west':'-100'}, name, url, f"test_19139_{name}.xml")
 
+
+def test_transform_records():
+    """
+    Tests inserting model links into a batch of records with the compiled stylesheet
+    """
+    xml = b"""<gmd:MD_Metadata xmlns:gmd="http://www.isotc211.org/2005/gmd" xmlns:gco="http://www.isotc211.org/2005/gco">
+  <gmd:distributionInfo><gmd:MD_Distribution/></gmd:distributionInfo>
+</gmd:MD_Metadata>"""
+    docs = [etree.fromstring(xml), etree.fromstring(xml)]
+    results = transform_records(get_transform(XSLT), docs, ['sandstone', 'windimurra'])
+    ns = {'gmd': 'http://www.isotc211.org/2005/gmd'}
+    for result, name in zip(results, ['sandstone', 'windimurra']):
+        urls = result.xpath('//gmd:onLine/gmd:CI_OnlineResource/gmd:linkage/gmd:URL/text()', namespaces=ns)
+        assert urls == [f"https://geomodels.auscope.org.au/model/{name}"]
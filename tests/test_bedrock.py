@@ -0,0 +1,83 @@
+import json
+import time
+import threading
+
+import pytest
+
+import summary
+import bedrock_summary
+from stub_server import stub_server
+
+
+def test_claude_summaries(monkeypatch):
+    """
+    Tests concurrent summaries through the summariser registry using one client,
+    against a local stand in for the Bedrock runtime service
+    """
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'test')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'test')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'ap-southeast-2')
+    monkeypatch.setattr(bedrock_summary, '_client', None)
+    monkeypatch.setattr(summary, 'SUMMARY_STREAM', False)
+    monkeypatch.setattr(summary, '_summarisers', {})
+    monkeypatch.setattr(summary, '_summariser_slots', {})
+    requests = []
+    in_progress = []
+    peak = []
+    lock = threading.Lock()
+
+    def respond(method, path, headers, body):
+        prompt = json.loads(body)['prompt']
+        text = prompt.split('<text>')[1].split('</text>')[0].strip()
+        with lock:
+            requests.append((path, text))
+            count = len([req for req in requests if req[1] == text])
+            in_progress.append(text)
+            peak.append(len(in_progress))
+        time.sleep(0.02)
+        with lock:
+            in_progress.remove(text)
+        # First request for each text is throttled
+        if count == 1:
+            return 429, {'Content-Type': 'application/json', 'x-amzn-ErrorType': 'ThrottlingException'}, b'{"message": "Too many requests"}'
+        return 200, {'Content-Type': 'application/json'}, json.dumps({'completion': f"summary of {text}"}).encode('utf-8')
+
+    with stub_server(respond) as base_url:
+        monkeypatch.setattr(bedrock_summary, 'BEDROCK_ENDPOINT_URL', base_url)
+        texts = [f"text {i}" for i in range(6)]
+        # Two records summarised at the same time share the backend's request slots
+        results = {}
+        records = [threading.Thread(target=lambda rec=rec: results.update({rec: summary.summarise_texts('bedrock', texts, rec)}))
+                   for rec in ('a', 'b')]
+        for thread in records:
+            thread.start()
+        for thread in records:
+            thread.join()
+        assert results == {rec: [f"summary of {text}" for text in texts] for rec in ('a', 'b')}
+        assert bedrock_summary.run_claude("text 6") == bedrock_summary.CLAUDE_ATTRIBUTION + "summary of text 6"
+        assert bedrock_summary.get_client() is bedrock_summary.get_client()
+
+    # Each text is throttled once, then summarised once for each record
+    assert len(requests) == 6 + 12 + 2
+    assert max(peak) <= bedrock_summary.MAX_CONCURRENCY
+    assert all(path == '/model/anthropic.claude-v2/invoke' for path, text in requests)
+
+
+def test_claude_error(monkeypatch):
+    """
+    Tests that a Bedrock error raises an exception instead of exiting, so that only the record being summarised fails
+    """
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'test')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'test')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'ap-southeast-2')
+    monkeypatch.setattr(bedrock_summary, '_client', None)
+
+    def respond(method, path, headers, body):
+        return 400, {'Content-Type': 'application/json', 'x-amzn-ErrorType': 'ValidationException'}, b'{"message": "Bad prompt"}'
+
+    with stub_server(respond) as base_url:
+        monkeypatch.setattr(bedrock_summary, 'BEDROCK_ENDPOINT_URL', base_url)
+        with pytest.raises(RuntimeError, match="Bedrock error"):
+            bedrock_summary.claude_summary("text")
+        with pytest.raises(RuntimeError, match="Bedrock error"):
+            list(bedrock_summary.claude_stream("text", {}))
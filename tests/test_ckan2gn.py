@@ -0,0 +1,146 @@
+import sqlite3
+import threading
+
+import ckan_to_gn
+import ckan_extract
+from ckan_to_gn import CkanClient, GeonetworkClient, SyncState, sync, ckan_search_filter
+from stub_server import stub_server
+from fake_services import FakeCkan, FakeGeonetwork
+
+
+def puts(gn: FakeGeonetwork) -> list:
+    return [args['uuidProcessing'] for method, path, args in gn.requests if method == 'PUT']
+
+
+def test_search_filter():
+    """
+    Tests that the standalone script searches CKAN in the same way as 'ckan_extract'
+    """
+    for modified_since in [None, '2024-01-31', '2024-01-31T10:20:30.123456', '2024-01-31T10:20:30Z']:
+        assert ckan_search_filter(modified_since) == ckan_extract.search_filter(modified_since=modified_since)
+    assert ckan_to_gn.CKAN_SORT == ckan_extract.SEARCH_SORT
+
+
+def test_sync(monkeypatch, tmp_path):
+    """
+    Tests copying records from CKAN to Geonetwork, fetching a new XSRF token when Geonetwork refuses the old one
+    """
+    monkeypatch.setattr(ckan_to_gn, 'CKAN_ROWS', 3)
+    ckan = FakeCkan(8)
+    gn = FakeGeonetwork(token_lifetime=3, delay=0.02)
+    state = SyncState(str(tmp_path / 'state.db'))
+    # A record that cannot be fetched from CKAN
+    ckan.packages[4]['id'] = 'missing'
+    ckan.find = lambda package_id, find=ckan.find: None if package_id == 'missing' else find(package_id)
+    with stub_server(ckan.respond) as ckan_url, stub_server(gn.respond) as gn_url:
+        report = sync(CkanClient(ckan_url, 3), GeonetworkClient(gn_url, 'user', 'pass', 2), state,
+                      ckan_workers=3, gn_workers=2)
+    assert report.found == 8 and report.fetched == 7 and report.inserted == 7
+    assert [(package_id, stage) for package_id, stage, error in report.failures] == [('missing', 'fetch')]
+    assert sorted(gn.records) == sorted(f"uuid-{i}" for i in [1, 2, 3, 4, 6, 7, 8])
+    assert '<title>Model 8</title>' in gn.records['uuid-8']
+    # Token expires after every three records
+    assert gn.tokens_issued == 3
+    assert gn.peak <= 2
+    assert state.get('uuid-8')['uuid'] == 'uuid-8' and state.get('missing') is None
+    state.close()
+
+    # Modified since filter and a Geonetwork failure
+    gn = FakeGeonetwork(password='wrong')
+    with stub_server(ckan.respond) as ckan_url, stub_server(gn.respond) as gn_url:
+        report = sync(CkanClient(ckan_url), GeonetworkClient(gn_url, 'user', 'pass'), SyncState(str(tmp_path / 'new.db')),
+                      '2024-01-07')
+    assert report.found == 2 and report.inserted == 0
+    assert sorted(package_id for package_id, stage, error in report.failures) == ['uuid-7', 'uuid-8']
+
+
+def test_differential_sync(tmp_path):
+    """
+    Tests that only new and changed records are sent, and that records deleted from CKAN are found
+    """
+    ckan = FakeCkan(4)
+    gn = FakeGeonetwork()
+    state = SyncState(str(tmp_path / 'state.db'))
+    with stub_server(ckan.respond) as ckan_url, stub_server(gn.respond) as gn_url:
+        ckan_client = CkanClient(ckan_url)
+        gn_client = GeonetworkClient(gn_url, 'user', 'pass')
+        assert sync(ckan_client, gn_client, state).inserted == 4
+        assert puts(gn) == ['OVERWRITE'] * 4
+
+        # Nothing has changed, no records are fetched or sent
+        gn.requests.clear()
+        ckan.requests.clear()
+        report = sync(ckan_client, gn_client, state)
+        assert report.not_modified == 4 and report.fetched == 0 and puts(gn) == []
+        assert all(path.endswith('package_search') for path, args in ckan.requests)
+
+        # Record 1 is modified but its XML is the same, record 2 changes, record 5 is new, record 4 is deleted
+        gn.requests.clear()
+        ckan.packages[0]['metadata_modified'] = "2024-02-01T00:00:00"
+        ckan.packages[1] = ckan.package(2, "2024-02-02T00:00:00", "Model 2 revised")
+        ckan.packages[3] = ckan.package(5, "2024-02-03T00:00:00")
+        report = sync(ckan_client, gn_client, state)
+        assert (report.unchanged, report.updated, report.inserted, report.deleted_upstream, report.deleted) == (1, 1, 1, 1, 0)
+        assert puts(gn) == ['OVERWRITE'] * 2
+        assert '<title>Model 2 revised</title>' in gn.records['uuid-2']
+        assert state.get('uuid-1')['metadata_modified'] == "2024-02-01T00:00:00"
+
+        # Search misses a record that is still in CKAN and reports one more record than it returned,
+        # so nothing is deleted
+        ckan.hidden.add('uuid-3')
+        ckan.extra_count = 1
+        report = sync(ckan_client, gn_client, state, delete=True)
+        assert report.deleted_upstream == 0 and 'uuid-4' in gn.records
+
+        # The search count agrees, the missed record is checked with 'package_show' and only record 4 is deleted
+        ckan.extra_count = 0
+        ckan.requests.clear()
+        report = sync(ckan_client, gn_client, state, delete=True)
+        assert (report.fetched, report.deleted_upstream, report.deleted) == (0, 1, 1)
+        assert sorted(args['id'] for path, args in ckan.requests if path.endswith('/package_show')) == ['uuid-3', 'uuid-4']
+        assert sorted(gn.records) == ['uuid-1', 'uuid-2', 'uuid-3', 'uuid-5']
+        assert state.package_ids() == {'uuid-1', 'uuid-2', 'uuid-3', 'uuid-5'}
+        ckan.hidden.clear()
+
+        # A record marked as deleted whose Geonetwork uuid is unknown is not deleted from Geonetwork
+        ckan.packages.append(dict(ckan.package(9, "2024-02-09T00:00:00"), state='deleted'))
+        state.record('uuid-9', None, "2024-01-09T00:00:00", 'digest')
+        report = sync(ckan_client, gn_client, state, delete=True)
+        assert (report.deleted_upstream, report.deleted) == (1, 0) and report.failures == []
+        assert 'uuid-9' in state.package_ids()
+        assert not any(method == 'DELETE' for method, path, args in gn.requests if 'uuid-9' in path)
+
+        # Deleted records are not looked for when only recently modified records are searched
+        ckan.packages.pop(0)
+        report = sync(ckan_client, gn_client, state, '2024-02-01')
+        assert report.found == 2 and report.deleted_upstream == 0
+    state.close()
+
+
+def test_sync_state_failure(monkeypatch, tmp_path):
+    """
+    Tests that records whose state cannot be saved fail without stopping the sync
+    """
+    ckan = FakeCkan(6)
+    gn = FakeGeonetwork()
+    state = SyncState(str(tmp_path / 'state.db'))
+    with stub_server(ckan.respond) as ckan_url, stub_server(gn.respond) as gn_url:
+        ckan_client = CkanClient(ckan_url)
+        gn_client = GeonetworkClient(gn_url, 'user', 'pass')
+        assert sync(ckan_client, gn_client, state).inserted == 6
+
+        # All records are modified without changing their XML, but the state cannot be saved
+        for package in ckan.packages:
+            package['metadata_modified'] = "2024-03-01T00:00:00"
+
+        def record(*args):
+            raise sqlite3.OperationalError("database is locked")
+
+        monkeypatch.setattr(state, 'record', record)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(sync(ckan_client, gn_client, state, ckan_workers=1, gn_workers=1)))
+        thread.start()
+        thread.join(timeout=10)
+        assert not thread.is_alive()
+    assert [stage for package_id, stage, error in result[0].failures] == ['fetch'] * 6
+    state.close()
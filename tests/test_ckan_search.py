@@ -0,0 +1,54 @@
+import json
+
+import ckan_extract
+from ckan_extract import CkanExtractor, search_filter
+from stub_server import stub_server
+from fake_services import FakeCkan
+from helpers import title_check
+
+
+def make_params(ckan_url, i):
+    return {'name': f"Model {i}", 'bbox': {'north': -10.0, 'south': -20.0, 'east': 140.0, 'west': 130.0},
+            'model_endpath': f"model{i}", 'ckan_url': ckan_url, 'package_id': f"ds{i:06}", 'output_file': f"ckan_{i}.xml"}
+
+
+def test_search_filter():
+    assert search_filter() == '+dataset_type:*'
+    assert search_filter(['a', 'b'], '2024-01-31') == \
+        '+dataset_type:* +(id:("a" OR "b") OR name:("a" OR "b")) +metadata_modified:[2024-01-31T00:00:00Z TO *]'
+
+
+def test_ckan_search(monkeypatch, tmp_path):
+    """
+    Tests finding packages with paged searches, then searching incrementally from the last modification time
+    """
+    monkeypatch.setattr(ckan_extract, 'CKAN_SEARCH_ROWS', 2)
+    stub = FakeCkan(5)
+    state_file = str(tmp_path / 'ckan_search.json')
+    with stub_server(stub.respond) as base_url:
+        ce = CkanExtractor()
+        ce.output_dir = str(tmp_path)
+        param_list = [make_params(base_url, i) for i in range(1, 6)]
+
+        # Full search reads all three pages
+        assert ce.search(param_list, state_file=state_file) == []
+        assert sorted(args['start'] for path, args in stub.requests) == ['0', '2', '4']
+        for i in range(1, 6):
+            title_check((tmp_path / f"ckan_{i}.xml").read_text(), f"Model {i}")
+        with open(state_file) as fd:
+            assert json.load(fd)[base_url]['modified'] == "2024-01-05T10:00:00.000001"
+
+        # Package 2 changes, the next search only asks for packages modified since the last search
+        stub.packages[1] = stub.package(2, "2024-01-06T10:00:00.000001", "Model 2 revised")
+        stub.requests.clear()
+        assert ce.search(param_list, state_file=state_file) == []
+        assert len(stub.requests) == 1
+        assert 'metadata_modified:[2024-01-05T10:00:00.000001Z TO *]' in stub.requests[0][1]['fq']
+        title_check((tmp_path / "ckan_2.xml").read_text(), "Model 2 revised")
+
+        # Package that is not found is fetched with 'package_show', which fails
+        stub.requests.clear()
+        failures = ce.search(param_list + [make_params(base_url, 9)], state_file=state_file)
+        assert [params['package_id'] for params, error in failures] == ['ds000009']
+        assert 'metadata_modified' not in stub.requests[0][1]['fq']
+        assert stub.requests[-1][0].endswith('package_show')
@@ -8,6 +8,7 @@ src_path = os.path.join(os.path.abspath(os.pardir), 'src')
 sys.path.insert(0, src_path)
 
 from process import main
+from import_profile import profile_imports, parse_importtime
 
 # Basic command line parameter testing
 @pytest.mark.parametrize("cli_params, expected_out",
@@ -19,3 +20,26 @@ def test_eval(capsys, cli_params, expected_out):
         main(["process.py"] + cli_params)
     captured = capsys.readouterr()
     assert expected_out in captured.out
+
+
+# Packages that take seconds to import, '--help' must not import them
+HEAVY_PACKAGES = ['docling', 'torch', 'boto3', 'ollama', 'yake', 'pyproj', 'numpy', 'sickle', 'pygeometa']
+
+def test_help_imports():
+    """
+    Tests that '--help' does not import the extractors' heavy dependencies
+    """
+    entries = profile_imports([], ['process.py', '--help'])
+    packages = {module.split('.')[0] for module, self_secs, cumul_secs, depth in entries}
+    # The modules that '--help' needs were imported
+    assert 'summary' in packages and 'manifest' in packages
+    for heavy in HEAVY_PACKAGES:
+        assert heavy not in packages
+
+
+def test_parse_importtime():
+    output = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:      2000 |       5000 | process
+"""
+    assert parse_importtime(output) == [('_io', 0.00012, 0.00012, 1), ('process', 0.002, 0.005, 0)]
@@ -0,0 +1,57 @@
+import os
+
+import disk_cache
+from disk_cache import DiskCache, set_cache_mode, CACHE_USE, CACHE_OFF, CACHE_REFRESH
+
+
+def test_disk_cache(tmp_path):
+    """
+    Tests storing, fetching and LRU eviction in 'DiskCache'
+    """
+    cache = DiskCache(str(tmp_path / 'cache'), 10000)
+    assert cache.get('aaaa') is None
+    cache.put('aaaa', b'first value')
+    assert cache.get('aaaa') == b'first value'
+
+    # Incompressible values, so that the cache overflows
+    cache.put('bbbb', os.urandom(4000))
+    os.utime(tmp_path / 'cache' / 'bbbb.gz', (1, 1))
+    cache.put('cccc', os.urandom(4000))
+    cache.put('dddd', os.urandom(4000))
+    # Least recently used entry is evicted
+    assert cache.get('bbbb') is None
+    assert cache.get('dddd') is not None
+
+
+def test_disk_cache_modes(tmp_path, monkeypatch):
+    """
+    Tests the 'off' and 'refresh' cache modes
+    """
+    monkeypatch.setattr(disk_cache, 'cache_mode', CACHE_USE)
+    cache = DiskCache(str(tmp_path), 10000)
+    cache.put('aaaa', b'value')
+
+    set_cache_mode(CACHE_REFRESH)
+    assert cache.get('aaaa') is None
+    cache.put('aaaa', b'new value')
+
+    set_cache_mode(CACHE_OFF)
+    cache.put('bbbb', b'value')
+    set_cache_mode(CACHE_USE)
+    assert cache.get('aaaa') == b'new value'
+    assert cache.get('bbbb') is None
+
+
+def test_atomic_write_json(tmp_path):
+    """
+    Tests writing and reading JSON files, leaving no temporary files behind
+    """
+    path = str(tmp_path / 'state' / 'state.json')
+    assert disk_cache.load_json(path, {}) == {}
+    assert disk_cache.atomic_write_json(path, {'a': [1, 2]})
+    assert disk_cache.load_json(path) == {'a': [1, 2]}
+    assert os.listdir(tmp_path / 'state') == ['state.json']
+    (tmp_path / 'state' / 'state.json').write_text('{"a": ')
+    assert disk_cache.load_json(path) is None
+    # Directory cannot be created
+    assert not disk_cache.atomic_write_json(os.path.join(path, 'x.json'), {}, 'test file')
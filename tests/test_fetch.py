@@ -0,0 +1,63 @@
+import time
+import threading
+
+import fetch
+from stub_server import stub_server
+
+
+def test_prefetch(monkeypatch):
+    """
+    Tests fetching URLs concurrently with retries, then handing the responses to 'fetch()'
+    """
+    monkeypatch.setattr(fetch, 'FETCH_BACKOFF', 0.01)
+    monkeypatch.setattr(fetch, '_prefetched', {})
+    hits = {}
+    lock = threading.Lock()
+
+    def respond(method, path, headers, body):
+        with lock:
+            hits[path] = hits.get(path, 0) + 1
+            count = hits[path]
+        # First request for '/busy' fails
+        if path == '/busy' and count == 1:
+            return 503, {}, b''
+        return 200, {'Content-Type': 'application/xml'}, f"<record>{path}</record>".encode('utf-8')
+
+    with stub_server(respond) as base_url:
+        urls = [f"{base_url}/rec{i}" for i in range(10)] + [f"{base_url}/busy"]
+        fetch.prefetch(urls)
+        for url in urls:
+            response = fetch.fetch(url)
+            assert response.status_code == 200
+            assert response.text == f"<record>{url[len(base_url):]}</record>"
+        assert hits['/busy'] == 2
+        assert sum(hits.values()) == 12
+
+        # Not prefetched
+        assert fetch.fetch(base_url + '/rec0', params={'id': 'a b'}).text == "<record>/rec0?id=a+b</record>"
+
+
+def test_prefetch_per_host(monkeypatch):
+    """
+    Tests that no more than 'FETCH_MAX_PER_HOST' requests are made to a host at the same time
+    """
+    monkeypatch.setattr(fetch, 'FETCH_MAX_PER_HOST', 2)
+    monkeypatch.setattr(fetch, '_prefetched', {})
+    in_progress = [0]
+    peak = [0]
+    lock = threading.Lock()
+
+    def respond(method, path, headers, body):
+        with lock:
+            in_progress[0] += 1
+            peak[0] = max(peak[0], in_progress[0])
+        time.sleep(0.05)
+        with lock:
+            in_progress[0] -= 1
+        return 200, {}, b'<record/>'
+
+    with stub_server(respond) as base_url:
+        urls = [f"{base_url}/rec{i}" for i in range(8)]
+        fetch.prefetch(urls)
+        assert all(fetch.prefetched(url).status_code == 200 for url in urls)
+    assert peak[0] == 2
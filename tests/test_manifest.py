@@ -0,0 +1,91 @@
+import os
+import threading
+
+import fetch
+import process
+import extractor
+from extractor import Extractor
+from manifest import BuildManifest
+from stub_server import stub_server
+
+
+class FakeExtractor(Extractor):
+    """
+    Writes out the content of a URL
+    """
+    written = []
+
+    @staticmethod
+    def source_url(params: dict) -> str:
+        return params['metadata_url']
+
+    def write_record(self, name, bbox, metadata_url, output_file):
+        self.written.append(name)
+        with open(os.path.join(self.output_dir, output_file), 'w') as fd:
+            fd.write(fetch.fetch(metadata_url).text)
+        return True
+
+
+def test_incremental_build(monkeypatch, tmp_path):
+    """
+    Tests that unchanged records are skipped, using conditional requests for remote sources
+    """
+    monkeypatch.setattr(process, 'OUTPUT_DIR', str(tmp_path))
+    monkeypatch.setattr(extractor, 'OUTPUT_DIR', str(tmp_path))
+    monkeypatch.setattr(process, 'get_extractor', lambda method: FakeExtractor)
+    monkeypatch.setattr(fetch, '_prefetched', {})
+    monkeypatch.setattr(FakeExtractor, 'written', [])
+    records = {'/a': [b'<a/>', '"v1"'], '/b': [b'<b/>', None]}
+    requests = []
+    lock = threading.Lock()
+
+    def respond(method, path, headers, body):
+        content, etag = records[path]
+        with lock:
+            requests.append((path, headers.get('If-None-Match')))
+        if etag is None:
+            return 200, {}, content
+        if headers.get('If-None-Match') == etag:
+            return 304, {'ETag': etag}, b''
+        return 200, {'ETag': etag}, content
+
+    with stub_server(respond) as base_url:
+        config_val = {'method': 'FAKE', 'params': [
+            {'name': name, 'bbox': {'north': -30.0, 'south': -31.0, 'east': 140.0, 'west': 139.0},
+             'metadata_url': base_url + path, 'output_file': f"{name}.xml"} for name, path in [('a', '/a'), ('b', '/b')]]}
+
+        def build(force=False):
+            manifest = BuildManifest(str(tmp_path / 'manifest.json'))
+            process.prefetch_config([config_val], manifest, force)
+            assert process.convert(FakeExtractor, config_val['params'], manifest=manifest, force=force) == []
+            written = list(FakeExtractor.written)
+            FakeExtractor.written.clear()
+            return written
+
+        # First build writes everything
+        assert build() == ['a', 'b']
+        assert (tmp_path / 'a.xml').read_text() == '<a/>'
+
+        # Nothing has changed, 'a' is not modified and 'b' has the same content hash
+        requests.clear()
+        assert build() == []
+        assert ('/a', '"v1"') in requests
+
+        # Source changes
+        records['/a'] = [b'<a2/>', '"v2"']
+        records['/b'] = [b'<b2/>', None]
+        assert build() == ['a', 'b']
+        assert (tmp_path / 'a.xml').read_text() == '<a2/>'
+
+        # Bounding box changes, source is not modified so it is fetched again
+        config_val['params'][0]['bbox']['north'] = -29.0
+        (tmp_path / 'a.xml').write_text('')
+        assert build() == ['a']
+        assert (tmp_path / 'a.xml').read_text() == '<a2/>'
+
+        # Deleted output file is rebuilt
+        os.remove(tmp_path / 'b.xml')
+        assert build() == ['b']
+
+        # Force rebuilds everything
+        assert build(force=True) == ['a', 'b']
@@ -0,0 +1,86 @@
+import json
+from pathlib import Path
+
+import pytest
+
+import model_info
+from model_info import get_model_info
+
+
+def write_model(src_dir, filename, name, crs, extent):
+    with open(src_dir / filename, 'w') as fd:
+        json.dump({'properties': {'name': name, 'crs': crs, 'extent': extent}}, fd)
+
+
+@pytest.fixture
+def geomodels(monkeypatch, tmp_path):
+    """
+    Makes a geomodels directory with two model files and a provider file
+    """
+    src_dir = tmp_path / 'geomodels'
+    src_dir.mkdir()
+    write_model(src_dir, 'Otway.json', 'Otway Basin', 'EPSG:28354', [500000, 600000, 5700000, 5800000])
+    write_model(src_dir, 'Burra.json', 'Burra', 'EPSG:28354', [300000, 320000, 6260000, 6280000])
+    with open(src_dir / 'ProviderModelInfo.json', 'w') as fd:
+        json.dump({'vic': {}}, fd)
+    monkeypatch.setattr(model_info, '_model_info', {})
+    monkeypatch.setattr(model_info, '_transformers', {})
+    return str(src_dir), str(tmp_path / 'model_info.json')
+
+
+def test_model_info(geomodels):
+    """
+    Tests that bounding boxes are calculated and only for the models asked for
+    """
+    src_dir, cache_file = geomodels
+    bboxes = get_model_info(['Otway Basin'], src_dir, cache_file)
+    assert list(bboxes) == ['Otway Basin']
+    otway = bboxes['Otway Basin']
+    assert otway['south'] == pytest.approx(-38.85, abs=0.01)
+    assert otway['west'] == pytest.approx(141.0, abs=0.01)
+    assert otway['south'] < otway['north'] and otway['west'] < otway['east']
+    with open(cache_file) as fd:
+        files = json.load(fd)['files']
+    assert files['Otway.json']['bbox'] == otway
+    assert files['Burra.json']['bbox'] is None
+    assert 'ProviderModelInfo.json' not in files
+
+    # All models
+    assert set(get_model_info(None, src_dir, cache_file)) == {'Otway Basin', 'Burra'}
+
+
+def test_model_info_cache(geomodels, monkeypatch):
+    """
+    Tests that cached bounding boxes are reused until the model file changes
+    """
+    src_dir, cache_file = geomodels
+    first = get_model_info(['Otway Basin', 'Burra'], src_dir, cache_file)
+
+    # Next run uses the cache file and does not transform anything
+    transformed = []
+    model_bboxes = model_info.model_bboxes
+    monkeypatch.setattr(model_info, 'model_bboxes', lambda crs, extents: transformed.extend(extents) or model_bboxes(crs, extents))
+    monkeypatch.setattr(model_info, '_model_info', {})
+    assert get_model_info(['Otway Basin', 'Burra'], src_dir, cache_file) == first
+    assert transformed == []
+
+    # Changed file is read again
+    monkeypatch.setattr(model_info, '_model_info', {})
+    write_model(Path(src_dir), 'Burra.json', 'Burra', 'EPSG:28354', [300000, 340000, 6260000, 6300000])
+    burra = get_model_info(['Burra'], src_dir, cache_file)['Burra']
+    assert transformed == [[300000, 340000, 6260000, 6300000]]
+    assert burra['north'] > first['Burra']['north']
+    assert burra['east'] > first['Burra']['east']
+
+
+def test_model_bboxes():
+    """
+    Tests that the bounding box encloses the curved edges of a wide extent, not just its corners
+    """
+    extents = [[300000, 700000, 5700000, 5800000], [500000, 600000, 5700000, 5800000]]
+    wide, narrow = model_info.model_bboxes('EPSG:28354', extents)
+    # Corners of wide extent are at about -38.83 degrees, its southern edge reaches -38.85 at the central meridian
+    assert wide['south'] == pytest.approx(-38.849, abs=0.001)
+    assert wide['west'] == pytest.approx(138.696, abs=0.001)
+    assert wide['east'] == pytest.approx(143.304, abs=0.001)
+    assert narrow == model_info.model_bboxes('EPSG:28354', extents[1:])[0]
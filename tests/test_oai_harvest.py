@@ -0,0 +1,155 @@
+import json
+import time
+import threading
+from urllib.parse import urlparse, parse_qs
+
+import oai_extract
+from oai_extract import OaiExtractor
+from stub_server import stub_server
+from helpers import title_check
+
+OAI_HEAD = """<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+<responseDate>2024-02-01T00:00:00Z</responseDate>
+<request>http://localhost/oai</request>
+"""
+
+DC_RECORD = """<record><header><identifier>{id}</identifier><datestamp>{datestamp}</datestamp></header>
+<metadata><oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/" xmlns:dc="http://purl.org/dc/elements/1.1/">
+<dc:title>{title}</dc:title>
+<dc:description>A 3D model</dc:description>
+<dc:date>2020-01-01</dc:date><dc:date>2020-02-01</dc:date>
+<dc:subject>Geology</dc:subject>
+<dc:rights>CC BY 4.0</dc:rights>
+<dc:publisher>Test Survey</dc:publisher>
+<dc:type>Dataset</dc:type>
+<dc:relation>a</dc:relation><dc:relation>b</dc:relation><dc:relation>2020-03-01</dc:relation>
+<dc:identifier>{id}</dc:identifier><dc:identifier>x</dc:identifier><dc:identifier>y</dc:identifier>
+<dc:identifier>https://example.org/{id}</dc:identifier>
+</oai_dc:dc></metadata></record>
+"""
+
+DELETED_RECORD = """<record><header status="deleted"><identifier>{id}</identifier><datestamp>{datestamp}</datestamp></header></record>
+"""
+
+# Number of records in each 'ListRecords' page
+PAGE_SIZE = 2
+
+
+class OaiStub:
+    """
+    A small OAI-PMH service, records are kept in datestamp order
+    """
+    def __init__(self):
+        self.records = [{'id': f"oai:test:{i}", 'datestamp': f"2024-01-0{i}", 'title': f"Model {i}", 'deleted': i == 3}
+                        for i in range(1, 6)]
+        self.requests = []
+
+    def respond(self, method, path, headers, body):
+        args = {key: val[0] for key, val in parse_qs(urlparse(path).query).items()}
+        self.requests.append(args)
+        if args['verb'] == 'GetRecord':
+            for rec in self.records:
+                if rec['id'] == args['identifier'] and not rec['deleted']:
+                    return 200, {'Content-Type': 'text/xml'}, (OAI_HEAD + '<GetRecord>' + DC_RECORD.format(**rec) + '</GetRecord></OAI-PMH>').encode()
+            return 200, {'Content-Type': 'text/xml'}, (OAI_HEAD + '<error code="idDoesNotExist">No such id</error></OAI-PMH>').encode()
+        if 'resumptionToken' in args:
+            from_date, start = args['resumptionToken'].split('|')
+            start = int(start)
+        else:
+            from_date, start = args.get('from', ''), 0
+        matches = [rec for rec in self.records if rec['datestamp'] >= from_date]
+        if len(matches) == 0:
+            return 200, {'Content-Type': 'text/xml'}, (OAI_HEAD + '<error code="noRecordsMatch">None</error></OAI-PMH>').encode()
+        page = matches[start:start + PAGE_SIZE]
+        xml = OAI_HEAD + '<ListRecords>'
+        for rec in page:
+            xml += (DELETED_RECORD if rec['deleted'] else DC_RECORD).format(**rec)
+        token = f"{from_date}|{start + PAGE_SIZE}" if start + PAGE_SIZE < len(matches) else ''
+        xml += f'<resumptionToken completeListSize="{len(matches)}">{token}</resumptionToken></ListRecords></OAI-PMH>'
+        return 200, {'Content-Type': 'text/xml'}, xml.encode()
+
+
+def make_params(oai_id):
+    name = oai_id.split(':')[-1]
+    return {'name': name, 'bbox': {'north': -10.0, 'south': -20.0, 'east': 140.0, 'west': 130.0},
+            'model_endpath': f"model{name}", 'oai_id': oai_id, 'oai_prefix': 'oai_dc',
+            'service_name': "Test OAI", 'output_file': f"oai_{name}.xml"}
+
+
+def test_oai_harvest(tmp_path):
+    """
+    Tests harvesting with resumption tokens, then harvesting incrementally from the last datestamp
+    """
+    stub = OaiStub()
+    state_file = str(tmp_path / 'oai_harvest.json')
+    with stub_server(stub.respond) as base_url:
+        oe = OaiExtractor(base_url + '/oai')
+        oe.output_dir = str(tmp_path)
+        param_list = [make_params('oai:test:2'), make_params('oai:test:5')]
+
+        # Full harvest reads all three pages
+        assert oe.harvest(param_list, state_file=state_file) == []
+        assert [req.get('resumptionToken') for req in stub.requests] == [None, '|2', '|4']
+        title_check((tmp_path / 'oai_2.xml').read_text(), "Model 2")
+        title_check((tmp_path / 'oai_5.xml').read_text(), "Model 5")
+        with open(state_file) as fd:
+            assert json.load(fd)[f"{base_url}/oai oai_dc "] == {'datestamp': '2024-01-05', 'ids': ['oai:test:2', 'oai:test:5']}
+
+        # Record 2 changes, the next harvest only asks for records changed since the last harvest
+        stub.records.append(dict(stub.records.pop(1), datestamp='2024-01-06', title="Model 2 revised"))
+        stub.requests.clear()
+        assert oe.harvest(param_list, state_file=state_file) == []
+        assert stub.requests == [{'verb': 'ListRecords', 'metadataPrefix': 'oai_dc', 'from': '2024-01-05'}]
+        title_check((tmp_path / 'oai_2.xml').read_text(), "Model 2 revised")
+
+        # Nothing has changed
+        stub.records[-1]['datestamp'] = '2024-01-05'
+        with open(state_file, 'w') as fd:
+            json.dump({f"{base_url}/oai oai_dc ": {'datestamp': '2024-01-07', 'ids': ['oai:test:2', 'oai:test:5']}}, fd)
+        assert oe.harvest(param_list, state_file=state_file) == []
+
+        # Record that is not in the service is fetched with 'GetRecord', which fails
+        stub.requests.clear()
+        failures = oe.harvest(param_list + [make_params('oai:test:9')], state_file=state_file)
+        assert [params['oai_id'] for params, error in failures] == ['oai:test:9']
+        assert 'from' not in stub.requests[0]
+        assert stub.requests[-1]['verb'] == 'GetRecord'
+
+
+def test_get_record_concurrent(monkeypatch, tmp_path):
+    """
+    Tests fetching records concurrently through one client, retrying when the service is busy
+    """
+    monkeypatch.setattr(oai_extract, 'OAI_MAX_CONCURRENCY', 2)
+    stub = OaiStub()
+    lock = threading.Lock()
+    in_progress = []
+    peak = []
+    busy = set()
+
+    def respond(method, path, headers, body):
+        args = parse_qs(urlparse(path).query)
+        oai_id = args['identifier'][0]
+        with lock:
+            in_progress.append(oai_id)
+            peak.append(len(in_progress))
+        time.sleep(0.05)
+        with lock:
+            in_progress.remove(oai_id)
+            # First request for each record is refused
+            if oai_id not in busy:
+                busy.add(oai_id)
+                return 503, {'Retry-After': '0'}, b''
+        return stub.respond(method, path, headers, body)
+
+    with stub_server(respond) as base_url:
+        oe = OaiExtractor(base_url + '/oai')
+        oe.output_dir = str(tmp_path)
+        param_list = [make_params(f"oai:test:{i}") for i in [1, 2, 4, 5]]
+        assert oe.write_records(param_list) == []
+        assert oai_extract.get_client(base_url + '/oai') is oai_extract.get_client(base_url + '/oai')
+    assert len(stub.requests) == 4 and len(peak) == 8
+    assert max(peak) <= 2
+    for i in [1, 2, 4, 5]:
+        title_check((tmp_path / f"oai_{i}.xml").read_text(), f"Model {i}")
@@ -1,6 +1,70 @@
+import os
+
+import process
+import pdf_extract
+import ollama_summary
+from manifest import inputs_hash
 from pdf_extract import PDFExtractor
+from pdf_helper import DocumentCache
+from helpers import title_check
 
 def test_pdf():
     pe = PDFExtractor()
     # Test missing PDF file
     assert not pe.write_record("Blah Blah", "blah", "blah.pdf", "https://blah.org/blah.pdf", "test org", "test title", {'north': -15.0, 'south': -40.4, 'east': 120.5, 'west': 100.3}, "pdf_test.xml")
+
+
+def fake_extract_text_keywords(pdf_file):
+    return f"text of {pdf_file}", {'geology', 'basins'}
+
+
+def test_pdf_parallel(monkeypatch, tmp_path):
+    DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+    monkeypatch.setattr(pdf_extract, 'extract_text_keywords', fake_extract_text_keywords)
+    monkeypatch.setattr(pdf_extract, 'get_summary', lambda pdf_text, pdf_file, summariser: f"Summary of {pdf_text}")
+    pe = PDFExtractor(DocumentCache())
+    pe.output_dir = str(tmp_path)
+    bbox = {'north': -15.0, 'south': -40.4, 'east': 120.5, 'west': 100.3}
+    param_list = []
+    for name, pdf_file in [("Otway", 'reports/vic/G107513_OtwayBasin_3D_notes.pdf'), ("Missing", 'blah.pdf'), ("Burra", 'reports/sa/Burra.pdf')]:
+        param_list.append({'name': name, 'model_endpath': name.lower(), 'pdf_file': os.path.join(DATA_DIR, pdf_file),
+                           'pdf_url': f"https://blah.org/{name}.pdf", 'organisation': "test org", 'title': f"{name} title",
+                           'bbox': bbox, 'output_file': f"{name.lower()}_pdf.xml"})
+    failures = pe.write_records(param_list, jobs=2)
+    # Missing PDF file is reported, the other records are written
+    assert [params['name'] for params, error in failures] == ["Missing"]
+    for name in ["otway", "burra"]:
+        with open(tmp_path / f"{name}_pdf.xml") as fd:
+            xml_str = fd.read()
+        title_check(xml_str, f"{name.capitalize()} title")
+
+
+def test_unknown_summariser(monkeypatch):
+    """
+    Tests that a provider group with an unknown summariser fails its records without stopping the run
+    """
+    monkeypatch.setattr(process, 'get_model_info', lambda names: {name: {'north': -15.0, 'south': -40.4, 'east': 120.5, 'west': 100.3}
+                                                                   for name in names})
+    config_val = {'method': 'PDF', 'summariser': 'blah', 'params': [{'name': "Otway", 'pdf_file': 'blah.pdf'}]}
+    failures = process.process_config(config_val)
+    assert [(params['name'], error.startswith("Unknown summariser 'blah'")) for params, error in failures] == [("Otway", True)]
+
+
+def test_input_settings(monkeypatch, tmp_path):
+    """
+    Tests that the summariser's settings and the thesaurus DB are inputs of PDF records in the build manifest
+    """
+    db_file = tmp_path / 'thesauri.db'
+    db_file.write_bytes(b'v1')
+    monkeypatch.setattr(pdf_extract, 'THESAURUS_DB', str(db_file))
+
+    def digest(**kwargs):
+        return inputs_hash('PDFExtractor', {}, kwargs, {}, PDFExtractor.input_settings(kwargs))
+
+    first = digest(summariser='ollama')
+    assert digest(summariser='ollama') == first
+    monkeypatch.setattr(ollama_summary, 'PROMPT', "A different prompt")
+    second = digest(summariser='ollama')
+    assert second != first
+    db_file.write_bytes(b'version 2')
+    assert digest(summariser='ollama') != second
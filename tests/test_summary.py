@@ -0,0 +1,80 @@
+import sys
+import time
+import types
+import threading
+
+import pytest
+
+import summary
+from summary import map_reduce_summary, count_tokens
+
+
+def test_map_reduce_summary():
+    """
+    Tests that long text is summarised in chunks and then the chunk summaries are summarised
+    """
+    sections = [f"# Section {i}\n\n" + f"Sentence number {i} about the geology. " * 20 for i in range(10)]
+    text = '\n\n'.join(sections)
+    prompts = []
+    lock = threading.Lock()
+
+    def summarise_all(chunks):
+        with lock:
+            prompts.extend(chunks)
+        return [f"summary of {len(chunk)} chars" for chunk in chunks]
+
+    result = map_reduce_summary(text, summarise_all, chunk_tokens=300)
+    # Each chunk fits within the limit and the final prompt is the chunk summaries
+    assert all(count_tokens(prompt) <= 300 for prompt in prompts)
+    assert len(prompts) > 2
+    assert prompts[-1].startswith("summary of ")
+    assert result.startswith("summary of ")
+
+    # Short text is summarised in one prompt
+    prompts.clear()
+    assert map_reduce_summary("Short text", summarise_all, chunk_tokens=300) == "summary of 10 chars"
+    assert prompts == ["Short text"]
+
+
+def test_summariser_registry(monkeypatch):
+    """
+    Tests that a backend is imported upon first use and its concurrency limit is shared by all records
+    """
+    in_progress = []
+    peak = []
+    lock = threading.Lock()
+
+    def summarise(text):
+        with lock:
+            in_progress.append(text)
+            peak.append(len(in_progress))
+        time.sleep(0.02)
+        with lock:
+            in_progress.remove(text)
+        return f"summary of {text}"
+
+    backend = types.ModuleType('fake_summary')
+    backend.MAX_CONCURRENCY = 2
+    backend.BATCH_SIZE = 4
+    backend.ATTRIBUTION = "Fake: "
+    backend.summarise = summarise
+    backend.cache_settings = lambda: {'model': 'fake'}
+    monkeypatch.setitem(sys.modules, 'fake_summary', backend)
+    monkeypatch.setitem(summary.SUMMARISERS, 'fake', 'fake_summary')
+    monkeypatch.setattr(summary, 'SUMMARY_STREAM', False)
+    monkeypatch.setattr(summary, '_summarisers', {})
+    monkeypatch.setattr(summary, '_summariser_slots', {})
+
+    assert summary.get_summariser('fake') is backend
+    with pytest.raises(ValueError):
+        summary.get_summariser('unknown')
+    texts = [f"text {i}" for i in range(12)]
+    # Two records summarised at the same time
+    records = [threading.Thread(target=summary.summarise_texts, args=('fake', texts, rec)) for rec in ('a', 'b')]
+    for thread in records:
+        thread.start()
+    for thread in records:
+        thread.join()
+    assert len(peak) == 24 and max(peak) <= 2
+    assert summary.summarise_texts('fake', ["one", "two"]) == ["summary of one", "summary of two"]
+    assert summary.summary_cache_key("text", 'fake') != summary.summary_cache_key("text", 'ollama')
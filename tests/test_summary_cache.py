@@ -0,0 +1,49 @@
+import time
+
+import disk_cache
+import summary
+from summary_cache import SummaryCache
+
+
+def test_summary_cache(monkeypatch, tmp_path):
+    """
+    Tests cache hits and misses, expiry and eviction
+    """
+    cache = SummaryCache(str(tmp_path / 'summaries.sqlite'), ttl_secs=60, max_bytes=10)
+    assert cache.get('a') is None
+    cache.put('a', '12345')
+    assert cache.get('a') == '12345'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Least recently used entry is evicted when the cache is too large
+    cache.put('b', '67890')
+    assert cache.get('a') == '12345'
+    cache.put('c', 'abcde')
+    assert cache.get('b') is None
+    assert cache.get('a') == '12345'
+    assert cache.get('c') == 'abcde'
+
+    # Expired entries are not used
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 120)
+    assert cache.get('a') is None
+
+    # Cache can be turned off
+    monkeypatch.setattr(disk_cache, 'cache_mode', disk_cache.CACHE_OFF)
+    cache.put('d', 'fghij')
+    assert cache.get('d') is None
+
+
+def test_get_summary_cached(monkeypatch, tmp_path):
+    """
+    Tests that identical text is only summarised once
+    """
+    monkeypatch.setattr(summary, 'SUMMARY_CACHE', SummaryCache(str(tmp_path / 'summaries.sqlite'), 60, 1000))
+    monkeypatch.setattr(summary, 'SUMMARISER', 'ollama')
+    calls = []
+    monkeypatch.setattr(summary, 'map_reduce_summary', lambda text, summarise_all: calls.append(text) or f"summary of {text}")
+    assert summary.get_summary("some text") == "summary of some text"
+    assert summary.get_summary("some text") == "summary of some text"
+    assert summary.get_summary("other text") == "summary of other text"
+    assert calls == ["some text", "other text"]
+    assert summary.summary_cache_key("some text") != summary.summary_cache_key("other text")
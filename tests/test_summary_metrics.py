@@ -0,0 +1,53 @@
+import time
+
+import ollama
+
+import summary
+from summary_metrics import SummaryMetrics
+
+
+def test_stream_metrics():
+    """
+    Tests timing a stream of text chunks
+    """
+    def chunks(usage):
+        time.sleep(0.05)
+        yield "The "
+        time.sleep(0.05)
+        yield "summary"
+        usage['output_tokens'] = 2
+
+    metrics = SummaryMetrics()
+    usage = {}
+    assert metrics.stream('test', 'rec.pdf', chunks(usage), usage, lambda text: 100) == "The summary"
+    req = metrics.requests[0]
+    assert 0.05 <= req['ttft'] < req['latency']
+    assert req['output_tokens'] == 2 and not req['estimated']
+
+    # Token count is estimated when the backend does not report it
+    assert metrics.stream('test', 'rec.pdf', iter(["abc"]), {}, lambda text: 100) == "abc"
+    assert metrics.requests[1]['output_tokens'] == 100 and metrics.requests[1]['estimated']
+
+    stats = metrics.summarise(metrics.requests)
+    assert stats['requests'] == 2 and stats['output_tokens'] == 102 and stats['tokens_per_sec'] > 0
+
+
+def test_ollama_stream(monkeypatch, capsys):
+    """
+    Tests streaming an ollama summary through the common interface
+    """
+    def chat(model, messages, stream):
+        assert stream
+        return iter([{'message': {'content': "Geology "}, 'done': False},
+                     {'message': {'content': "summary"}, 'done': False},
+                     {'message': {'content': ""}, 'done': True, 'eval_count': 7}])
+
+    monkeypatch.setattr(ollama, 'chat', chat)
+    monkeypatch.setattr(summary, 'SUMMARY_METRICS', SummaryMetrics())
+    monkeypatch.setattr(summary, 'SUMMARY_STREAM', True)
+    assert summary.summarise_text('ollama', "Some text", 'otway.pdf') == "Geology summary"
+    assert summary.SUMMARY_METRICS.requests[0]['output_tokens'] == 7
+    summary.SUMMARY_METRICS.report()
+    out = capsys.readouterr().out
+    assert "ollama otway.pdf: 1 request(s)" in out
+    assert "ollama all records: 1 request(s)" in out
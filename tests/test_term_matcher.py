@@ -0,0 +1,25 @@
+from term_matcher import TermMatcher
+from keywords import run_usgs, phrase_in_dict, rank_keywords
+
+
+def test_find():
+    """
+    Tests finding multi-word terms, longest match first, case insensitive
+    """
+    matcher = TermMatcher(['sedimentary basins', 'sedimentary rocks', 'basins', 'Precambrian', 'granite'])
+    text = "The Precambrian granite,\nlies below Sedimentary  Basins and\nbasins."
+    assert matcher.find(text) == [('Precambrian', 4, 15), ('granite', 16, 23), ('sedimentary basins', 36, 55), ('basins', 60, 66)]
+    assert matcher.count(text) == {'Precambrian': 1, 'granite': 1, 'sedimentary basins': 1, 'basins': 1}
+    assert matcher.find("sedimentary") == []
+
+
+def test_usgs_lookup():
+    """
+    Tests keyword lookup of multi-word terms and ranking of keywords
+    """
+    kw_dict = {'sedimentary basins': 'geologic structures', 'faults': 'geologic structures', 'granite': 'rocks'}
+    text = "Granite is cut by faults, faults and more faults in the sedimentary basins"
+    assert run_usgs(kw_dict, text) == {'geologic structures', 'rocks'}
+    assert phrase_in_dict("large sedimentary basins", kw_dict) == (True, 'geologic structures')
+    assert phrase_in_dict("sedimentary", kw_dict) == (False, '')
+    assert rank_keywords({'rocks', 'geologic structures', 'other'}, kw_dict, text, TermMatcher(kw_dict)) == ['geologic structures', 'rocks', 'other']
@@ -0,0 +1,75 @@
+import keywords
+from keywords import split_sections, limit_tokens, pack_sections, extract_yake_keywords
+
+MARKDOWN = """# Otway Basin
+
+The Otway Basin is a sedimentary basin.
+
+| Unit | Age |
+|------|-----|
+| Sherbrook | Cretaceous |
+
+## 1. Geology
+
+Faults and folds in the basement.
+
+## References
+
+Smith, J. 2001. Some paper.
+
+### Older references
+
+Jones, K. 1990. Another paper.
+
+## Conclusions
+
+Granite intrusions."""
+
+
+def test_split_sections():
+    """
+    Tests that tables and reference sections are left out
+    """
+    assert split_sections(MARKDOWN) == ["Otway Basin\n\nThe Otway Basin is a sedimentary basin.",
+                                        "1. Geology\n\nFaults and folds in the basement.",
+                                        "Conclusions\n\nGranite intrusions."]
+
+
+def test_token_budget():
+    """
+    Tests limiting the number of words and packing sections into chunks
+    """
+    sections = ["a b c", "d e f g", "h i"]
+    assert limit_tokens(sections, 5) == ["a b c", "d e"]
+    assert limit_tokens(sections, 100) == sections
+    assert pack_sections(sections, 7) == ["a b c\n\nd e f g", "h i"]
+    assert pack_sections(sections, 2) == sections
+
+
+def test_extract_yake_keywords(monkeypatch):
+    """
+    Tests merging yake's results from each chunk, keeping the best score
+    """
+    results = {"alpha": [('granite', 0.5), ('basin', 0.1)], "beta": [('granite', 0.2), ('fault', 0.3)]}
+    monkeypatch.setattr(keywords, 'YAKE_BY_SECTION', True)
+    monkeypatch.setattr(keywords, 'YAKE_CHUNK_TOKENS', 1)
+    monkeypatch.setattr(keywords, 'extract_chunk_keywords', lambda chunk: results[chunk.strip()])
+    assert extract_yake_keywords("# alpha\n# beta\n") == [('basin', 0.1), ('granite', 0.2), ('fault', 0.3)]
+
+
+def test_yake_pool(monkeypatch):
+    """
+    Tests that one pool of processes is shared by all records and gives the same keywords as running yake serially
+    """
+    monkeypatch.setattr(keywords, 'YAKE_BY_SECTION', True)
+    monkeypatch.setattr(keywords, 'YAKE_CHUNK_TOKENS', 1)
+    text = "# Granite\n\nGranite intrusions in the basement.\n\n# Faults\n\nFaults and folds in the Otway Basin."
+    assert keywords.get_yake_pool(1) is None
+    try:
+        pool = keywords.get_yake_pool(2)
+        assert keywords.get_yake_pool(2) is pool
+        assert extract_yake_keywords(text, workers=2) == extract_yake_keywords(text, workers=1)
+        assert keywords.get_yake_pool(2) is pool
+    finally:
+        keywords.shutdown_yake_pool()
+    assert keywords._yake_pool is None
@@ -1,15 +1,24 @@
 import requests
 import xml.etree.ElementTree as etree
+from lxml import etree as lxml_etree
 from pathlib import Path
 import os
+import sqlite3
+from contextlib import closing
 
 from add_coords import add_coords
 from add_links import add_model_link
 from add_model_keyw import add_models_keyword
+from enrich import enrich, keyword_stage, coords_stage, write_xml
+from ISO19115_3_extract import upgrade_header, OLD_HEADER, NEW_HEADER
+from bench_keywords import build_keyword_lookup_old, make_vocab
 from helpers import ns_19115_3, ns_19139, get_metadata, make_xpath
+import keywords
 from keywords import extract_db_terms, run_yake
-from pdf_helper import parse_docling
+import pdf_helper
+from pdf_helper import parse_docling, DocumentCache
 from local_types import Coords
+from disk_cache import DiskCache
 
 ISO19139_URL = "http://52.65.91.200/geonetwork/srv/api/records/97ed8560c193e0c1855445cec4e812d4c59654ff/formatters/xml"
 ISO19115_3_URL = "https://catalog.sarig.sa.gov.au/geonetwork/srv/api/records/9c6ae754-291d-4100-afd9-478c3a9ddf42/formatters/xml"
@@ -96,3 +105,141 @@ def test_keywords():
     keywords = run_yake(kw_dict, text)
     assert 'topography' in keywords
     assert 'Precambrian' in keywords
+
+def test_doc_cache(monkeypatch):
+    """
+    Tests that 'DocumentCache' only parses each PDF file once
+    """
+    calls = []
+    def fake_parse(pdf_file):
+        calls.append(pdf_file)
+        return f"text of {pdf_file}"
+    monkeypatch.setattr(pdf_helper, 'parse_docling', fake_parse)
+    cache = DocumentCache()
+    pdf_file = os.path.join(DATA_DIR, 'reports/vic/G107513_OtwayBasin_3D_notes.pdf')
+    assert cache.get_text(pdf_file) == f"text of {pdf_file}"
+    assert cache.get_text(pdf_file) == f"text of {pdf_file}"
+    assert len(calls) == 1
+
+
+def test_shared_converter(monkeypatch, tmp_path):
+    """
+    Tests that the docling converter is created once and shared by all conversions
+    """
+    class FakeDoc:
+        def export_to_markdown(self):
+            return "# Report"
+
+    class FakeResult:
+        document = FakeDoc()
+
+    class FakeConverter:
+        def initialize_pipeline(self, fmt):
+            pass
+
+        def convert(self, pdf_file):
+            return FakeResult()
+
+    created = []
+    def fake_make_converter():
+        created.append(FakeConverter())
+        return created[-1]
+    monkeypatch.setattr(pdf_helper, 'make_converter', fake_make_converter)
+    monkeypatch.setattr(pdf_helper, 'DOCLING_CACHE', DiskCache(str(tmp_path), 10000000))
+    pdf_helper.warm_up_converter()
+    for pdf_file in ['reports/vic/G107513_OtwayBasin_3D_notes.pdf', 'reports/sa/Burra.pdf']:
+        assert parse_docling(os.path.join(DATA_DIR, pdf_file)) == "# Report"
+    assert len(created) == 1
+    assert len(pdf_helper.CONVERTER_STATS['documents']) == 2
+    pdf_helper.shutdown_converter()
+    assert pdf_helper.CONVERTER_STATS['documents'] == []
+
+def test_enrich(tmp_path):
+    """
+    Tests that the in-memory enrichment pipeline gives the same result as the text based functions
+    """
+    coords: Coords = {'north': '-10.0', 'south': '-20.0', 'east': '-30.0', 'west': '-40.0'}
+    with open(Path(__file__).parent / 'westgawler_19115-3-orig.xml') as fd:
+        text = fd.read()
+    expected = add_coords(coords, add_models_keyword(text, 'utf-8', 'ISO19115-3'), 'utf-8', 'ISO19115-3')
+
+    root = lxml_etree.fromstring(bytes(text, 'utf-8'))
+    root = enrich(root, [keyword_stage('ISO19115-3'), coords_stage(coords, 'ISO19115-3')])
+    write_xml(root, tmp_path / 'out.xml')
+    assert (tmp_path / 'out.xml').read_text() == expected
+
+def test_upgrade_header():
+    """
+    Tests that the old ISO 19115-3 header is replaced
+    """
+    with open(Path(__file__).parent / 'westgawler_19115-3-orig.xml') as fd:
+        text = fd.read()
+    assert text.startswith(NEW_HEADER)
+    new_root = lxml_etree.fromstring(bytes(text, 'utf-8'))
+    assert upgrade_header(new_root) is new_root
+
+    old_root = lxml_etree.fromstring(bytes(text.replace(NEW_HEADER, OLD_HEADER), 'utf-8'))
+    assert lxml_etree.tostring(upgrade_header(old_root), encoding='unicode') == lxml_etree.tostring(new_root, encoding='unicode')
+
+    # Attributes in the old namespaces are upgraded too, keeping their order
+    text = text.replace('<mdb:metadataIdentifier>', '<mdb:metadataIdentifier cit:role="a" xlink:href="b">', 1)
+    new_root = lxml_etree.fromstring(bytes(text, 'utf-8'))
+    old_root = lxml_etree.fromstring(bytes(text.replace(NEW_HEADER, OLD_HEADER), 'utf-8'))
+    assert lxml_etree.tostring(upgrade_header(old_root), encoding='unicode') == lxml_etree.tostring(new_root, encoding='unicode')
+
+def test_db_terms_cache(monkeypatch, tmp_path):
+    """
+    Tests that the USGS thesaurus lookup table is built once and rebuilt when the DB changes
+    """
+    db_file = str(tmp_path / 'thesauri.db')
+    rows = [(1, 'root', None), (2, 'earth sciences', 1), (3, 'geology', 2), (4, 'structural geology', 3), (5, 'faults', 4)]
+    with closing(sqlite3.connect(db_file)) as con:
+        con.execute("CREATE TABLE term (code integer not NULL, name varchar(128), parent integer, scope varchar(1024))")
+        con.executemany("INSERT INTO term (code, name, parent) VALUES (?, ?, ?)", rows)
+        con.commit()
+    monkeypatch.setattr(keywords, 'THESAURUS_DB', db_file)
+    monkeypatch.setattr(keywords, 'TERMS_CACHE_FILE', str(tmp_path / 'cache' / 'usgs_terms.pickle'))
+    monkeypatch.setattr(keywords, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(keywords, '_kw_lookup', None)
+    calls = []
+    extract = keywords.extract_db_terms
+    monkeypatch.setattr(keywords, 'extract_db_terms', lambda: calls.append(1) or extract())
+
+    assert keywords.get_db_terms() == {'faults': 'structural geology'}
+    assert keywords.get_db_terms() is keywords.get_db_terms()
+    assert os.path.isfile(keywords.TERMS_CACHE_FILE)
+
+    # New process uses the pickled lookup table
+    monkeypatch.setattr(keywords, '_kw_lookup', None)
+    assert keywords.get_db_terms() == {'faults': 'structural geology'}
+    assert len(calls) == 1
+
+    # Changing the DB rebuilds it
+    with closing(sqlite3.connect(db_file)) as con:
+        con.execute("INSERT INTO term (code, name, parent) VALUES (6, 'folds', 4)")
+        con.commit()
+    monkeypatch.setattr(keywords, '_kw_lookup', None)
+    assert keywords.get_db_terms() == {'faults': 'structural geology', 'folds': 'structural geology'}
+    assert len(calls) == 2
+
+def test_build_keyword_lookup():
+    """
+    Tests that the USGS vocab hierarchy is resolved the same way as the previous version
+    """
+    for max_depth, spread in ((10, 0), (30, 5)):
+        link_dict, name_dict = make_vocab(2000, max_depth, spread)
+        assert keywords.build_keyword_lookup(link_dict, name_dict) == build_keyword_lookup_old(link_dict, name_dict)
+
+def test_resolve_categories_errors():
+    """
+    Tests that cycles and missing parents in the USGS vocab hierarchy are reported
+    """
+    link_dict = {2: 1, 3: 2, 4: 3, 5: 4,
+                 # 6 -> 7 -> 8 -> 6 is a cycle, 9 is below it
+                 6: 8, 7: 6, 8: 7, 9: 6,
+                 # 99 does not exist
+                 10: 99, 11: 10}
+    categories, cycles, orphans = keywords.resolve_categories(link_dict)
+    assert categories == {2: None, 3: None, 4: 4, 5: 4, 6: None, 7: None, 8: None, 9: None, 10: None, 11: None}
+    assert cycles == {6, 7, 8}
+    assert orphans == {99}